@@ -0,0 +1,93 @@
+'''
+Import-time benchmark for the utils modules.
+
+Every module is imported in a fresh Python process (best of several runs) and two things are
+checked:
+    1.) none of the heavy dependencies (torch, torchvision, matplotlib, scikit-image, scipy,
+        tifffile) are loaded by the import alone, they must only be imported inside the code paths
+        that use them
+    2.) the import takes less than the time budget
+
+Exits with status 1 if either check fails, so it can be run as a regression guard.
+
+Usage (from the repository root)
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget 0.5 --repeat 10
+'''
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    'utils.BinarizeUtils',
+    'utils.FrameUtils',
+    'utils.HysteresisUtils',
+    'utils.TiledUtils',
+    'utils.ManifestUtils',
+    'utils.MetricsUtils',
+    'utils.AdaptiveUtils',
+    'utils.PyramidUtils',
+    'utils.RegionUtils',
+    'utils.OtsuUtils',
+    'utils.ThresholdingUtils',
+    'utils.TIFF_Utilities',
+    'utils.TIFF_Labeling_Utilities',
+    'utils.StatsUtils',
+    'utils.MaskUtils',
+]
+
+HEAVY_MODULES = ['torch', 'torchvision', 'matplotlib', 'skimage', 'scipy', 'tifffile']
+
+# numpy and PIL are imported first so the measured time is only the module's own import cost
+_IMPORT_SCRIPT = '''
+import sys, time
+import numpy, PIL.Image
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(elapsed, ','.join(heavy))
+'''
+
+
+def time_import(module, repeat):
+    best = None
+    heavy = []
+    for _ in range(repeat):
+        script = _IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)
+        output = subprocess.run([sys.executable, '-c', script], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout
+        fields = output.split()
+        elapsed = float(fields[0])
+        heavy = fields[1].split(',') if len(fields) > 1 else []
+        best = elapsed if best is None else min(best, elapsed)
+    return best, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=float, default=0.25, help='maximum import time per module in seconds')
+    parser.add_argument('--repeat', type=int, default=5, help='number of fresh processes per module, the best time is kept')
+    args = parser.parse_args()
+
+    failed = False
+    print(f'{"Module":<32} {"Import (ms)":>12}  Heavy dependencies loaded')
+    for module in MODULES:
+        elapsed, heavy = time_import(module, args.repeat)
+        status = ''
+        if heavy or elapsed > args.budget:
+            failed = True
+            status = '  <-- REGRESSION'
+        print(f'{module:<32} {elapsed * 1000:>12.1f}  {", ".join(heavy) or "-"}{status}')
+
+    if failed:
+        print(f'Import-time check failed (budget {args.budget * 1000:.0f} ms, heavy dependencies must be lazy)')
+        return 1
+    print('Import-time check passed')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
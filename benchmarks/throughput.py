@@ -0,0 +1,384 @@
+'''
+Throughput benchmark for the public utils functions on synthetic radiometric data.
+
+Synthetic TIFFs are generated once per run (float32 temperature fields in degrees Celsius: a smooth
+ambient background with sensor noise and Gaussian hotspots up to ~600 C), at the sizes below plus a
+folder of 640x512 frames for the folder functions:
+
+    frame   640 x 512     (one drone frame)
+    large   2560 x 2048
+    mosaic  8192 x 8192   (stitched orthomosaic scale, not run by default)
+
+Every case runs in a fresh Python process so its peak resident memory can be measured. It is run
+once untimed first (lazy imports of torch/scipy/matplotlib are measured by import_time.py instead),
+then repeated and the best time is kept. Cases are grouped by pipeline stage (calibration,
+thresholding, labeling, statistics, resize) and report time, frames/s, megapixels/s and peak
+resident memory of the process.
+
+Results can be saved as a baseline and later runs compared against it: a case slower than the
+baseline by more than the tolerance is flagged as a regression and the script exits with status 1.
+Baselines are machine specific, record one on the machine the comparisons run on.
+
+Usage (from the repository root)
+    python benchmarks/throughput.py
+    python benchmarks/throughput.py --sizes frame large mosaic --frames 50 --repeat 5
+    python benchmarks/throughput.py --save-baseline
+    python benchmarks/throughput.py --compare --tolerance 0.2
+    python benchmarks/throughput.py --cases tiff_image_convert labelTiff
+'''
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, 'benchmarks', 'throughput_baseline.json')
+
+SIZES = {
+    'frame': (512, 640),
+    'large': (2048, 2560),
+    'mosaic': (8192, 8192),
+}
+
+# marks the result line printed by a case process
+_RESULT_PREFIX = 'BENCHMARK_RESULT '
+
+
+'''
+Generate a synthetic radiometric frame (float32, degrees Celsius): a smooth ambient field around
+15 C, sensor noise and Gaussian hotspots with peaks between 80 and 600 C. Deterministic for a seed.
+'''
+def synthetic_frame(height, width, seed=0):
+    rng = np.random.default_rng(seed)
+
+    # smooth ambient background, coarse noise upsampled with bicubic interpolation
+    coarse = rng.normal(0, 1, (height // 64 + 2, width // 64 + 2)).astype(np.float32)
+    ambient = np.array(Image.fromarray(coarse, mode='F').resize((width, height), Image.BICUBIC))
+    frame = 15 + 5 * ambient + rng.normal(0, 0.3, (height, width)).astype(np.float32)
+
+    # about 8 hotspots per 640x512 frame area, added on a window of +-4 sigma around each center
+    num_hotspots = max(1, round(8 * height * width / (640 * 512)))
+    for _ in range(num_hotspots):
+        cy, cx = rng.integers(0, height), rng.integers(0, width)
+        sigma = rng.uniform(3, 30)
+        peak = rng.uniform(80, 600)
+        radius = int(4 * sigma)
+        y0, y1 = max(0, cy - radius), min(height, cy + radius + 1)
+        x0, x1 = max(0, cx - radius), min(width, cx + radius + 1)
+        yy, xx = np.ogrid[y0 - cy:y1 - cy, x0 - cx:x1 - cx]
+        frame[y0:y1, x0:x1] += (peak * np.exp(-(yy * yy + xx * xx) / (2 * sigma * sigma))).astype(np.float32)
+    return frame.astype(np.float32)
+
+
+'''
+Write the synthetic dataset to data_dir: one TIFF, binary mask and thermal JPEG per size and a
+folder of frames. Existing files are reused.
+'''
+def generate_data(data_dir, sizes, num_frames):
+    from utils.BinarizeUtils import binarize
+    from utils.TIFF_Utilities import colormap_lut, apply_lut
+
+    lut = colormap_lut()
+    for size in sizes:
+        tiff_path = os.path.join(data_dir, f'{size}.TIFF')
+        if os.path.exists(tiff_path):
+            continue
+        frame = synthetic_frame(*SIZES[size], seed=1)
+        Image.fromarray(binarize(frame, 50)).save(os.path.join(data_dir, f'{size}_mask.TIFF'))
+        Image.fromarray(apply_lut(np.clip(frame, 0, 500), lut)).save(os.path.join(data_dir, f'{size}.JPG'))
+        Image.fromarray(frame, mode='F').save(tiff_path)
+
+    folder = os.path.join(data_dir, f'folder_{num_frames}')
+    masks = os.path.join(data_dir, f'folder_{num_frames}_masks')
+    if not os.path.exists(masks):
+        os.makedirs(folder, exist_ok=True)
+        os.makedirs(masks + '.tmp', exist_ok=True)
+        for i in range(num_frames):
+            frame = synthetic_frame(*SIZES['frame'], seed=100 + i)
+            Image.fromarray(frame, mode='F').save(os.path.join(folder, f'{i + 1:05d}.TIFF'))
+            Image.fromarray(binarize(frame, 50)).save(os.path.join(masks + '.tmp', f'{i + 1:05d}.TIFF'))
+        # the mask folder is created last so an interrupted generation is redone
+        os.replace(masks + '.tmp', masks)
+
+
+'''
+Benchmark cases. Each case takes (data_dir, out_dir, size, num_frames), runs the function once and
+returns (frames, pixels) processed. Image cases run once per size, folder cases once on the folder.
+'''
+def _image(size, data_dir, name='TIFF'):
+    return os.path.join(data_dir, f'{size}.{name}')
+
+
+def _pixels(size):
+    height, width = SIZES[size]
+    return height * width
+
+
+def case_tiff_image_convert(imageType):
+    def run(data_dir, out_dir, size, num_frames):
+        from utils.ThresholdingUtils import tiff_image_convert
+        tiff_image_convert(_image(size, data_dir), os.path.join(out_dir, 'out'), imageType, low_threshold=50, high_threshold=150, binThresh=50)
+        return 1, _pixels(size)
+    return run
+
+
+def case_otsu_threshold(data_dir, out_dir, size, num_frames):
+    from utils.OtsuUtils import otsu_threshold
+    otsu_threshold(_image(size, data_dir))
+    return 1, _pixels(size)
+
+
+def case_otsu_threshold_thermal(data_dir, out_dir, size, num_frames):
+    from utils.OtsuUtils import otsu_threshold_thermal
+    otsu_threshold_thermal(_image(size, data_dir, 'JPG'))
+    return 1, _pixels(size)
+
+
+def case_labelTiff(data_dir, out_dir, size, num_frames):
+    from utils.TIFF_Labeling_Utilities import labelTiff
+    height, width = SIZES[size]
+    labelTiff(_image(size, data_dir), os.path.join(data_dir, f'{size}_mask.TIFF'), 6, height, width)
+    return 1, _pixels(size)
+
+
+def case_tiff_calibrate_image(data_dir, out_dir, size, num_frames):
+    from utils.TIFF_Utilities import tiff_calibrate_image
+    tiff_calibrate_image(_image(size, data_dir), os.path.join(out_dir, 'calibrated.TIFF'), os.path.join(out_dir, 'calibrated.JPG'))
+    return 1, _pixels(size)
+
+
+def case_tiff_tiled_convert(imageType):
+    def run(data_dir, out_dir, size, num_frames):
+        from utils.TiledUtils import tiff_tiled_convert
+        tiff_tiled_convert(_image(size, data_dir), os.path.join(out_dir, 'tiled.TIFF'), imageType)
+        return 1, _pixels(size)
+    return run
+
+
+def case_tiff_tiled_convert_pyramid(data_dir, out_dir, size, num_frames):
+    # the pyramid is cached next to the input like a pyramid folder, the warm-up run builds it
+    from utils.TiledUtils import tiff_tiled_convert, open_tiff_array
+    from utils.PyramidUtils import build_pyramid
+    pyramid_path = _image(size, data_dir, 'pyramid.npz')
+    if not os.path.exists(pyramid_path):
+        build_pyramid(open_tiff_array(_image(size, data_dir))).save(pyramid_path)
+    tiff_tiled_convert(_image(size, data_dir), os.path.join(out_dir, 'tiled.TIFF'), 'BINARY', pyramid=pyramid_path)
+    return 1, _pixels(size)
+
+
+def _folder(data_dir, num_frames):
+    return os.path.join(data_dir, f'folder_{num_frames}')
+
+
+def case_tiff_folder_convert(imageType):
+    def run(data_dir, out_dir, size, num_frames):
+        from utils.ThresholdingUtils import tiff_folder_convert
+        tiff_folder_convert(_folder(data_dir, num_frames), out_dir, imageType, low_threshold=50, high_threshold=150, binThresh=50)
+        return num_frames, num_frames * _pixels('frame')
+    return run
+
+
+def case_tiff_multi_convert(data_dir, out_dir, size, num_frames):
+    # the three methods of the tiff_folder_convert cases in one pass
+    from utils.ThresholdingUtils import tiff_multi_convert
+    tiff_multi_convert(_folder(data_dir, num_frames), [
+        dict(imageType='BINARY', output_folder=os.path.join(out_dir, 'BINARY'), binThresh=50),
+        dict(imageType='HYST', output_folder=os.path.join(out_dir, 'HYST'), low_threshold=50, high_threshold=150),
+        dict(imageType='OTSU', output_folder=os.path.join(out_dir, 'OTSU')),
+    ])
+    return num_frames, num_frames * _pixels('frame')
+
+
+def case_tiff_resize_images(data_dir, out_dir, size, num_frames):
+    from utils.TIFF_Utilities import tiff_resize_images
+    tiff_resize_images(_folder(data_dir, num_frames), out_dir, 256, 320)
+    return num_frames, num_frames * _pixels('frame')
+
+
+def case_tiff_max_min(data_dir, out_dir, size, num_frames):
+    from utils.TIFF_Utilities import tiff_max_min
+    tiff_max_min(_folder(data_dir, num_frames))
+    return num_frames, num_frames * _pixels('frame')
+
+
+def case_tiff_dataset_stats(data_dir, out_dir, size, num_frames):
+    from utils.StatsUtils import tiff_dataset_stats
+    tiff_dataset_stats(_folder(data_dir, num_frames), use_cache=False)
+    return num_frames, num_frames * _pixels('frame')
+
+
+def case_labelFolder(data_dir, out_dir, size, num_frames):
+    from utils.TIFF_Labeling_Utilities import labelFolder
+    labelFolder(_folder(data_dir, num_frames), f'{_folder(data_dir, num_frames)}_masks', out_dir, 6, workers=1)
+    return num_frames, num_frames * _pixels('frame')
+
+
+def case_region_folder_stats(data_dir, out_dir, size, num_frames):
+    from utils.RegionUtils import region_folder_stats
+    region_folder_stats(_folder(data_dir, num_frames), f'{_folder(data_dir, num_frames)}_masks', os.path.join(out_dir, 'regions.csv'))
+    return num_frames, num_frames * _pixels('frame')
+
+
+def case_tiff_calibrate_folder(data_dir, out_dir, size, num_frames):
+    from utils.TIFF_Utilities import tiff_calibrate_folder
+    tiff_calibrate_folder(_folder(data_dir, num_frames), os.path.join(out_dir, 'tiff'), os.path.join(out_dir, 'jpg'))
+    return num_frames, num_frames * _pixels('frame')
+
+
+# (name, stage, kind, function), kind is 'image' (run per size) or 'folder'
+CASES = [
+    ('tiff_calibrate_image', 'calibration', 'image', case_tiff_calibrate_image),
+    ('tiff_calibrate_folder', 'calibration', 'folder', case_tiff_calibrate_folder),
+    ('tiff_image_convert BINARY', 'thresholding', 'image', case_tiff_image_convert('BINARY')),
+    ('tiff_image_convert HYST', 'thresholding', 'image', case_tiff_image_convert('HYST')),
+    ('tiff_image_convert OTSU', 'thresholding', 'image', case_tiff_image_convert('OTSU')),
+    ('tiff_image_convert ADAPTIVE', 'thresholding', 'image', case_tiff_image_convert('ADAPTIVE')),
+    ('otsu_threshold', 'thresholding', 'image', case_otsu_threshold),
+    ('otsu_threshold_thermal', 'thresholding', 'image', case_otsu_threshold_thermal),
+    ('tiff_tiled_convert BINARY', 'thresholding', 'image', case_tiff_tiled_convert('BINARY')),
+    ('tiff_tiled_convert HYST', 'thresholding', 'image', case_tiff_tiled_convert('HYST')),
+    ('tiff_tiled_convert pyramid', 'thresholding', 'image', case_tiff_tiled_convert_pyramid),
+    ('tiff_folder_convert BINARY', 'thresholding', 'folder', case_tiff_folder_convert('BINARY')),
+    ('tiff_folder_convert HYST', 'thresholding', 'folder', case_tiff_folder_convert('HYST')),
+    ('tiff_folder_convert OTSU', 'thresholding', 'folder', case_tiff_folder_convert('OTSU')),
+    ('tiff_folder_convert ADAPTIVE', 'thresholding', 'folder', case_tiff_folder_convert('ADAPTIVE')),
+    ('tiff_multi_convert x3', 'thresholding', 'folder', case_tiff_multi_convert),
+    ('labelTiff', 'labeling', 'image', case_labelTiff),
+    ('labelFolder', 'labeling', 'folder', case_labelFolder),
+    ('tiff_max_min', 'statistics', 'folder', case_tiff_max_min),
+    ('tiff_dataset_stats', 'statistics', 'folder', case_tiff_dataset_stats),
+    ('region_folder_stats', 'statistics', 'folder', case_region_folder_stats),
+    ('tiff_resize_images', 'resize', 'folder', case_tiff_resize_images),
+]
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # not available on Windows
+        return None
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+'''
+Run one case in this process (called in a fresh subprocess by run_case) and print its result
+'''
+def _run_case_here(name, size, data_dir, num_frames, repeat):
+    function = {case_name: case for case_name, _, _, case in CASES}[name]
+    times = []
+    # the first run is a warm-up and not timed
+    for _ in range(repeat + 1):
+        with tempfile.TemporaryDirectory() as out_dir:
+            # the functions report progress on stdout, keep only the result line
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                frames, pixels = function(data_dir, out_dir, size, num_frames)
+                times.append(time.perf_counter() - start)
+    print(_RESULT_PREFIX + json.dumps(dict(seconds=min(times[1:]), frames=frames, pixels=pixels, peak_rss_mb=_peak_rss_mb())))
+
+
+def run_case(name, size, data_dir, num_frames, repeat):
+    command = [sys.executable, os.path.abspath(__file__), '--run-case', name, '--run-size', size,
+               '--data-dir', data_dir, '--frames', str(num_frames), '--repeat', str(repeat)]
+    process = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True)
+    for line in process.stdout.splitlines():
+        if line.startswith(_RESULT_PREFIX):
+            return json.loads(line[len(_RESULT_PREFIX):]), None
+    return None, (process.stderr.strip().splitlines() or ['no result'])[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['frame', 'large'], choices=sorted(SIZES), help='image sizes of the image cases')
+    parser.add_argument('--frames', type=int, default=20, help='number of 640x512 frames in the folder cases')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case, the best time is kept')
+    parser.add_argument('--cases', nargs='+', default=None, help='only run cases whose name starts with one of these')
+    parser.add_argument('--data-dir', default=None, help='folder for the synthetic data, reused between runs (default is a temporary folder)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='compare against the baseline and exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline (0.25 = 25%%)')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    parser.add_argument('--run-size', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        _run_case_here(args.run_case, args.run_size, args.data_dir, args.frames, args.repeat)
+        return 0
+
+    temp_dir = None
+    data_dir = args.data_dir
+    if data_dir is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        data_dir = temp_dir.name
+    os.makedirs(data_dir, exist_ok=True)
+    print(f'Generating synthetic data in {data_dir}')
+    generate_data(data_dir, args.sizes, args.frames)
+
+    baseline = {}
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f'No baseline at {args.baseline}, run with --save-baseline first')
+            return 1
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    results = {}
+    regressions = []
+    print(f'{"Stage":<13} {"Case":<28} {"Size":<10} {"Time (s)":>9} {"Frames/s":>9} {"MP/s":>8} {"Peak MB":>8}  Baseline')
+    for name, stage, kind, _ in CASES:
+        if args.cases and not any(name.startswith(prefix) for prefix in args.cases):
+            continue
+        for size in (args.sizes if kind == 'image' else [f'folder_{args.frames}']):
+            key = f'{name} [{size}]'
+            result, error = run_case(name, size, data_dir, args.frames, args.repeat)
+            if result is None:
+                print(f'{stage:<13} {name:<28} {size:<10} FAILED: {error}')
+                continue
+            results[key] = result
+
+            seconds = result['seconds']
+            peak = result['peak_rss_mb']
+            comparison = ''
+            if key in baseline:
+                change = seconds / baseline[key]['seconds'] - 1
+                comparison = f'{change:+.0%}'
+                if change > args.tolerance:
+                    comparison += '  <-- REGRESSION'
+                    regressions.append(key)
+            print(f'{stage:<13} {name:<28} {size:<10} {seconds:>9.3f} {result["frames"] / seconds:>9.1f} '
+                  f'{result["pixels"] / 1e6 / seconds:>8.1f} {"-" if peak is None else f"{peak:.0f}":>8}  {comparison}')
+
+    if temp_dir is not None:
+        temp_dir.cleanup()
+
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            # keep the cases that were not run this time
+            with open(args.baseline) as file:
+                results = dict(json.load(file), **results)
+        with open(args.baseline, mode='w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print(f'Baseline saved to {args.baseline}')
+
+    if regressions:
+        print(f'{len(regressions)} regressions against {args.baseline} (tolerance {args.tolerance:.0%})')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
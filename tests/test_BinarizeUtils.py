@@ -0,0 +1,60 @@
+'''
+Regression tests of the binarization kernel against the per-pixel loop it replaced in
+tiff_image_convert, tiff_folder_convert, tiff_binary_image_convert, tiff_binary_folder_convert and
+otsu_threshold.
+'''
+import numpy as np
+import pytest
+
+from utils.BinarizeUtils import binarize, threshold_mask
+
+
+'''
+The original loop. With the pinned numpy 1.24, comparing a numpy scalar with a Python number was
+done in float64, float(pixel) keeps that meaning on newer numpy versions.
+'''
+def loop_binarize(image_array, binThresh):
+    image_array = image_array.copy()
+    for i in range(image_array.shape[0]):
+        for j in range(image_array.shape[1]):
+            pixel = image_array[i, j]
+            if float(pixel) > binThresh:
+                image_array[i, j] = 255
+            else:
+                image_array[i, j] = 0
+    return image_array.astype('uint8')
+
+
+def synthetic_frame(dtype, seed=0):
+    rng = np.random.default_rng(seed)
+    if np.issubdtype(dtype, np.floating):
+        # radiometric temperatures around the thresholds, with exact hits and float32 rounding
+        frame = rng.uniform(-20, 300, size=(24, 32)).astype(dtype)
+        frame[0, :6] = [50, 50.5, 0.1, np.nextafter(np.float32(0.1), 1), 150, -1]
+        return frame
+    info = np.iinfo(dtype)
+    frame = rng.integers(info.min, min(info.max, 400), size=(24, 32), endpoint=True).astype(dtype)
+    frame[0, :4] = [50, 51, 0, min(info.max, 255)]
+    return frame
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64, np.uint8, np.uint16, np.int16])
+@pytest.mark.parametrize('thresh', [50, 50.5, 0.1, 150, -1, 255, 1000])
+def test_binarize_matches_loop(dtype, thresh):
+    frame = synthetic_frame(dtype)
+    expected = loop_binarize(frame, thresh)
+
+    mask = binarize(frame, thresh)
+    assert mask.dtype == np.uint8
+    np.testing.assert_array_equal(mask, expected)
+    np.testing.assert_array_equal(threshold_mask(frame, thresh), expected == 255)
+
+
+def test_binarize_out():
+    frame = synthetic_frame(np.float32, seed=1)
+    out = np.full(frame.shape, 7, dtype=np.uint8)
+
+    assert binarize(frame, 50, out=out) is out
+    np.testing.assert_array_equal(out, loop_binarize(frame, 50))
+    with pytest.raises(ValueError):
+        binarize(frame, 50, out=np.empty(frame.shape, dtype=np.float32))
@@ -0,0 +1,121 @@
+'''
+Regression tests of the hysteresis engine against the code it replaced in the 'HYST' mode of
+tiff_image_convert and tiff_folder_convert, and of the connected-component hysteresis against a
+plain flood fill from the strong pixels.
+'''
+from collections import deque
+
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter
+from scipy.signal import convolve2d
+
+from utils.HysteresisUtils import gradient_magnitude, hysteresis_mask, hysteresis_threshold
+
+
+'''
+The original smoothing and Sobel gradient, in float64.
+'''
+def loop_gradient_magnitude(image_array):
+    smoothed_image = gaussian_filter(image_array.astype(np.float64), sigma=1)
+    sobelx = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]])
+    sobely = np.array([[-1, -2, -1], [0, 0, 0], [1, 2, 1]])
+    gradient_x = convolve2d(smoothed_image, sobelx, mode='same')
+    gradient_y = convolve2d(smoothed_image, sobely, mode='same')
+    return np.sqrt(gradient_x ** 2 + gradient_y ** 2)
+
+
+'''
+The original 3x3 neighborhood check.
+'''
+def loop_hysteresis(gradient_magnitude, low_threshold, high_threshold):
+    output_image = np.zeros(gradient_magnitude.shape)
+    strong_edge = (gradient_magnitude > high_threshold)
+    weak_edge = (gradient_magnitude >= low_threshold) & (gradient_magnitude <= high_threshold)
+
+    output_image[strong_edge] = 255
+    for i in range(1, output_image.shape[0]-1):
+        for j in range(1, output_image.shape[1]-1):
+            if weak_edge[i, j]:
+                local_magnitude = gradient_magnitude[i-1:i+2, j-1:j+2]
+                adjacent_pixels = local_magnitude > low_threshold
+                if np.any(adjacent_pixels):
+                    output_image[i, j] = 255
+    return output_image.astype('uint8')
+
+
+'''
+Weak pixels reachable from a strong pixel through strong or weak pixels, one pixel at a time.
+'''
+def flood_hysteresis(gradient_magnitude, low_threshold, high_threshold, connectivity):
+    strong_edge = gradient_magnitude > high_threshold
+    candidate = gradient_magnitude >= low_threshold
+    if connectivity == 8:
+        steps = [(di, dj) for di in (-1, 0, 1) for dj in (-1, 0, 1) if (di, dj) != (0, 0)]
+    else:
+        steps = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+    keep = strong_edge.copy()
+    queue = deque(zip(*np.nonzero(strong_edge)))
+    while queue:
+        i, j = queue.popleft()
+        for di, dj in steps:
+            ni, nj = i + di, j + dj
+            if 0 <= ni < keep.shape[0] and 0 <= nj < keep.shape[1] and candidate[ni, nj] and not keep[ni, nj]:
+                keep[ni, nj] = True
+                queue.append((ni, nj))
+    return keep.astype(np.uint8) * np.uint8(255)
+
+
+def synthetic_magnitude(seed):
+    rng = np.random.default_rng(seed)
+    magnitude = rng.uniform(0, 200, size=(20, 24))
+    # exact hits on the thresholds and a weak chain running into a strong pixel
+    magnitude[0, :4] = [50, 150, 49.999, 150.001]
+    magnitude[10, 2:20] = 100
+    magnitude[10, 20] = 180
+    return magnitude
+
+
+def synthetic_frame(seed):
+    rng = np.random.default_rng(seed)
+    frame = rng.normal(30, 5, size=(40, 48))
+    frame[12:25, 15:30] += 250
+    return frame.astype(np.float32)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('thresholds', [(50, 150), (20, 60), (100, 100)])
+def test_legacy_matches_loop(seed, thresholds):
+    magnitude = synthetic_magnitude(seed)
+    expected = loop_hysteresis(magnitude, *thresholds)
+    np.testing.assert_array_equal(hysteresis_mask(magnitude, *thresholds, legacy=True), expected)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('thresholds', [(50, 150), (20, 60), (100, 100)])
+@pytest.mark.parametrize('connectivity', [4, 8])
+def test_connected_components_match_flood_fill(seed, thresholds, connectivity):
+    magnitude = synthetic_magnitude(seed)
+    expected = flood_hysteresis(magnitude, *thresholds, connectivity)
+    np.testing.assert_array_equal(hysteresis_mask(magnitude, *thresholds, connectivity=connectivity), expected)
+
+
+def test_invalid_connectivity():
+    with pytest.raises(ValueError):
+        hysteresis_mask(synthetic_magnitude(0), 50, 150, connectivity=6)
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_gradient_magnitude_matches_original(seed):
+    frame = synthetic_frame(seed)
+    magnitude = gradient_magnitude(frame)
+    assert magnitude.dtype == np.float32
+    np.testing.assert_allclose(magnitude, loop_gradient_magnitude(frame), rtol=1e-4, atol=1e-3)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_hysteresis_threshold_legacy_matches_original(seed):
+    frame = synthetic_frame(seed)
+    expected = loop_hysteresis(loop_gradient_magnitude(frame), 50, 150)
+    np.testing.assert_array_equal(hysteresis_threshold(frame, 50, 150, legacy=True), expected)
@@ -0,0 +1,107 @@
+'''
+Regression tests of the vectorized rangeLabel and labelTiff against the per-pixel loops they
+replaced.
+'''
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils.TIFF_Labeling_Utilities import rangeLabel, labelTiff, divideRange
+
+
+'''
+The original rangeLabel. With the pinned numpy 1.24, comparing numpy scalars with Python numbers
+was done in float64, the float() conversions keep that meaning on newer numpy versions.
+'''
+def loop_rangeLabel(tiffSampleArray, fireBoundaries, fire_rows, fire_cols, fire_values, height, width, labelTolerance=0.3):
+    labels = []
+    tolerance = labelTolerance
+    for val in fire_values:
+        val = float(val)
+        for i in range(len(fireBoundaries) - 1):
+            lowerBound = float(fireBoundaries[i])
+            upperBound = float(fireBoundaries[i + 1])
+            if i == len(fireBoundaries) - 2:
+                if lowerBound <= val <= (upperBound + tolerance):
+                    labels.append(i + 1)
+                    break
+            else:
+                if (lowerBound-tolerance) <= val < upperBound:
+                    labels.append(i + 1)
+                    break
+
+    for row, col, label in zip(fire_rows, fire_cols, labels):
+        tiffSampleArray[row, col] = label
+
+    all_indices = {(r, c) for r in range(height) for c in range(width)}
+    fire_indices = set(zip(fire_rows, fire_cols))
+    for row, col in all_indices - fire_indices:
+        tiffSampleArray[row, col] = 0
+    return tiffSampleArray
+
+
+'''
+The original labelTiff, gathering the fire values one pixel at a time.
+'''
+def loop_labelTiff(tiffSamplePath, tiffBinaryPath, num_classes, height, width, labelTolerance=0.3):
+    tiffSampleArray = np.array(Image.open(tiffSamplePath))
+    tiffBinaryArray = np.array(Image.open(tiffBinaryPath))
+
+    fire_rows, fire_cols = np.where(tiffBinaryArray == 255)
+    fireValues = np.array([tiffSampleArray[row, col] for row, col in zip(fire_rows, fire_cols)])
+    fireBoundaries = divideRange(fireValues, num_classes)
+    return loop_rangeLabel(tiffSampleArray, fireBoundaries, fire_rows, fire_cols, fireValues, height, width, labelTolerance=labelTolerance)
+
+
+def synthetic_pair(seed, shape=(18, 22)):
+    rng = np.random.default_rng(seed)
+    frame = rng.uniform(20, 400, size=shape).astype(np.float32)
+    mask = np.where(rng.random(shape) < 0.4, 255, 0).astype(np.uint8)
+    return frame, mask
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('num_classes', [1, 3, 5])
+@pytest.mark.parametrize('labelTolerance', [0.3, 0.0, 25.0])
+def test_rangeLabel_matches_loop(seed, num_classes, labelTolerance):
+    frame, mask = synthetic_pair(seed)
+    fire_rows, fire_cols = np.where(mask == 255)
+    fire_values = frame[fire_rows, fire_cols]
+    fireBoundaries = divideRange(fire_values, num_classes)
+    # values sitting exactly on the boundaries
+    fire_values[:len(fireBoundaries)] = fireBoundaries
+    frame[fire_rows, fire_cols] = fire_values
+
+    height, width = frame.shape
+    expected = loop_rangeLabel(frame.copy(), fireBoundaries, fire_rows, fire_cols, fire_values, height, width, labelTolerance)
+    labeled = rangeLabel(frame.copy(), fireBoundaries, fire_rows, fire_cols, fire_values, height, width, labelTolerance)
+    np.testing.assert_array_equal(labeled, expected)
+
+
+def test_rangeLabel_unlabeled_values_and_partial_background():
+    frame, mask = synthetic_pair(3)
+    fire_rows, fire_cols = np.where(mask == 255)
+    fire_values = frame[fire_rows, fire_cols]
+    fireBoundaries = divideRange(fire_values, 4)
+    # values outside every class and NaNs are skipped, shifting the labels onto the next pixels
+    fire_values[[2, 5]] = [fireBoundaries[0] - 10, np.nan]
+    frame[fire_rows, fire_cols] = fire_values
+
+    # the background is only cleared inside height x width
+    expected = loop_rangeLabel(frame.copy(), fireBoundaries, fire_rows, fire_cols, fire_values, 10, 15)
+    labeled = rangeLabel(frame.copy(), fireBoundaries, fire_rows, fire_cols, fire_values, 10, 15)
+    np.testing.assert_array_equal(labeled, expected)
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+@pytest.mark.parametrize('num_classes', [2, 4])
+def test_labelTiff_matches_loop(tmp_path, seed, num_classes):
+    frame, mask = synthetic_pair(seed)
+    sample_path = str(tmp_path / 'sample.TIFF')
+    binary_path = str(tmp_path / 'binary.TIFF')
+    Image.fromarray(frame).save(sample_path)
+    Image.fromarray(mask).save(binary_path)
+
+    height, width = frame.shape
+    expected = loop_labelTiff(sample_path, binary_path, num_classes, height, width)
+    np.testing.assert_array_equal(labelTiff(sample_path, binary_path, num_classes, height, width), expected)
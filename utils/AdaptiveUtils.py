@@ -0,0 +1,134 @@
+import numpy as np
+
+# local threshold formulas supported by adaptive_threshold_map
+ADAPTIVE_METHODS = ('SAUVOLA', 'NIBLACK')
+
+'''
+Integral images (summed-area tables) of an image and of its square, used to get the sum of any
+rectangular window with 4 lookups. Both tables have a leading row and column of zeros, so the sum
+of rows r0..r1-1 and columns c0..c1-1 is table[r1, c1] - table[r0, c1] - table[r1, c0] + table[r0, c0].
+
+The values are centered on the image mean before summing (in float64), which keeps the sums of
+squares small so the local variance does not lose precision to cancellation on hot frames.
+
+Required Parameters
+    -image_array = 2D numpy array holding the image values
+
+Returns (sums, squares, offset) where offset is the mean that was subtracted
+'''
+def integral_images(image_array):
+    values = np.asarray(image_array, dtype=np.float64)
+    offset = float(values.mean()) if values.size else 0.0
+    values = values - offset
+
+    height, width = values.shape
+    sums = np.zeros((height + 1, width + 1), dtype=np.float64)
+    squares = np.zeros((height + 1, width + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(values, axis=0), axis=1, out=sums[1:, 1:])
+    np.square(values, out=values)
+    np.cumsum(np.cumsum(values, axis=0), axis=1, out=squares[1:, 1:])
+    return sums, squares, offset
+
+
+def _window_sums(table, rows0, rows1, cols0, cols1):
+    # sum of every window from the integral image, one gather per corner
+    return table[rows1][:, cols1] - table[rows0][:, cols1] - table[rows1][:, cols0] + table[rows0][:, cols0]
+
+
+'''
+Mean and standard deviation of the window_size x window_size window centered on every pixel,
+computed from integral images so the cost per pixel is the same whatever the window size. Windows
+are clipped at the image borders (only the pixels inside the image are averaged).
+
+Required Parameters
+    -image_array = 2D numpy array holding the image values
+    -window_size = odd window side in pixels
+
+Returns (mean, std) as float64 arrays shaped like image_array
+'''
+def local_mean_std(image_array, window_size):
+    if window_size < 1 or window_size % 2 == 0:
+        raise ValueError(f'window_size must be a positive odd number, got {window_size}')
+    sums, squares, offset = integral_images(image_array)
+    height, width = sums.shape[0] - 1, sums.shape[1] - 1
+
+    half = window_size // 2
+    rows = np.arange(height)
+    cols = np.arange(width)
+    rows0 = np.clip(rows - half, 0, height)
+    rows1 = np.clip(rows + half + 1, 0, height)
+    cols0 = np.clip(cols - half, 0, width)
+    cols1 = np.clip(cols + half + 1, 0, width)
+    count = np.outer(rows1 - rows0, cols1 - cols0).astype(np.float64)
+
+    mean = _window_sums(sums, rows0, rows1, cols0, cols1) / count
+    variance = _window_sums(squares, rows0, rows1, cols0, cols1) / count - mean * mean
+    std = np.sqrt(np.maximum(variance, 0, out=variance), out=variance)
+    mean += offset
+    return mean, std
+
+
+'''
+Per-pixel threshold map of a local adaptive method, fire pixels are the ones above it.
+
+    'NIBLACK'  T = m + k * s
+    'SAUVOLA'  T = m + k * (1 - s / R) * (M - m)
+
+where m and s are the local mean and standard deviation, M is the frame maximum and R the dynamic
+range of the standard deviation. Sauvola's formula is written for dark text on a light page; fire
+is bright, so it is applied to the image mirrored around M. In flat areas (s close to 0) a pixel
+must be a fraction k of the way from the local mean to the frame maximum to count, which keeps
+noise in cold ground out, while near a flame front (s close to R) the threshold drops to the local
+mean so smoldering areas next to much hotter flames are still picked up.
+
+Required Parameters
+    -image_array = 2D numpy array holding the image values (degrees Celsius for radiometric TIFFs)
+
+Optional Parameters
+    -window_size = odd window side in pixels, default is 31
+    -method = 'SAUVOLA' or 'NIBLACK', default is 'SAUVOLA'
+    -k = weight of the standard deviation term, default is 0.2
+    -dynamic_range = R of Sauvola's formula, default is None which uses the largest local standard
+                     deviation of the frame
+    -local_stats = (mean, std) already computed with local_mean_std for this window_size, default is
+                   None which computes them
+'''
+def adaptive_threshold_map(image_array, window_size=31, method='SAUVOLA', k=0.2, dynamic_range=None, local_stats=None):
+    if method not in ADAPTIVE_METHODS:
+        raise ValueError(f'Invalid adaptive method: {method}, expected one of {", ".join(ADAPTIVE_METHODS)}')
+    if local_stats is None:
+        local_stats = local_mean_std(image_array, window_size)
+    mean, std = local_stats
+
+    if method == 'NIBLACK':
+        return mean + k * std
+
+    if dynamic_range is None:
+        dynamic_range = float(std.max()) if std.size else 0.0
+    frame_max = float(np.max(image_array)) if std.size else 0.0
+    if dynamic_range <= 0:
+        # a flat frame has nothing above its mean
+        return mean + k * (frame_max - mean)
+    return mean + k * (1 - std / dynamic_range) * (frame_max - mean)
+
+
+'''
+Local adaptive thresholding of a frame, see adaptive_threshold_map for the methods. Pixels strictly
+above their local threshold (and above floor when given) are 255 and the rest 0.
+
+Required Parameters
+    -image_array = 2D numpy array holding the image values
+
+Optional Parameters
+    -window_size, method, k, dynamic_range, local_stats = see adaptive_threshold_map
+    -floor = absolute value a pixel must also be above (e.g. in degrees Celsius), default is None
+
+Returns a uint8 mask with 255 for fire pixels and 0 elsewhere
+'''
+def adaptive_mask(image_array, window_size=31, method='SAUVOLA', k=0.2, dynamic_range=None, floor=None, local_stats=None):
+    image_array = np.asarray(image_array)
+    threshold_map = adaptive_threshold_map(image_array, window_size, method, k, dynamic_range, local_stats=local_stats)
+    mask = image_array > threshold_map
+    if floor is not None:
+        mask &= image_array > floor
+    return mask.astype(np.uint8) * np.uint8(255)
@@ -0,0 +1,56 @@
+import numpy as np
+
+'''
+Shared binarization kernel used by every thresholding function in the package.
+
+Takes a 2D array (radiometric float32 TIFF, grayscale uint8, etc.) and returns a uint8 mask where
+pixels strictly greater than the threshold are 255 (white) and everything else is 0 (black).
+
+Required Parameters
+    -image_array = numpy array holding the image values
+    -thresh = threshold value (in degrees Celsius for radiometric TIFFs)
+
+Optional Parameters
+    -out = preallocated uint8 array with the same shape as image_array to write the mask into,
+           default is None which allocates a new array
+'''
+def binarize(image_array, thresh, out=None):
+    image_array = np.asarray(image_array)
+    if out is None:
+        out = np.empty(image_array.shape, dtype=np.uint8)
+    elif out.shape != image_array.shape or out.dtype != np.uint8:
+        raise ValueError(f'out must be a uint8 array of shape {image_array.shape}')
+
+    mask = threshold_mask(image_array, thresh)
+    np.multiply(mask, np.uint8(255), out=out)
+    return out
+
+
+'''
+Boolean mask of pixels strictly greater than thresh, compared in the dtype of image_array so
+float32 TIFFs are never upcast to float64. The result matches comparing every pixel against
+the exact threshold value one at a time.
+'''
+def threshold_mask(image_array, thresh):
+    image_array = np.asarray(image_array)
+    dtype = image_array.dtype
+
+    if np.issubdtype(dtype, np.floating):
+        cast_thresh = dtype.type(thresh)
+        # casting can round the threshold up past its real value, in which case a pixel equal to
+        # the rounded threshold is still greater than the real one
+        if float(cast_thresh) > float(thresh):
+            return image_array >= cast_thresh
+        return image_array > cast_thresh
+
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        # for integer pixels, p > t is the same as p > floor(t)
+        int_thresh = np.floor(thresh)
+        if int_thresh < info.min:
+            return np.ones(image_array.shape, dtype=bool)
+        if int_thresh >= info.max:
+            return np.zeros(image_array.shape, dtype=bool)
+        return image_array > dtype.type(int_thresh)
+
+    return image_array > thresh
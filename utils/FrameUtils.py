@@ -0,0 +1,340 @@
+import os
+import io
+import hashlib
+import queue
+import threading
+import time
+from fnmatch import fnmatchcase
+import numpy as np
+from PIL import Image
+
+# marks the end of the frame queue
+_DONE = object()
+
+'''
+List the files in a folder matching a filename pattern, sorted by name.
+
+Required Parameters
+    -folder = string path to the folder
+
+Optional Parameters
+    -pattern = glob pattern (e.g. '*.TIFF') or tuple of glob patterns, default is '*'
+    -ignore_case = If True, the pattern is matched case-insensitively, default is False
+'''
+def list_frames(folder, pattern='*', ignore_case=False):
+    patterns = (pattern,) if isinstance(pattern, str) else tuple(pattern)
+    if ignore_case:
+        patterns = tuple(p.lower() for p in patterns)
+
+    filenames = []
+    for filename in sorted(os.listdir(folder)):
+        name = filename.lower() if ignore_case else filename
+        if any(fnmatchcase(name, p) for p in patterns):
+            filenames.append(filename)
+    return filenames
+
+
+'''
+SHA-1 hash of a file's content, read in chunks so large files are never fully loaded. Used as the
+key of the gradient magnitude cache and to detect changed inputs in folder manifests
+'''
+def file_content_hash(file_path, chunk_size=1 << 20):
+    sha = hashlib.sha1()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+'''
+Cheap signature of a frame for spotting duplicate and near-duplicate frames: the mean of every block
+of a size x size grid (fewer blocks for frames smaller than the grid), in float64. Color frames are
+averaged over their channels first.
+
+Required Parameters
+    -image_array = 2D (or 3D color) numpy array of the frame
+
+Optional Parameters
+    -size = number of blocks per side, default is 32
+'''
+def frame_signature(image_array, size=32):
+    values = np.asarray(image_array)
+    if values.ndim == 3:
+        values = values.mean(axis=2)
+    height, width = values.shape
+    # first row and column of every block
+    rows = np.linspace(0, height, min(size, height) + 1).astype(np.intp)
+    cols = np.linspace(0, width, min(size, width) + 1).astype(np.intp)
+    sums = np.add.reduceat(np.add.reduceat(values, rows[:-1], axis=0, dtype=np.float64), cols[:-1], axis=1)
+    return sums / np.outer(np.diff(rows), np.diff(cols))
+
+
+'''
+Reuses the result computed for a frame on the next frames of a sequence while they stay the same.
+Sequential drone frames are often (near) identical, e.g. while the drone hovers, so each frame is
+compared with the last frame a result was computed for (the key frame) before doing any work:
+
+    tolerance = 0   the frame must be exactly equal to the key frame (a cheap signature check
+                    rejects most changed frames before the full comparison), so reused results are
+                    the same as recomputed ones
+    tolerance > 0   the frame signatures (see frame_signature) must not differ by more than tolerance
+                    in any block, e.g. in degrees Celsius for radiometric TIFFs. Near-duplicate frames
+                    then get the result of their key frame
+
+In both modes the frame must have the shape of the key frame.
+
+Comparing against the key frame instead of the previous frame keeps slow drift from accumulating.
+
+    sequence = SequenceCache()
+    for filename, frame in iter_frames(folder):
+        result = sequence.lookup(frame)
+        if result is None:
+            result = process(frame)
+            sequence.store(result)
+
+Optional Parameters
+    -tolerance = largest signature difference of a near-duplicate frame, default is 0 (exact duplicates only)
+    -signature_size = blocks per side of the signatures, default is 32
+'''
+class SequenceCache:
+    def __init__(self, tolerance=0.0, signature_size=32):
+        self.tolerance = tolerance
+        self.signature_size = signature_size
+        self.key_array = None
+        self.key_shape = None
+        self.key_signature = None
+        self.result = None
+        self.pending = None
+        self.reused = 0
+
+    '''
+    Return the result of the key frame if frame (array or PIL image) matches it, None otherwise
+    '''
+    def lookup(self, frame):
+        array = np.asarray(frame)
+        signature = frame_signature(array, self.signature_size)
+        # kept for store() when the frame has to be computed, the shape also when the array is not
+        self.pending = (array if self.tolerance <= 0 else None, array.shape, signature)
+        # frames of different sizes can have signatures of the same shape, their results never match
+        if self.result is None or array.shape != self.key_shape:
+            return None
+        difference = np.max(np.abs(signature - self.key_signature))
+        if self.tolerance > 0:
+            match = difference <= self.tolerance
+        else:
+            match = difference == 0 and np.array_equal(array, self.key_array)
+        if not match:
+            return None
+        self.reused += 1
+        return self.result
+
+    '''
+    Make the frame passed to the last lookup the key frame, with its computed result
+    '''
+    def store(self, result):
+        self.key_array, self.key_shape, self.key_signature = self.pending
+        self.result = result
+
+
+'''
+Read a whole file in one pass for a folder manifest. The size and modification time are taken from
+the open file before reading and the hash (the same SHA-1 as file_content_hash) from the bytes read,
+so a file changed while it is read looks changed on the next run instead of being recorded with
+content its output was not made from.
+
+Returns (data, file_info) with data the bytes of the file and file_info a dict of size, mtime
+(nanoseconds) and hash
+'''
+def read_hashed(file_path):
+    with open(file_path, 'rb') as file:
+        stat = os.fstat(file.fileno())
+        data = file.read()
+    return data, dict(size=stat.st_size, mtime=stat.st_mtime_ns, hash=hashlib.sha1(data).hexdigest())
+
+
+def _read_frame(image_path, as_array, file_infos=None):
+    if file_infos is None:
+        image = Image.open(image_path)
+    else:
+        # the frame is decoded from the hashed bytes, the file is read once
+        data, file_info = read_hashed(image_path)
+        file_infos[os.path.basename(image_path)] = file_info
+        image = Image.open(io.BytesIO(data))
+    # decode now so the work happens on the reader thread, load() also closes the file
+    image.load()
+    if as_array:
+        return np.array(image)
+    return image
+
+
+'''
+Generator yielding (filename, frame) for every file in a folder matching pattern, in sorted order.
+Frames are opened and decoded on a background reader thread and handed over through a bounded
+queue, so reading the next files overlaps with processing the current one.
+
+Required Parameters
+    -folder = string path to the folder
+
+Optional Parameters
+    -pattern = glob pattern (e.g. '*.TIFF') or tuple of glob patterns, default is '*'
+    -prefetch = Maximum number of decoded frames waiting in the queue, default is 4. If 0, frames
+                are read on the calling thread without read-ahead
+    -as_array = If True, frames are numpy arrays, if False they are loaded PIL images, default is True
+    -ignore_case = If True, the pattern is matched case-insensitively, default is False
+    -return_errors = If True, a file that fails to load is yielded as (filename, exception) and
+                     iteration continues, if False the exception is raised, default is False
+    -filenames = Explicit list of filenames in folder to read (pattern is then ignored), default is
+                 None which reads every file matching pattern
+    -timed = If True, yields (filename, frame, decode_seconds) with the time spent opening and
+             decoding the file, default is False
+    -file_infos = dict receiving filename -> file_info (see read_hashed) of every file read, set
+                  before its frame is yielded, default is None which does not hash the files
+'''
+def iter_frames(folder, pattern='*', prefetch=4, as_array=True, ignore_case=False, return_errors=False, filenames=None, timed=False, file_infos=None):
+    if filenames is None:
+        filenames = list_frames(folder, pattern, ignore_case=ignore_case)
+
+    if prefetch <= 0:
+        for filename in filenames:
+            start = time.perf_counter()
+            try:
+                frame = _read_frame(os.path.join(folder, filename), as_array, file_infos)
+            except Exception as e:
+                if not return_errors:
+                    raise
+                frame = e
+            if timed:
+                yield filename, frame, time.perf_counter() - start
+            else:
+                yield filename, frame
+        return
+
+    frame_queue = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        # retry with a timeout so the reader exits if the consumer stops early
+        while not stop.is_set():
+            try:
+                frame_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def reader():
+        for filename in filenames:
+            start = time.perf_counter()
+            try:
+                frame = _read_frame(os.path.join(folder, filename), as_array, file_infos)
+            except Exception as e:
+                frame = e
+            if not put((filename, frame, time.perf_counter() - start)):
+                return
+        put(_DONE)
+
+    reader_thread = threading.Thread(target=reader, daemon=True)
+    reader_thread.start()
+    try:
+        while True:
+            item = frame_queue.get()
+            if item is _DONE:
+                break
+            filename, frame, decode_seconds = item
+            if isinstance(frame, Exception) and not return_errors:
+                raise frame
+            if timed:
+                yield filename, frame, decode_seconds
+            else:
+                yield filename, frame
+    finally:
+        stop.set()
+        reader_thread.join()
+
+
+'''
+Background writer stage, the counterpart of iter_frames for outputs. Jobs (a function and its
+arguments, typically encoding and saving one output file) are handed to writer threads through a
+bounded queue, so compression and disk writes overlap with the processing of the next frames.
+When the queue is full, submit blocks until a writer frees a slot, which bounds the memory held
+by pending outputs.
+
+Finished jobs are collected on the calling thread with completed() (non-blocking), flush() (waits
+for every pending job) and close() (flush and stop the writer threads), as (key, result, error) where error is the exception raised by the
+job or None. Errors never stop the writers; the caller decides whether to report or re-raise them.
+
+    writer = FrameWriter(writers=2)
+    try:
+        for filename, frame in iter_frames(folder):
+            writer.submit(filename, save, frame, path)
+            for filename, result, error in writer.completed():
+                ...
+    finally:
+        for filename, result, error in writer.close():
+            ...
+
+Optional Parameters
+    -writers = Number of writer threads, default is 1. If 0, jobs run inline in submit
+    -max_pending = Maximum number of jobs waiting for a writer, default is 8
+'''
+class FrameWriter:
+    def __init__(self, writers=1, max_pending=8):
+        self.jobs = queue.Queue(maxsize=max(1, max_pending))
+        self.done = queue.Queue()
+        self.threads = [threading.Thread(target=self._work, daemon=True) for _ in range(writers)]
+        for thread in self.threads:
+            thread.start()
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is _DONE:
+                    return
+                self._run(*job)
+            finally:
+                self.jobs.task_done()
+
+    def _run(self, key, function, args, kwargs):
+        try:
+            self.done.put((key, function(*args, **kwargs), None))
+        except Exception as e:
+            self.done.put((key, None, e))
+
+    '''
+    Queue function(*args, **kwargs), key is returned with its result
+    '''
+    def submit(self, key, function, *args, **kwargs):
+        if not self.threads:
+            self._run(key, function, args, kwargs)
+        else:
+            self.jobs.put((key, function, args, kwargs))
+
+    '''
+    Yield the jobs finished so far as (key, result, error) without waiting
+    '''
+    def completed(self):
+        while True:
+            try:
+                yield self.done.get_nowait()
+            except queue.Empty:
+                return
+
+    '''
+    Wait for every pending job and return the finished jobs not collected yet
+    '''
+    def flush(self):
+        if self.threads:
+            self.jobs.join()
+        return list(self.completed())
+
+    '''
+    Wait for every pending job, stop the writer threads and return the finished jobs not collected yet
+    '''
+    def close(self):
+        for _ in self.threads:
+            self.jobs.put(_DONE)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        return list(self.completed())
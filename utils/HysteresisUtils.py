@@ -0,0 +1,219 @@
+import os
+import csv
+import numpy as np
+from PIL import Image
+from utils.OtsuUtils import otsu_grey_array
+from utils.FrameUtils import list_frames, file_content_hash
+from utils.MaskUtils import TIFF_MASK_FORMATS, MASK_STACK_NAME, MaskStackWriter, check_mask_format, mask_extension, save_mask
+
+'''
+Compute the smoothed gradient magnitude used by hysteresis thresholding.
+
+The image is smoothed with a Gaussian filter and the Sobel gradients are computed with two
+separable 1D passes each, all in float32.
+
+Required Parameters
+    -image_array = 2D numpy array holding the grayscale image values
+
+Optional Parameters
+    -sigma = standard deviation of the Gaussian smoothing, default is 1
+'''
+def gradient_magnitude(image_array, sigma=1):
+    from scipy.ndimage import gaussian_filter, correlate1d
+
+    image_array = np.asarray(image_array, dtype=np.float32)
+
+    # Smooth the image using Gaussian filter
+    smoothed_image = gaussian_filter(image_array, sigma=sigma, output=np.float32)
+
+    # Sobel operator as separable derivative [-1, 0, 1] and smoothing [1, 2, 1] passes,
+    # zero padded at the borders like convolve2d(mode='same')
+    derivative = np.array([-1, 0, 1], dtype=np.float32)
+    smoothing = np.array([1, 2, 1], dtype=np.float32)
+
+    gradient_x = correlate1d(smoothed_image, derivative, axis=1, output=np.float32, mode='constant')
+    gradient_x = correlate1d(gradient_x, smoothing, axis=0, output=np.float32, mode='constant')
+    gradient_y = correlate1d(smoothed_image, derivative, axis=0, output=np.float32, mode='constant')
+    gradient_y = correlate1d(gradient_y, smoothing, axis=1, output=np.float32, mode='constant')
+
+    # Compute gradient magnitude
+    return np.hypot(gradient_x, gradient_y)
+
+
+'''
+Apply hysteresis thresholding to a gradient magnitude array.
+
+Pixels above high_threshold are strong edges and pixels in [low_threshold, high_threshold] are
+weak edges. Strong and weak pixels are labeled into connected regions once, and every region that
+touches a strong pixel is kept.
+
+Required Parameters
+    -magnitude = 2D numpy array of gradient magnitudes (see gradient_magnitude)
+    -low_threshold = lower hysteresis threshold
+    -high_threshold = upper hysteresis threshold
+
+Optional Parameters
+    -connectivity = 4 or 8, pixel connectivity used when growing regions from strong edges,
+                    default is 8
+    -legacy = If True, reproduces the original behavior where a weak pixel is only kept when a
+              pixel in its 3x3 neighborhood is above low_threshold (no propagation from strong
+              edges and image borders are skipped), default is False
+
+Returns a uint8 mask with 255 for edge pixels and 0 elsewhere
+'''
+def hysteresis_mask(magnitude, low_threshold, high_threshold, connectivity=8, legacy=False):
+    from scipy.ndimage import maximum_filter, label
+
+    strong_edge = magnitude > high_threshold
+    weak_edge = (magnitude >= low_threshold) & (magnitude <= high_threshold)
+
+    if legacy:
+        # a weak pixel survives if anything in its 3x3 window is above the low threshold
+        adjacent_pixels = maximum_filter(magnitude, size=3) > low_threshold
+        keep = weak_edge & adjacent_pixels
+        keep[0, :] = False
+        keep[-1, :] = False
+        keep[:, 0] = False
+        keep[:, -1] = False
+        keep |= strong_edge
+    else:
+        if connectivity == 8:
+            structure = np.ones((3, 3), dtype=bool)
+        elif connectivity == 4:
+            structure = np.array([[0, 1, 0], [1, 1, 1], [0, 1, 0]], dtype=bool)
+        else:
+            raise ValueError(f'connectivity must be 4 or 8, got {connectivity}')
+
+        regions, num_regions = label(strong_edge | weak_edge, structure=structure)
+        # regions holding at least one strong pixel are kept, region 0 is the background
+        strong_regions = np.bincount(regions[strong_edge], minlength=num_regions + 1) > 0
+        strong_regions[0] = False
+        keep = strong_regions[regions]
+
+    return keep.astype(np.uint8) * np.uint8(255)
+
+
+'''
+Hysteresis thresholding of a grayscale image: Gaussian smoothing, Sobel gradient magnitude and
+hysteresis on the magnitude. See gradient_magnitude and hysteresis_mask for the parameters.
+'''
+def hysteresis_threshold(image_array, low_threshold, high_threshold, sigma=1, connectivity=8, legacy=False):
+    magnitude = gradient_magnitude(image_array, sigma=sigma)
+    return hysteresis_mask(magnitude, low_threshold, high_threshold, connectivity=connectivity, legacy=legacy)
+
+
+'''
+Gradient magnitude of an image file with a persistent on-disk cache.
+
+The smoothed gradient magnitude does not depend on the hysteresis thresholds, so it is computed
+once per image and saved as a float32 .npy file in cache_dir, keyed by the file content hash and
+sigma. Later calls (e.g. with other thresholds) memory-map the cached array instead of recomputing.
+The image is converted to grayscale the same way as in the 'HYST' mode of tiff_image_convert.
+
+Required Parameters
+    -input_image_path = string path to the image file
+    -cache_dir = string path to the cache folder, created if it does not exist
+
+Optional Parameters
+    -sigma = standard deviation of the Gaussian smoothing, default is 1
+'''
+def cached_gradient_magnitude(input_image_path, cache_dir, sigma=1):
+    cache_path = os.path.join(cache_dir, f'{file_content_hash(input_image_path)}_sigma{float(sigma)}.npy')
+    if os.path.exists(cache_path):
+        return np.load(cache_path, mmap_mode='r')
+
+    with Image.open(input_image_path) as image:
+        grey_array = otsu_grey_array(image)
+    magnitude = gradient_magnitude(grey_array, sigma=sigma)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # write to a temporary file first so an interrupted run never leaves a truncated cache entry
+    temp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file:
+        np.save(file, magnitude)
+    os.replace(temp_path, cache_path)
+    return magnitude
+
+
+'''
+Hysteresis parameter sweep over a folder of TIFFs.
+
+Every (low_threshold, high_threshold) pair of the grid low_thresholds x high_thresholds (pairs with
+low > high are skipped) is evaluated against the cached gradient magnitude of each image, so a
+sweep costs one gradient computation per image instead of one per parameter pair. The masks of
+each pair are saved to output_folder/HYST_{low}_{high}/ and a summary with the number of edge
+pixels per image and pair is written to output_folder/hysteresis_sweep.csv.
+
+Required Parameters
+    -input_folder = string path to the folder of TIFF images
+    -output_folder = string path to the output folder
+    -low_thresholds = list of low thresholds to try
+    -high_thresholds = list of high thresholds to try
+
+Optional Parameters
+    -cache_dir = Folder of the gradient magnitude cache, default is None which uses
+                 output_folder/.gradient_cache
+    -sigma = Gaussian sigma, default is 1
+    -connectivity = 4 or 8, default is 8
+    -legacy = If True, uses the original 3x3 neighborhood check, default is False
+    -saveImage = If True, the masks are saved, if False only the summary is written, default is True
+    -mask_format = Storage format of the masks, 'TIFF', 'TIFF_LZW', 'TIFF_DEFLATE', 'TIFF_1BIT',
+                   'TIFF_1BIT_DEFLATE' or 'STACK' which writes one HYST_{low}_{high}/masks.stack per
+                   pair (see MaskUtils), default is 'TIFF'
+
+Returns the summary rows as a list of [filename, low_threshold, high_threshold, edge_pixels]
+'''
+def hysteresis_sweep(input_folder, output_folder, low_thresholds, high_thresholds, cache_dir=None, sigma=1, connectivity=8, legacy=False, saveImage=True, mask_format='TIFF'):
+    check_mask_format(mask_format, TIFF_MASK_FORMATS + ('STACK',))
+    threshold_pairs = [(low, high) for low in low_thresholds for high in high_thresholds if low <= high]
+    if cache_dir is None:
+        cache_dir = os.path.join(output_folder, '.gradient_cache')
+
+    image_filenames = list_frames(input_folder, ('*.tiff', '*.TIFF'))
+    print(f'Grabbing images from: {input_folder}')
+    print(f'Saving images to: {output_folder}')
+    print(f'Evaluating {len(threshold_pairs)} threshold pairs')
+    if saveImage:
+        for low, high in threshold_pairs:
+            os.makedirs(os.path.join(output_folder, f'HYST_{low}_{high}'), exist_ok=True)
+    os.makedirs(output_folder, exist_ok=True)
+
+    stack_writers = {}
+    if saveImage and mask_format == 'STACK':
+        for low, high in threshold_pairs:
+            metadata = dict(method='HYST', params=dict(low_threshold=low, high_threshold=high, sigma=sigma, connectivity=connectivity, legacy_hyst=legacy))
+            stack_writers[low, high] = MaskStackWriter(os.path.join(output_folder, f'HYST_{low}_{high}', MASK_STACK_NAME), metadata=metadata)
+
+    summary = []
+    try:
+        idx = 1
+        for filename in image_filenames:
+            magnitude = cached_gradient_magnitude(os.path.join(input_folder, filename), cache_dir, sigma=sigma)
+            filename_no_ext = os.path.splitext(filename)[0]
+            for low, high in threshold_pairs:
+                output_image = hysteresis_mask(magnitude, low, high, connectivity=connectivity, legacy=legacy)
+                summary.append([filename, low, high, int(np.count_nonzero(output_image))])
+                if stack_writers:
+                    stack_writers[low, high].append(filename, output_image)
+                elif saveImage:
+                    save_mask(output_image, os.path.join(output_folder, f'HYST_{low}_{high}', filename_no_ext) + mask_extension(mask_format), mask_format)
+
+            if idx == 1:
+                print(f'Number of Images Processed : {idx}')
+            if idx % 50 == 0:
+                print(f'Number of Images Processed : {idx}')
+            idx += 1
+        for stack_writer in stack_writers.values():
+            stack_writer.close()
+    finally:
+        # discards partial stacks if the sweep stopped early
+        for stack_writer in stack_writers.values():
+            stack_writer.abort()
+
+    csv_path = os.path.join(output_folder, 'hysteresis_sweep.csv')
+    with open(csv_path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Filename', 'Low Threshold', 'High Threshold', 'Edge Pixels'])
+        writer.writerows(summary)
+    print(f'Data written to {csv_path}.')
+    return summary
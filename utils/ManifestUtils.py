@@ -0,0 +1,140 @@
+import os
+import json
+from utils.FrameUtils import file_content_hash
+
+# name of the manifest written in every output folder of an incremental run
+MANIFEST_NAME = 'manifest.jsonl'
+
+'''
+Content manifests for incremental, resumable folder conversion.
+
+Every converted file gets one JSON line in output_folder/manifest.jsonl recording the input path,
+its size, modification time and content hash, the method and parameters used and the output path.
+Lines are appended and flushed as soon as a file is done, so a run that crashes mid-folder resumes
+from the last finished file. On the next run, files whose input, method, parameters and output are
+unchanged are skipped.
+'''
+
+
+'''
+Load the manifest of an output folder as a dict of filename -> entry. Returns an empty dict if the
+folder has no manifest. A truncated last line (crash while writing) is ignored.
+'''
+def load_manifest(output_folder):
+    entries = {}
+    manifest_path = os.path.join(output_folder, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return entries
+    with open(manifest_path) as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            entries[entry['filename']] = entry
+    return entries
+
+
+'''
+Build the manifest entry of a converted file
+
+Required Parameters
+    -input_folder = string path to the input folder
+    -filename = name of the input file in input_folder
+    -file_info = dict of the size, mtime and hash of the input as it was read for the conversion
+                 (see FrameUtils.read_hashed and the file_infos of iter_frames)
+    -method = name of the conversion (e.g. 'BINARY', 'HYST', 'OTSU', 'RESIZE')
+    -params = dict of the parameters the output depends on
+    -output_path = string path to the output file, or None if nothing was saved
+
+Optional Parameters
+    -result = JSON serializable result to keep with the entry (e.g. the Otsu threshold), default is None
+'''
+def manifest_entry(input_folder, filename, file_info, method, params, output_path, result=None):
+    return {
+        'filename': filename,
+        'input': os.path.abspath(os.path.join(input_folder, filename)),
+        'size': file_info['size'],
+        'mtime': file_info['mtime'],
+        'hash': file_info['hash'],
+        'method': method,
+        'params': _normalize_params(params),
+        'output': None if output_path is None else os.path.abspath(output_path),
+        'result': result,
+    }
+
+
+'''
+Check whether a manifest entry is still up to date for an input file, i.e. the method and
+parameters match, the output exists and the input did not change. The input is only re-hashed when
+its size matches but its modification time changed, and a matching hash refreshes the entry's
+modification time in place.
+'''
+def manifest_up_to_date(entry, input_folder, filename, method, params):
+    if entry is None or entry.get('method') != method or entry.get('params') != _normalize_params(params):
+        return False
+    if entry.get('output') is not None and not os.path.exists(entry['output']):
+        return False
+
+    input_path = os.path.join(input_folder, filename)
+    try:
+        stat = os.stat(input_path)
+    except OSError:
+        return False
+    if stat.st_size != entry.get('size'):
+        return False
+    if stat.st_mtime_ns == entry.get('mtime'):
+        return True
+    # touched but maybe not modified
+    if file_content_hash(input_path) == entry.get('hash'):
+        entry['mtime'] = stat.st_mtime_ns
+        return True
+    return False
+
+
+'''
+Split a list of input filenames into the ones that need converting and the ones whose manifest
+entry is up to date. Returns (todo, skipped)
+'''
+def manifest_filter(manifest, input_folder, filenames, method, params):
+    todo = []
+    skipped = []
+    for filename in filenames:
+        if manifest_up_to_date(manifest.get(filename), input_folder, filename, method, params):
+            skipped.append(filename)
+        else:
+            todo.append(filename)
+    return todo, skipped
+
+
+'''
+Open the manifest of an output folder for appending entries
+'''
+def open_manifest(output_folder):
+    return open(os.path.join(output_folder, MANIFEST_NAME), mode='a')
+
+
+'''
+Append an entry to an open manifest and flush it so it survives a crash
+'''
+def write_manifest_entry(manifest_file, entry):
+    manifest_file.write(json.dumps(entry) + '\n')
+    manifest_file.flush()
+
+
+'''
+Rewrite the manifest with one line per file, dropping superseded entries. The new manifest is
+written to a temporary file first and swapped in, so a crash never loses the old one.
+'''
+def compact_manifest(output_folder, entries):
+    manifest_path = os.path.join(output_folder, MANIFEST_NAME)
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, mode='w') as file:
+        for filename in sorted(entries):
+            file.write(json.dumps(entries[filename]) + '\n')
+    os.replace(temp_path, manifest_path)
+
+
+def _normalize_params(params):
+    # compare parameters the way they come back from json (tuples become lists, numpy scalars plain numbers)
+    return json.loads(json.dumps(params, default=lambda value: value.item() if hasattr(value, 'item') else str(value)))
@@ -0,0 +1,255 @@
+import os
+import json
+import numpy as np
+from PIL import Image
+from utils.MetricsUtils import StageTimer, save_image
+
+'''
+Storage formats of binary masks.
+
+Masks are computed as uint8 arrays with values 0/255 and can be written as:
+
+    'TIFF'               8-bit uncompressed TIFF (the original format)
+    'TIFF_LZW'           8-bit LZW compressed TIFF
+    'TIFF_DEFLATE'       8-bit deflate compressed TIFF
+    'TIFF_1BIT'          1-bit (bilevel) uncompressed TIFF, 8x smaller than 'TIFF'
+    'TIFF_1BIT_DEFLATE'  1-bit deflate compressed TIFF, the smallest file per mask
+    'JPG'                8-bit JPEG, lossy, only accepted by tiff_binary_image_convert and
+                         tiff_binary_folder_convert
+    'STACK'              every mask of a folder bit-packed in one file (see MaskStackWriter)
+
+All TIFF formats are lossless and are read back with load_mask as the same 0/255 array.
+'''
+
+# name of the mask stack written in the output folder with mask_format='STACK'
+MASK_STACK_NAME = 'masks.stack'
+
+# extension and PIL save arguments of the single file formats, bilevel masks are saved in mode '1'
+MASK_FORMATS = {
+    'TIFF': dict(extension='.TIFF', bilevel=False, save_kwargs={}),
+    'TIFF_LZW': dict(extension='.TIFF', bilevel=False, save_kwargs=dict(compression='tiff_lzw')),
+    'TIFF_DEFLATE': dict(extension='.TIFF', bilevel=False, save_kwargs=dict(compression='tiff_adobe_deflate')),
+    'TIFF_1BIT': dict(extension='.TIFF', bilevel=True, save_kwargs={}),
+    'TIFF_1BIT_DEFLATE': dict(extension='.TIFF', bilevel=True, save_kwargs=dict(compression='tiff_adobe_deflate')),
+    'JPG': dict(extension='.jpg', bilevel=False, save_kwargs={}),
+}
+
+# lossless single file formats, the ones accepted by the thresholding functions
+TIFF_MASK_FORMATS = tuple(mask_format for mask_format in MASK_FORMATS if mask_format != 'JPG')
+
+# stack file layout: packed masks, then a JSON footer, then the footer length and magic
+_STACK_MAGIC = b'MSKSTK01'
+_STACK_TRAILER = 16
+
+
+'''
+Raise a ValueError if mask_format is not one of allowed (default is every format)
+'''
+def check_mask_format(mask_format, allowed=None):
+    if allowed is None:
+        allowed = tuple(MASK_FORMATS) + ('STACK',)
+    if mask_format not in allowed:
+        raise ValueError(f'Invalid mask_format: {mask_format}, expected one of {", ".join(allowed)}')
+
+
+'''
+File extension of the masks written in mask_format ('.TIFF' or '.jpg')
+'''
+def mask_extension(mask_format):
+    return MASK_FORMATS[mask_format]['extension']
+
+
+'''
+Save a 0/255 uint8 mask (or a PIL image of one) in one of the single file formats. The encode and
+write stages are added to timer when given
+'''
+def save_mask(mask, output_path, mask_format='TIFF', timer=None):
+    spec = MASK_FORMATS[mask_format]
+    if timer is None:
+        timer = StageTimer()
+    if spec['bilevel']:
+        with timer.stage('encode'):
+            mask = Image.fromarray(np.asarray(mask) > 0)
+    elif not isinstance(mask, Image.Image):
+        mask = Image.fromarray(mask)
+    save_image(mask, output_path, timer, **spec['save_kwargs'])
+
+
+'''
+Convert an opened mask image to a 0/255 uint8 array, whatever format it was saved in
+'''
+def mask_array(image):
+    array = np.array(image)
+    if array.dtype == bool:
+        return array.astype(np.uint8) * np.uint8(255)
+    return array
+
+
+'''
+Read a mask saved in any of the TIFF formats (or JPG) as a 0/255 uint8 array
+'''
+def load_mask(mask_path):
+    with Image.open(mask_path) as image:
+        return mask_array(image)
+
+
+'''
+Writes the masks of a folder into a single stack file. Every mask is bit-packed (8 pixels per byte,
+rows padded to whole bytes) and appended as one contiguous chunk, so the file is written in one
+streaming pass and any mask can later be read without touching the others. The filenames,
+thresholds and run parameters are kept in a JSON footer. The stack is written to a temporary file
+and moved in place by close(), so an interrupted run never leaves a truncated stack behind.
+
+    with MaskStackWriter(output_path, metadata=dict(method='BINARY')) as writer:
+        writer.append('00001.TIFF', mask, threshold=50)
+
+Required Parameters
+    -output_path = string path of the stack file
+
+Optional Parameters
+    -metadata = JSON serializable dict stored with the stack (e.g. method and parameters), default is None
+'''
+class MaskStackWriter:
+    def __init__(self, output_path, metadata=None):
+        self.output_path = output_path
+        self.temp_path = f'{output_path}.{os.getpid()}.tmp'
+        self.metadata = metadata or {}
+        self.filenames = []
+        self.thresholds = []
+        self.shape = None
+        self.file = open(self.temp_path, mode='wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    '''
+    Append one mask (0/255 array or boolean array) or a mask already packed with pack_mask
+    '''
+    def append(self, filename, mask, threshold=None, shape=None):
+        if shape is None:
+            mask = np.asarray(mask)
+            shape = mask.shape
+            packed = pack_mask(mask)
+        else:
+            packed = np.asarray(mask, dtype=np.uint8)
+        shape = tuple(int(size) for size in shape)
+        if self.shape is None:
+            self.shape = shape
+        elif shape != self.shape:
+            raise ValueError(f'{filename} has shape {shape}, the masks in this stack are {self.shape}')
+        self.file.write(packed.tobytes())
+        self.filenames.append(filename)
+        self.thresholds.append(None if threshold is None else float(threshold))
+
+    '''
+    Write the footer and move the stack in place. Returns the path of the stack
+    '''
+    def close(self):
+        if self.file is None:
+            return self.output_path
+        footer = json.dumps(dict(shape=self.shape or (0, 0), filenames=self.filenames,
+                                 thresholds=self.thresholds, metadata=self.metadata)).encode()
+        self.file.write(footer)
+        self.file.write(len(footer).to_bytes(8, 'little') + _STACK_MAGIC)
+        self.file.close()
+        self.file = None
+        os.replace(self.temp_path, self.output_path)
+        return self.output_path
+
+    '''
+    Discard the stack written so far
+    '''
+    def abort(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            os.remove(self.temp_path)
+
+
+'''
+Bit-pack a mask for MaskStackWriter.append, pixels greater than 0 are set. Lets worker processes
+send 8x less data back to the writer
+'''
+def pack_mask(mask):
+    return np.packbits(np.asarray(mask) > 0, axis=-1)
+
+
+'''
+Read-only view of a stack file written by MaskStackWriter. The packed masks are memory-mapped, so
+opening a stack is instant whatever its size and indexing reads only the requested masks.
+
+    stack = MaskStack('output_folders/Wilamette_BINARY_30/masks.stack')
+    len(stack), stack.shape, stack.filenames, stack.thresholds
+    stack[0]              ->  0/255 uint8 mask of the first frame
+    stack['00001.TIFF']   ->  same, by filename
+    stack[10:20]          ->  (10, height, width) masks
+    stack.packed[0]       ->  zero-copy view of the packed bits of the first frame
+
+A MaskStack can be pickled (only the path is sent), so it can be used directly from the worker
+processes of a training data loader.
+
+Required Parameters
+    -stack_path = string path of the stack file
+'''
+class MaskStack:
+    def __init__(self, stack_path):
+        self.stack_path = stack_path
+        with open(stack_path, mode='rb') as file:
+            file.seek(0, os.SEEK_END)
+            size = file.tell()
+            if size < _STACK_TRAILER:
+                raise ValueError(f'{stack_path} is not a mask stack')
+            file.seek(size - _STACK_TRAILER)
+            trailer = file.read(_STACK_TRAILER)
+            if trailer[8:] != _STACK_MAGIC:
+                raise ValueError(f'{stack_path} is not a mask stack')
+            footer_size = int.from_bytes(trailer[:8], 'little')
+            file.seek(size - _STACK_TRAILER - footer_size)
+            footer = json.loads(file.read(footer_size))
+        self.shape = tuple(footer['shape'])
+        self.filenames = footer['filenames']
+        self.thresholds = footer['thresholds']
+        self.metadata = footer['metadata']
+        self._index = {filename: idx for idx, filename in enumerate(self.filenames)}
+        self._packed = None
+
+    def __getstate__(self):
+        # the memmap is reopened in the receiving process
+        return dict(self.__dict__, _packed=None)
+
+    @property
+    def packed(self):
+        if self._packed is None:
+            height, width = self.shape
+            if self.filenames:
+                self._packed = np.memmap(self.stack_path, dtype=np.uint8, mode='r',
+                                         shape=(len(self.filenames), height, (width + 7) // 8))
+            else:
+                self._packed = np.zeros((0, height, (width + 7) // 8), dtype=np.uint8)
+        return self._packed
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def index(self, filename):
+        return self._index[filename]
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self._index[key]
+        masks = np.unpackbits(self.packed[key], axis=-1, count=self.shape[1])
+        return masks * np.uint8(255)
+
+    '''
+    Boolean mask of one frame (by index or filename), without the 0/255 scaling
+    '''
+    def bool_mask(self, key):
+        if isinstance(key, str):
+            key = self._index[key]
+        return np.unpackbits(self.packed[key], axis=-1, count=self.shape[1]).view(bool)
@@ -0,0 +1,153 @@
+import io
+import os
+import json
+import time
+from contextlib import contextmanager
+import numpy as np
+from PIL import Image
+
+'''
+Per-stage timing and progress events for the folder functions.
+
+Every processed file reports how long each stage took:
+
+    read       time the processing loop waited for the next decoded frame (disk and decode latency
+               not hidden by read-ahead)
+    decode     time spent opening and decoding the file (on the reader thread or worker process)
+    signature  comparing the frame with the previous ones in sequence mode (see SequenceCache)
+    grayscale  conversion of the frame to the array that is thresholded / processed
+    threshold  thresholding or filtering (binary, hysteresis, Otsu, resize, calibration, ...)
+    encode     encoding the output image in memory
+    write      writing the encoded bytes to the output folder
+
+Events are plain dicts passed to an optional progress callback and/or appended as JSON lines to a
+metrics file:
+
+    {'event': 'start', 'function': ..., 'total': number of files, 'time': unix time}
+    {'event': 'file', 'function': ..., 'index': 1-based, 'total': ..., 'filename': ..., 'seconds': ...,
+     'timings': {stage: seconds}, 'error': None or message}
+    {'event': 'summary', 'function': ..., 'files': ..., 'failed': ..., 'wall_seconds': ...,
+     'files_per_second': ..., 'stages': {stage: {'total', 'mean', 'p50', 'p90', 'p99', 'max'}}}
+'''
+
+STAGES = ('read', 'decode', 'signature', 'grayscale', 'threshold', 'encode', 'write')
+
+
+'''
+Accumulates the time spent in named stages while processing one file
+
+    timer = StageTimer()
+    with timer.stage('threshold'):
+        ...
+    timer.timings  ->  {'threshold': 0.0123}
+'''
+class StageTimer:
+    def __init__(self, timings=None):
+        self.timings = dict(timings) if timings else {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+
+'''
+Save a PIL image with the encode and write stages timed separately: the image is encoded into memory
+in the format given by the file extension, then the bytes are written to output_path. Extra keyword
+arguments are passed to Image.save.
+'''
+def save_image(image, output_path, timer, **save_kwargs):
+    with timer.stage('encode'):
+        extension = os.path.splitext(output_path)[1].lower()
+        image_format = Image.registered_extensions()[extension]
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format, **save_kwargs)
+    with timer.stage('write'):
+        with open(output_path, 'wb') as file:
+            file.write(buffer.getbuffer())
+
+
+'''
+Wrap a frame generator created with iter_frames(..., timed=True), yielding (filename, frame, timings)
+where timings holds the 'read' stage (time the caller waited for the frame) and the 'decode' stage
+'''
+def timed_frames(frames):
+    while True:
+        start = time.perf_counter()
+        try:
+            filename, frame, decode_seconds = next(frames)
+        except StopIteration:
+            return
+        yield filename, frame, dict(read=time.perf_counter() - start, decode=decode_seconds)
+
+
+'''
+Collects the per-file events of one folder run and forwards them to the progress callback and the
+JSON-lines metrics file. Does nothing beyond keeping the timings when neither is given.
+
+Required Parameters
+    -function = name of the folder function, included in every event
+    -total = number of files to process
+
+Optional Parameters
+    -progress = callable receiving every event dict, default is None
+    -metrics_path = path of a JSON-lines file the events are appended to, default is None
+'''
+class FolderMetrics:
+    def __init__(self, function, total, progress=None, metrics_path=None):
+        self.function = function
+        self.total = total
+        self.progress = progress
+        self.file = open(metrics_path, mode='a') if metrics_path is not None else None
+        self.stage_times = {stage: [] for stage in STAGES}
+        self.index = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+        self._emit(dict(event='start', function=function, total=total, time=time.time()))
+
+    def _emit(self, event):
+        if self.progress is not None:
+            self.progress(event)
+        if self.file is not None:
+            self.file.write(json.dumps(event) + '\n')
+            self.file.flush()
+
+    '''
+    Record a processed (or failed) file and emit its event
+    '''
+    def file_done(self, filename, timings, error=None):
+        self.index += 1
+        if error is not None:
+            self.failed += 1
+        for stage, seconds in timings.items():
+            self.stage_times.setdefault(stage, []).append(seconds)
+        self._emit(dict(event='file', function=self.function, index=self.index, total=self.total, filename=filename,
+                        seconds=sum(timings.values()), timings=timings, error=error))
+
+    '''
+    Emit the summary event with totals and percentiles per stage, close the metrics file and return
+    the summary
+    '''
+    def close(self):
+        wall_seconds = time.perf_counter() - self.start
+        stages = {}
+        for stage, times in self.stage_times.items():
+            if times:
+                times = np.array(times)
+                p50, p90, p99 = np.percentile(times, [50, 90, 99])
+                stages[stage] = dict(total=float(times.sum()), mean=float(times.mean()), p50=float(p50),
+                                     p90=float(p90), p99=float(p99), max=float(times.max()))
+        summary = dict(event='summary', function=self.function, files=self.index, failed=self.failed,
+                       wall_seconds=wall_seconds, files_per_second=self.index / wall_seconds if wall_seconds > 0 else None,
+                       stages=stages)
+        self._emit(summary)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        return summary
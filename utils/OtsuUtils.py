@@ -1,72 +1,33 @@
-import torch
-from torchvision import transforms
 from PIL import Image
-import os
 import numpy as np
-import matplotlib.pyplot as plt
-from skimage import data, color
-import sys
-import torchvision.transforms as transforms
+from utils.BinarizeUtils import binarize
+from utils.FrameUtils import iter_frames
 
 def otsu_threshold(input_image_path, plotHist=False, printThresh=True):
     with Image.open(input_image_path) as image:
-        # Convert the image to a PyTorch tensor
-        tiff = transforms.ToTensor()(image)
-        # Convert the RGB tensor to grayscale using torchvision's Grayscale transform
-        transform = transforms.Grayscale()
-        tiff_grey = transform(tiff)
-
-        # Convert to numpy array and get rid of 0th channel dimension
-        tiff_grey_numpy = tiff_grey[0].numpy()
-        tiff_grey_rounded = np.round(tiff_grey_numpy).astype(int)
-
-        # Create histogram 
-        hist, bins = np.histogram(tiff_grey_rounded.ravel(), bins=256, range=[0, 256])
-
-        if plotHist == True:
-            plt.figure(figsize=(8, 6))
-            plt.hist(tiff_grey_rounded.ravel(), bins=256, range=[0, 256], color='blue', alpha=0.7)
-            plt.title('Histogram of Rounded Grey TIFF Image')
-            plt.xlabel('Pixel Value')
-            plt.ylabel('Frequency')
-            plt.grid(True)
-            plt.show()
-
-        
-        # Compute probabilities
-        prob = hist.astype(np.float32) / np.sum(hist)
-
-        # Compute the cumulative sum 
-        cum_sum = np.cumsum(prob)
-        cum_mean = np.cumsum(prob * np.arange(256))
-        
-        # Compute the between-class variance
-        epsilon = np.finfo(float).eps  # Machine epsilon
-        valid_indices = np.logical_and(cum_sum > 0, cum_sum < 1)
-        between_class_variance = np.zeros_like(cum_mean)
-        between_class_variance[valid_indices] = (cum_mean[-1] * cum_sum[valid_indices] - cum_mean[valid_indices])**2 / (cum_sum[valid_indices] * (1 - cum_sum[valid_indices]) + epsilon)
-
-        # Compute the optimal threshold
-        optimal_threshold = np.argmax(between_class_variance)
-        if printThresh == True:
-            print(f'Optimal Threshold Found = {optimal_threshold}')
+        return otsu_threshold_image(image, plotHist=plotHist, printThresh=printThresh)
+
+
+'''
+Same as otsu_threshold, but takes an already opened PIL image instead of a file path
+'''
+def otsu_threshold_image(image, plotHist=False, printThresh=True):
+    tiff_grey_numpy = otsu_grey_array(image)
+
+    # Create histogram 
+    hist = otsu_histogram(tiff_grey_numpy)
+
+    if plotHist == True:
+        plot_otsu_histogram(hist, 'Histogram of Rounded Grey TIFF Image')
+
+    # Compute the optimal threshold
+    optimal_threshold = otsu_threshold_from_histogram(hist)
+    if printThresh == True:
+        print(f'Optimal Threshold Found = {optimal_threshold}')
   
-        # Binarize the image using the optimal threshold
-        #tiff_bin_image = (tiff_grey_numpy > optimal_threshold).astype(np.uint8)
-        
-        #index through image pixels
-        for i in range(tiff_grey_numpy.shape[0]):  # Iterate over rows
-            for j in range(tiff_grey_numpy.shape[1]):  # Iterate over columns
-                pixel = tiff_grey_numpy[i, j]  
-                # Binary thresholding
-                if pixel > optimal_threshold:
-                    tiff_grey_numpy[i, j] = 255  # Set pixel to white (255)
-                else:
-                    tiff_grey_numpy[i, j] = 0  # Set pixel to black (0)
-
-        
-        tiff_bin_image_final = Image.fromarray(tiff_grey_numpy.astype('uint8'))
-        
+    # Binarize the image using the optimal threshold
+    tiff_bin_image_final = Image.fromarray(binarize(tiff_grey_numpy, optimal_threshold))
+
     return tiff_bin_image_final, optimal_threshold
 
 
@@ -75,50 +36,235 @@ def otsu_threshold(input_image_path, plotHist=False, printThresh=True):
 def otsu_threshold_thermal(input_image_path, plotHist=False, printThresh=True):
     # Load the image and convert it to grayscale
     with Image.open(input_image_path) as image:
-        image_gray = image.convert("L")  # Convert to grayscale
-
-        # Convert to NumPy array
-        gray_array = np.array(image_gray, dtype=np.uint8)  
-
-        # Compute histogram
-        hist, bins = np.histogram(gray_array.ravel(), bins=256, range=[0, 256])
-
-        if plotHist:
-            plt.figure(figsize=(8, 6))
-            plt.hist(gray_array.ravel(), bins=256, range=[0, 256], color='blue', alpha=0.7)
-            plt.title('Histogram of Grayscale Thermal Image')
-            plt.xlabel('Pixel Value')
-            plt.ylabel('Frequency')
-            plt.grid(True)
-            plt.show()
-
-        # Compute probabilities
-        prob = hist.astype(np.float32) / np.sum(hist)
-
-        # Compute cumulative sum and mean
-        cum_sum = np.cumsum(prob)
-        cum_mean = np.cumsum(prob * np.arange(256))
-
-        # Compute between-class variance
-        epsilon = np.finfo(float).eps  # Machine epsilon to avoid division by zero
-        valid_indices = np.logical_and(cum_sum > 0, cum_sum < 1)
-        between_class_variance = np.zeros_like(cum_mean)
-        between_class_variance[valid_indices] = (
-            (cum_mean[-1] * cum_sum[valid_indices] - cum_mean[valid_indices]) ** 2 /
-            (cum_sum[valid_indices] * (1 - cum_sum[valid_indices]) + epsilon)
-        )
-
-        # Compute the optimal threshold
-        optimal_threshold = np.argmax(between_class_variance)
-        if printThresh:
-            print(f'Optimal Threshold Found = {optimal_threshold}')
+        return otsu_threshold_thermal_image(image, plotHist=plotHist, printThresh=printThresh)
 
-        # Apply threshold to binarize the image
-        binarized_image = (gray_array > optimal_threshold).astype(np.uint8) * 255
 
-        # Convert back to PIL image
-        binarized_image_pil = Image.fromarray(binarized_image)
+'''
+Same as otsu_threshold_thermal, but takes an already opened PIL image instead of a file path
+'''
+def otsu_threshold_thermal_image(image, plotHist=False, printThresh=True):
+    gray_array = otsu_grey_array(image, thermal_image=True)
+
+    # Compute histogram
+    hist = otsu_histogram(gray_array)
+
+    if plotHist:
+        plot_otsu_histogram(hist, 'Histogram of Grayscale Thermal Image')
+
+    # Compute the optimal threshold
+    optimal_threshold = otsu_threshold_from_histogram(hist)
+    if printThresh:
+        print(f'Optimal Threshold Found = {optimal_threshold}')
+
+    # Apply threshold to binarize the image
+    binarized_image = binarize(gray_array, optimal_threshold)
+
+    # Convert back to PIL image
+    binarized_image_pil = Image.fromarray(binarized_image)
 
     return binarized_image_pil, optimal_threshold
 
 
+'''
+Convert an opened PIL image to the grayscale array Otsu's method is computed on.
+
+Required Parameters
+    -image = opened PIL image
+
+Optional Parameters
+    -thermal_image = If True, the image is a thermal JPEG and is converted with PIL to 8-bit
+                     grayscale, if False (TIFF) the torchvision grayscale transform is used and the
+                     values are left unscaled, default is False
+'''
+def otsu_grey_array(image, thermal_image=False):
+    if thermal_image:
+        # Convert to grayscale
+        image_gray = image.convert("L")
+        return np.array(image_gray, dtype=np.uint8)
+
+    from torchvision import transforms
+
+    # Convert the image to a PyTorch tensor
+    tiff = transforms.ToTensor()(image)
+    # Convert the RGB tensor to grayscale using torchvision's Grayscale transform
+    transform = transforms.Grayscale()
+    tiff_grey = transform(tiff)
+
+    # Convert to numpy array and get rid of 0th channel dimension
+    return tiff_grey[0].numpy()
+
+
+'''
+Histogram of an image for Otsu's method, computed with np.bincount.
+
+Values are rounded to the nearest integer and counted in bins 0..bins-1. Like np.histogram with
+range=[0, bins], a rounded value equal to bins falls in the last bin and everything outside
+[0, bins] is ignored. Histograms of several images can be summed to get a dataset histogram.
+
+Required Parameters
+    -grey_array = numpy array of grayscale values (see otsu_grey_array)
+
+Optional Parameters
+    -bins = number of histogram bins, default is 256
+'''
+def otsu_histogram(grey_array, bins=256):
+    values = np.asarray(grey_array).ravel()
+
+    if np.issubdtype(values.dtype, np.integer):
+        if values.dtype.itemsize > 1 or bins < 256 or np.iinfo(values.dtype).min < 0:
+            values = values[(values >= 0) & (values <= bins)]
+    else:
+        values = np.round(values)
+        values = values[(values >= 0) & (values <= bins)]
+    values = values.astype(np.intp)
+
+    # the last bin is closed, so a value of exactly bins is counted in bin bins-1
+    np.minimum(values, bins - 1, out=values)
+    return np.bincount(values, minlength=bins)
+
+
+'''
+Find the Otsu threshold from a histogram alone (no image needed), by maximizing the between-class
+variance. The histogram can come from a single image or be the sum over a whole dataset.
+
+Required Parameters
+    -hist = 1D array of bin counts (see otsu_histogram)
+'''
+def otsu_threshold_from_histogram(hist):
+    hist = np.asarray(hist)
+
+    # Compute probabilities
+    prob = hist.astype(np.float32) / np.sum(hist)
+
+    # Compute the cumulative sum 
+    cum_sum = np.cumsum(prob)
+    cum_mean = np.cumsum(prob * np.arange(len(hist)))
+
+    # Compute the between-class variance
+    epsilon = np.finfo(float).eps  # Machine epsilon
+    valid_indices = np.logical_and(cum_sum > 0, cum_sum < 1)
+    between_class_variance = np.zeros_like(cum_mean)
+    between_class_variance[valid_indices] = (cum_mean[-1] * cum_sum[valid_indices] - cum_mean[valid_indices])**2 / (cum_sum[valid_indices] * (1 - cum_sum[valid_indices]) + epsilon)
+
+    # Compute the optimal threshold
+    return np.argmax(between_class_variance)
+
+
+'''
+Multi-level Otsu: find the num_classes - 1 thresholds that split a histogram into num_classes classes
+with the largest between-class variance.
+
+Maximizing the between-class variance is the same as maximizing the sum over classes of
+(sum of values)^2 / (pixel count), which only depends on the first and last bin of each class. The
+score of every possible class (bin i to bin j) is precomputed from prefix sums into a lookup table,
+then a dynamic program over the number of classes finds the best split in
+O(num_classes * bins^2) instead of the O(bins^(num_classes - 1)) of a brute-force search, so 3-6
+classes over 256 bins take milliseconds. num_classes=2 is solved by otsu_threshold_from_histogram, so
+the threshold is the same, also for empty or single bin histograms.
+
+Required Parameters
+    -hist = 1D array of bin counts (see otsu_histogram), from one image or summed over a dataset
+
+Optional Parameters
+    -num_classes = Number of classes, default is 3
+
+Returns the list of num_classes - 1 increasing thresholds as bin indices, a pixel in bin b belongs
+to class k when thresholds[k - 1] < b <= thresholds[k], like the single threshold used with binarize
+'''
+def otsu_multi_threshold_from_histogram(hist, num_classes=3):
+    hist = np.asarray(hist, dtype=np.float64)
+    bins = len(hist)
+    if num_classes < 2 or num_classes > bins:
+        raise ValueError(f'num_classes must be between 2 and the number of bins ({bins}), got {num_classes}')
+    if num_classes == 2:
+        return [int(otsu_threshold_from_histogram(hist))]
+
+    # prefix sums with a leading zero, the class (i, j) holds bins i..j-1
+    cum_count = np.concatenate(([0.0], np.cumsum(hist)))
+    cum_sum = np.concatenate(([0.0], np.cumsum(hist * np.arange(bins))))
+    count = cum_count[None, :] - cum_count[:, None]
+    total = cum_sum[None, :] - cum_sum[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = np.where(count > 0, total * total / count, 0.0)
+    # a class holds at least one bin
+    score[np.tril_indices(bins + 1)] = -np.inf
+
+    # best[j] is the best score of splitting bins 0..j-1 into k classes, starts with k = 1
+    best = score[0]
+    splits = []
+    for _ in range(num_classes - 1):
+        candidates = best[:, None] + score
+        split = np.argmax(candidates, axis=0)
+        best = candidates[split, np.arange(bins + 1)]
+        splits.append(split)
+
+    # walk back from the last bin, each split is the first bin of a class
+    thresholds = []
+    end = bins
+    for split in reversed(splits):
+        end = int(split[end])
+        thresholds.append(end - 1)
+    return thresholds[::-1]
+
+
+'''
+Plot a histogram computed with otsu_histogram
+'''
+def plot_otsu_histogram(hist, title):
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(8, 6))
+    plt.hist(np.arange(len(hist)), bins=len(hist), range=[0, len(hist)], weights=hist, color='blue', alpha=0.7)
+    plt.title(title)
+    plt.xlabel('Pixel Value')
+    plt.ylabel('Frequency')
+    plt.grid(True)
+    plt.show()
+
+
+'''
+Compute a single dataset-level Otsu threshold for a whole folder.
+
+The histograms of all frames are summed in one streaming pass (frames are read ahead on a
+background thread and never kept in memory) and Otsu's method is solved once on the total.
+Nothing is binarized or saved.
+
+Required Parameters
+    -input_folder = string path to the folder of images (TIFF, TIF, JPG or JPEG)
+
+Optional Parameters
+    -thermal_image = If True, the images are thermal JPEGs (see otsu_threshold_thermal), default is None
+    -plotHist = If True, the dataset histogram is plotted, default is False
+    -printThresh = If True, the dataset threshold is printed, default is True
+    -prefetch = Number of frames read ahead on a background thread, default is 4
+    -num_classes = Number of classes, default is 2. Above 2, the thresholds of the multi-level Otsu
+                   (see otsu_multi_threshold_from_histogram) are found on the dataset histogram
+
+Returns (optimal_threshold, hist) where hist is the summed dataset histogram. With num_classes > 2,
+optimal_threshold is the list of num_classes - 1 thresholds
+'''
+def otsu_folder_threshold(input_folder, thermal_image=None, plotHist=False, printThresh=True, prefetch=4, num_classes=2):
+    dataset_hist = np.zeros(256, dtype=np.int64)
+    idx = 1
+    pattern = ('*.tiff', '*.tif', '*.jpg', '*.jpeg')
+    for filename, image in iter_frames(input_folder, pattern, prefetch=prefetch, as_array=False, ignore_case=True):
+        dataset_hist += otsu_histogram(otsu_grey_array(image, thermal_image=thermal_image == True))
+
+        if idx == 1:
+            print(f'Number of Images Processed : {idx}')
+        if idx % 50 == 0:
+            print(f'Number of Images Processed : {idx}')
+        idx += 1
+
+    if plotHist:
+        plot_otsu_histogram(dataset_hist, 'Dataset Histogram')
+
+    if num_classes > 2:
+        optimal_threshold = otsu_multi_threshold_from_histogram(dataset_hist, num_classes)
+        if printThresh:
+            print(f'Dataset Optimal Thresholds Found = {optimal_threshold}')
+    else:
+        optimal_threshold = otsu_threshold_from_histogram(dataset_hist)
+        if printThresh:
+            print(f'Dataset Optimal Threshold Found = {optimal_threshold}')
+    return optimal_threshold, dataset_hist
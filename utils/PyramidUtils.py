@@ -0,0 +1,238 @@
+import os
+import numpy as np
+from utils.BinarizeUtils import binarize, threshold_mask
+from utils.ManifestUtils import load_manifest, manifest_up_to_date
+
+# a frame's pyramid is saved as <frame name without extension> + PYRAMID_EXTENSION
+PYRAMID_EXTENSION = '.pyramid.npz'
+
+'''
+Min/max pyramids for coarse-to-fine thresholding.
+
+Level 0 holds the minimum and maximum of every block_size x block_size block of a frame, every next
+level the minimum and maximum of 2x2 cells of the level below, up to a single cell holding the frame
+minimum and maximum. The reductions keep the extremes instead of averaging, so a cell decides a fixed
+threshold exactly:
+
+    max <= threshold    every pixel of the cell is 0 (cold)
+    min >  threshold    every pixel of the cell is 255 (hot)
+    otherwise           the cell crosses the mask boundary and only its pixels can tell
+
+A frame without fire is rejected from its top cell, and a mask only needs the full resolution pixels
+of the cells on the boundary. A cell holding a NaN is never cold nor hot, so its pixels are always
+thresholded like binarize does.
+'''
+
+
+def _no_fire(maximum, threshold):
+    # True where a maximum is not above threshold, a NaN maximum may hide fire
+    no_fire = ~threshold_mask(maximum, threshold)
+    if np.issubdtype(np.asarray(maximum).dtype, np.floating):
+        no_fire &= ~np.isnan(maximum)
+    return no_fire
+
+
+def _reduce_blocks(values, factor, function):
+    # function (np.minimum or np.maximum) over factor x factor blocks, the last row and column of
+    # blocks are partial when the size is not a multiple of factor
+    rows = np.arange(0, values.shape[0], factor)
+    cols = np.arange(0, values.shape[1], factor)
+    return function.reduceat(function.reduceat(values, rows, axis=0), cols, axis=1)
+
+
+'''
+Min/max pyramid of a frame, built with build_pyramid or read with load_pyramid.
+
+    pyramid.levels[level]  ->  (minimum, maximum) arrays of the cells of a level, in the frame dtype
+    pyramid.cell_size(level)  ->  side in pixels of the cells of a level
+    pyramid.min, pyramid.max  ->  frame minimum and maximum (the top cell)
+
+Required Parameters
+    -shape = (height, width) of the frame
+    -block_size = side in pixels of the cells of level 0
+    -levels = list of (minimum, maximum) arrays from level 0 to the top single cell
+'''
+class MinMaxPyramid:
+    def __init__(self, shape, block_size, levels):
+        self.shape = tuple(int(size) for size in shape)
+        self.block_size = int(block_size)
+        self.levels = levels
+
+    @property
+    def min(self):
+        return self.levels[-1][0][0, 0]
+
+    @property
+    def max(self):
+        return self.levels[-1][1][0, 0]
+
+    def cell_size(self, level):
+        return self.block_size * 2 ** level
+
+    '''
+    Level whose cells are cell_size pixels wide, the top level for cells larger than the frame.
+    Raises a ValueError if cell_size is not block_size times a power of 2
+    '''
+    def level(self, cell_size):
+        level = 0
+        while self.cell_size(level) < cell_size:
+            level += 1
+        if self.cell_size(level) != cell_size:
+            raise ValueError(f'cell_size must be {self.block_size} times a power of 2, got {cell_size}')
+        return min(level, len(self.levels) - 1)
+
+    '''
+    Boolean (cold, hot) arrays of the cells of a level for a threshold: cold cells have no pixel
+    above it, hot cells only pixels above it. The rest are on the mask boundary. rows and cols
+    (slices of cells) restrict it to a part of the level
+    '''
+    def classify(self, threshold, level=0, rows=slice(None), cols=slice(None)):
+        minimum, maximum = self.levels[level]
+        return _no_fire(maximum[rows, cols], threshold), threshold_mask(minimum[rows, cols], threshold)
+
+    '''
+    JSON serializable summary of the frame (shape, dtype, min, max), see pyramid_triage
+    '''
+    def summary(self):
+        return dict(shape=list(self.shape), dtype=str(self.levels[-1][1].dtype), min=self.min.item(), max=self.max.item())
+
+    '''
+    Save the pyramid as an uncompressed .npz file
+    '''
+    def save(self, output_path):
+        arrays = {}
+        for level, (minimum, maximum) in enumerate(self.levels):
+            arrays[f'min{level}'] = minimum
+            arrays[f'max{level}'] = maximum
+        with open(output_path, mode='wb') as file:
+            np.savez(file, shape=np.array(self.shape), block_size=np.array(self.block_size), **arrays)
+
+
+'''
+Build the min/max pyramid of a frame. Level 0 is computed in strips of rows, so a memory-mapped
+mosaic (see TiledUtils.open_tiff_array) is read once without being loaded whole.
+
+Required Parameters
+    -image_array = 2D array-like holding the frame values (e.g. degrees Celsius)
+
+Optional Parameters
+    -block_size = side in pixels of the cells of level 0, default is 8
+    -strip_rows = number of rows read at a time, rounded down to a multiple of block_size, default is 1024
+'''
+def build_pyramid(image_array, block_size=8, strip_rows=1024):
+    if len(image_array.shape) != 2:
+        raise ValueError(f'A pyramid needs a single band frame, got shape {image_array.shape}')
+    if block_size < 1:
+        raise ValueError(f'block_size must be positive, got {block_size}')
+    height, width = image_array.shape
+    strip_rows = max(block_size, strip_rows - strip_rows % block_size)
+
+    minimums = []
+    maximums = []
+    for y0 in range(0, height, strip_rows):
+        strip = np.asarray(image_array[y0:min(y0 + strip_rows, height)])
+        minimums.append(_reduce_blocks(strip, block_size, np.minimum))
+        maximums.append(_reduce_blocks(strip, block_size, np.maximum))
+    levels = [(np.concatenate(minimums), np.concatenate(maximums))]
+
+    while levels[-1][0].shape != (1, 1):
+        minimum, maximum = levels[-1]
+        levels.append((_reduce_blocks(minimum, 2, np.minimum), _reduce_blocks(maximum, 2, np.maximum)))
+    return MinMaxPyramid((height, width), block_size, levels)
+
+
+'''
+Read a pyramid saved with MinMaxPyramid.save
+'''
+def load_pyramid(pyramid_path):
+    with np.load(pyramid_path) as arrays:
+        num_levels = sum(1 for name in arrays.files if name.startswith('min'))
+        levels = [(arrays[f'min{level}'], arrays[f'max{level}']) for level in range(num_levels)]
+        return MinMaxPyramid(arrays['shape'], int(arrays['block_size']), levels)
+
+
+'''
+Path of the pyramid of an input file in a pyramid folder written by tiff_pyramid_images
+'''
+def pyramid_path(pyramid_folder, filename):
+    return os.path.join(pyramid_folder, os.path.splitext(filename)[0] + PYRAMID_EXTENSION)
+
+
+'''
+Coarse-to-fine binary thresholding: pixels strictly above threshold are 255 and the rest 0, the same
+mask as binarize. The cells of the pyramid level cell_size pixels wide are decided from their
+minimum and maximum, only the cells on the mask boundary are read and thresholded at full
+resolution. With a memory-mapped mosaic the cold and hot areas are never read.
+
+Required Parameters
+    -image_array = 2D array-like holding the frame values
+    -threshold = threshold value (in degrees Celsius for radiometric TIFFs)
+
+Optional Parameters
+    -pyramid = MinMaxPyramid of the frame, default is None which builds it (reading the whole frame)
+    -cell_size = side in pixels of the cells decided at once, a pyramid cell size, default is 64
+    -window = (y0, y1, x0, x1) bounds of the part of the frame to threshold, y0 and x0 multiples of
+              cell_size (e.g. a tile of tiff_tiled_convert), default is None which thresholds the whole frame
+
+Returns the uint8 mask of the frame (or of the window)
+'''
+def coarse_to_fine_mask(image_array, threshold, pyramid=None, cell_size=64, window=None):
+    if pyramid is None:
+        pyramid = build_pyramid(image_array, block_size=min(8, cell_size))
+    if tuple(image_array.shape) != pyramid.shape:
+        raise ValueError(f'The pyramid is for a frame of shape {pyramid.shape}, got {tuple(image_array.shape)}')
+    height, width = pyramid.shape
+    y0, y1, x0, x1 = (0, height, 0, width) if window is None else window
+    if y0 % cell_size or x0 % cell_size:
+        raise ValueError(f'The window must start on a multiple of cell_size {cell_size}, got {window}')
+
+    mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    if _no_fire(pyramid.max, threshold):
+        # no fire in the frame
+        return mask
+    row0, col0 = y0 // cell_size, x0 // cell_size
+    cold, hot = pyramid.classify(threshold, pyramid.level(cell_size), rows=slice(row0, -(-y1 // cell_size)), cols=slice(col0, -(-x1 // cell_size)))
+    for row, col in zip(*np.nonzero(~cold)):
+        # bounds of the cell in the frame, clipped to the window
+        cy0, cx0 = (row0 + row) * cell_size, (col0 + col) * cell_size
+        cy1, cx1 = min(cy0 + cell_size, y1), min(cx0 + cell_size, x1)
+        cell_mask = mask[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0]
+        if hot[row, col]:
+            cell_mask[...] = 255
+        else:
+            binarize(np.asarray(image_array[cy0:cy1, cx0:cx1]), threshold, out=cell_mask)
+    return mask
+
+
+'''
+Sort the frames of a folder by whether they can hold fire, from the pyramid folder written by
+tiff_pyramid_images and without opening the frames. Only the manifest of the pyramid folder is read,
+so every frame costs a dictionary lookup and a stat of its file.
+
+Required Parameters
+    -input_folder = string path to the folder of frames
+    -pyramid_folder = string path to the pyramid folder of input_folder
+    -threshold = fire threshold (in degrees Celsius for radiometric TIFFs), pixels strictly above it are fire
+
+Optional Parameters
+    -filenames = frames to sort, default is None which takes every frame with a pyramid
+
+Returns (fire, no_fire, unknown) lists of filenames, unknown are the frames without an up-to-date pyramid
+'''
+def pyramid_triage(input_folder, pyramid_folder, threshold, filenames=None):
+    manifest = load_manifest(pyramid_folder)
+    if filenames is None:
+        filenames = sorted(manifest)
+
+    fire = []
+    no_fire = []
+    unknown = []
+    for filename in filenames:
+        entry = manifest.get(filename)
+        if entry is None or entry.get('result') is None or not manifest_up_to_date(entry, input_folder, filename, 'PYRAMID', entry['params']):
+            unknown.append(filename)
+        elif _no_fire(np.array(entry['result']['max'], dtype=entry['result']['dtype']), threshold):
+            no_fire.append(filename)
+        else:
+            fire.append(filename)
+    return fire, no_fire, unknown
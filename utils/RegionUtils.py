@@ -0,0 +1,241 @@
+import os
+import csv
+import numpy as np
+from PIL import Image
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from utils.FrameUtils import list_frames
+from utils.MaskUtils import MASK_STACK_NAME, MaskStack, mask_array
+
+# storage formats of the region tables written by region_folder_stats
+REGION_TABLE_FORMATS = ('CSV', 'NPZ')
+
+'''
+Per fire region statistics of thresholded masks and label images.
+
+A fire region is a connected group of fire pixels (mask > 0). Each frame is labeled once with
+scipy.ndimage.label, then the fire pixels are sorted by region once and every statistic is one
+reduceat over the contiguous pixels of each region (np.bincount for the class histograms), so the
+cost does not grow with the number of regions.
+'''
+
+
+'''
+Label the connected fire regions of a mask (0/255 mask, boolean mask or label image, every pixel
+above 0 is fire).
+
+Optional Parameters
+    -connectivity = 4 or 8, default is 8
+
+Returns (regions, num_regions) where regions is an int32 image with 0 for the background and the
+regions numbered from 1 in the raster order of their first pixel
+'''
+def label_regions(fire_mask, connectivity=8):
+    from scipy.ndimage import label
+
+    if connectivity == 8:
+        structure = np.ones((3, 3), dtype=bool)
+    elif connectivity == 4:
+        structure = np.array([[0, 1, 0], [1, 1, 1], [0, 1, 0]], dtype=bool)
+    else:
+        raise ValueError(f'connectivity must be 4 or 8, got {connectivity}')
+    return label(np.asarray(fire_mask) > 0, structure=structure)
+
+
+'''
+Statistics of every fire region of a frame, as a table of columns (dict of numpy arrays, one entry
+per region):
+
+    region                      region number in the returned label image
+    area                        number of pixels
+    min_temp, max_temp          extremes of the TIFF values, in the TIFF dtype
+    mean_temp                   mean of the TIFF values, in float64
+    centroid_row, centroid_col  mean pixel position
+    row_min, row_max,           bounding box, inclusive
+    col_min, col_max
+    class_1 ... class_<n>       pixels of every class of class_labels (only with class_labels)
+
+Required Parameters
+    -tiff_values = 2D array of the frame values (degrees Celsius for radiometric TIFFs)
+    -fire_mask = 2D mask of the same shape, pixels above 0 are fire (e.g. a tiff_folder_convert mask
+                 or a labelTiff label image)
+
+Optional Parameters
+    -class_labels = 2D label image (0 - num_classes) of the same shape, e.g. from labelTiff or
+                    labelFolder, counted per region, default is None
+    -num_classes = number of classes of class_labels, default is None which uses its largest label
+    -connectivity = 4 or 8, default is 8
+
+Returns (stats, regions) with the table and the label image of the regions
+'''
+def region_stats(tiff_values, fire_mask, class_labels=None, num_classes=None, connectivity=8):
+    tiff_values = np.asarray(tiff_values)
+    if tiff_values.shape != np.shape(fire_mask):
+        raise ValueError(f'The TIFF has shape {tiff_values.shape} and the mask {np.shape(fire_mask)}')
+    regions, num_regions = label_regions(fire_mask, connectivity=connectivity)
+    width = regions.shape[1]
+
+    # fire pixels grouped by region, a stable sort keeps them in raster order inside a region
+    flat_regions = regions.ravel()
+    pixels = np.flatnonzero(flat_regions)
+    region_ids = flat_regions[pixels]
+    if num_regions <= np.iinfo(np.uint16).max:
+        # numpy sorts 16-bit keys with a stable radix sort, 3x faster than on int32
+        region_ids = region_ids.astype(np.uint16)
+    order = np.argsort(region_ids, kind='stable')
+    pixels = pixels[order]
+    region_ids = region_ids[order]
+    # first pixel of every region, regions are numbered 1..num_regions without gaps
+    starts = np.searchsorted(region_ids, np.arange(1, num_regions + 1))
+    ends = np.append(starts[1:], len(pixels)) - 1
+
+    values = tiff_values.ravel()[pixels]
+    rows, cols = np.divmod(pixels, width)
+    area = ends - starts + 1
+    stats = dict(region=np.arange(1, num_regions + 1), area=area)
+    if num_regions == 0:
+        stats.update(min_temp=values[:0], max_temp=values[:0], mean_temp=np.zeros(0),
+                     centroid_row=np.zeros(0), centroid_col=np.zeros(0),
+                     row_min=rows[:0], row_max=rows[:0], col_min=cols[:0], col_max=cols[:0])
+    else:
+        # the pixels of a region are contiguous, so every statistic is a reduceat over the regions
+        stats.update(
+            min_temp=np.minimum.reduceat(values, starts),
+            max_temp=np.maximum.reduceat(values, starts),
+            mean_temp=np.add.reduceat(values, starts, dtype=np.float64) / area,
+            centroid_row=np.add.reduceat(rows, starts) / area,
+            centroid_col=np.add.reduceat(cols, starts) / area,
+            # rows are sorted inside a region, so the first and last pixels hold the row extremes
+            row_min=rows[starts],
+            row_max=rows[ends],
+            col_min=np.minimum.reduceat(cols, starts),
+            col_max=np.maximum.reduceat(cols, starts),
+        )
+
+    if class_labels is not None:
+        class_labels = np.asarray(class_labels)
+        if class_labels.shape != regions.shape:
+            raise ValueError(f'The class labels have shape {class_labels.shape} and the mask {regions.shape}')
+        classes = class_labels.ravel()[pixels].astype(np.int64)
+        if num_classes is None:
+            num_classes = int(class_labels.max()) if class_labels.size else 0
+        # pixels of class 0 (or above num_classes) are not counted
+        counted = (classes >= 1) & (classes <= num_classes)
+        class_counts = np.bincount((region_ids[counted].astype(np.int64) - 1) * num_classes + classes[counted] - 1,
+                                   minlength=num_regions * num_classes).reshape(num_regions, num_classes)
+        for class_id in range(1, num_classes + 1):
+            stats[f'class_{class_id}'] = class_counts[:, class_id - 1]
+    return stats, regions
+
+
+def _region_file(filename, tiff_folder, mask_folder, class_folder, num_classes, connectivity, mask_stack):
+    # one frame of region_folder_stats, returns (filename, stats, error)
+    try:
+        with Image.open(os.path.join(tiff_folder, filename)) as tiff:
+            tiff_values = np.array(tiff)
+        if mask_stack is not None:
+            fire_mask = mask_stack.bool_mask(filename)
+        else:
+            with Image.open(os.path.join(mask_folder, filename)) as mask:
+                fire_mask = mask_array(mask)
+        class_labels = None
+        if class_folder is not None:
+            # label PNGs of labelFolder
+            with Image.open(os.path.join(class_folder, f'{os.path.splitext(filename)[0]}.png')) as labels:
+                class_labels = np.array(labels)
+        stats, _ = region_stats(tiff_values, fire_mask, class_labels=class_labels, num_classes=num_classes, connectivity=connectivity)
+        return filename, stats, None
+    except Exception as e:
+        return filename, None, f'{type(e).__name__}: {e}'
+
+
+'''
+Region statistics of a whole folder (a flight) in one table, one row per fire region with the
+filename of its frame in front of the region_stats columns. Frames are processed in parallel across
+processes and the rows are in sorted filename order.
+
+Required Parameters
+    -tiff_folder = string path to the folder of raw TIFFs
+    -mask_folder = string path to the folder of masks named like the TIFFs (any TIFF mask format), or
+                   to an output folder of tiff_folder_convert holding a masks.stack
+    -output_path = string path of the table file
+
+Optional Parameters
+    -class_folder = string path to the label PNGs of labelFolder, counted per region, default is None
+    -num_classes = number of classes of the label PNGs, required with class_folder, default is None
+    -connectivity = 4 or 8, default is 8
+    -table_format = 'CSV', or 'NPZ' which saves every column as an array of an uncompressed .npz
+                    (read back with np.load), default is 'CSV'
+    -workers = Number of processes, default is 1. None uses every available core
+    -chunksize = Number of files sent to a worker process at a time, default is None which splits
+                 the folder into roughly 4 chunks per worker
+
+Returns (table, failed_files) with the table as a dict of columns and a list of (filename, error)
+pairs for the frames that failed
+'''
+def region_folder_stats(tiff_folder, mask_folder, output_path, class_folder=None, num_classes=None, connectivity=8, table_format='CSV', workers=1, chunksize=None):
+    if table_format not in REGION_TABLE_FORMATS:
+        raise ValueError(f'Invalid table_format: {table_format}, expected one of {", ".join(REGION_TABLE_FORMATS)}')
+    if class_folder is not None and num_classes is None:
+        raise ValueError('num_classes is required with class_folder, every frame needs the same class columns')
+    print(f'Grabbing images from: {tiff_folder} and {mask_folder}')
+
+    mask_stack = None
+    if os.path.exists(os.path.join(mask_folder, MASK_STACK_NAME)):
+        mask_stack = MaskStack(os.path.join(mask_folder, MASK_STACK_NAME))
+        filenames = sorted(mask_stack.filenames)
+    else:
+        filenames = list_frames(mask_folder, ('*.tiff', '*.tif'), ignore_case=True)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    region_file = partial(_region_file, tiff_folder=tiff_folder, mask_folder=mask_folder, class_folder=class_folder,
+                         num_classes=num_classes, connectivity=connectivity, mask_stack=mask_stack)
+    executor = None
+    if workers > 1 and len(filenames) > 1:
+        if chunksize is None:
+            chunksize = max(1, len(filenames) // (workers * 4))
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(region_file, filenames, chunksize=chunksize)
+    else:
+        results = map(region_file, filenames)
+
+    frame_filenames = []
+    frame_stats = []
+    failed_files = []
+    idx = 1
+    try:
+        for filename, stats, error in results:
+            if error is not None:
+                print(f'Failed to analyze {filename}: {error}')
+                failed_files.append((filename, error))
+            else:
+                frame_filenames.append(np.full(len(stats['region']), filename))
+                frame_stats.append(stats)
+
+            if idx == 1:
+                print(f'Number of Images Processed : {idx}')
+            if idx % 50 == 0:
+                print(f'Number of Images Processed : {idx}')
+            idx += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if frame_stats:
+        table = dict(filename=np.concatenate(frame_filenames))
+        for column in frame_stats[0]:
+            table[column] = np.concatenate([stats[column] for stats in frame_stats])
+    else:
+        table = dict(filename=np.zeros(0, dtype=str))
+
+    if table_format == 'NPZ':
+        with open(output_path, mode='wb') as file:
+            np.savez(file, **table)
+    else:
+        with open(output_path, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(list(table))
+            writer.writerows(zip(*(column.tolist() for column in table.values())))
+    print(f'{len(table["filename"])} regions of {len(frame_stats)} images written to {output_path}.')
+    return table, failed_files
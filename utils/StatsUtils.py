@@ -0,0 +1,193 @@
+import os
+import json
+import hashlib
+import numpy as np
+from PIL import Image
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from utils.FrameUtils import list_frames, iter_frames
+
+# name of the stats cache written next to the TIFFs
+STATS_CACHE_NAME = '.tiff_stats.json'
+
+'''
+Dataset statistics of a folder of radiometric TIFFs, computed in one streaming pass.
+
+Every file is reduced to a small partial result (pixel count, mean, sum of squared deviations,
+min, max and a fixed-bin histogram) and the partial results are merged, so files can be processed
+in any order and in parallel. The merged statistics are cached in a sidecar JSON file keyed by the
+folder contents (filenames, sizes and modification times) and the histogram settings.
+'''
+
+
+def _frame_stats(image_array, bins, hist_range):
+    # partial statistics of one frame, non-finite pixels are ignored
+    values = np.asarray(image_array)
+    if not np.issubdtype(values.dtype, np.floating):
+        values = values.astype(np.float64)
+    finite = np.isfinite(values)
+    if not finite.all():
+        values = values[finite]
+    values = values.ravel()
+
+    count = values.size
+    hist, _ = np.histogram(values, bins=bins, range=hist_range)
+    if count == 0:
+        return dict(count=0, mean=0.0, m2=0.0, min=None, max=None, hist=hist, below=0, above=0)
+
+    mean = float(np.mean(values, dtype=np.float64))
+    # squared deviations from the frame's own mean, merged with Chan's formula in _merge_stats
+    m2 = float(np.sum(np.square(values - mean, dtype=np.float64)))
+    return dict(count=count, mean=mean, m2=m2, min=float(np.min(values)), max=float(np.max(values)), hist=hist,
+                below=int(np.count_nonzero(values < hist_range[0])), above=int(np.count_nonzero(values > hist_range[1])))
+
+
+def _merge_stats(total, part):
+    # combine two partial results, numerically stable for large pixel counts
+    if part['count'] == 0:
+        total['hist'] = total['hist'] + part['hist']
+        return total
+    if total['count'] == 0:
+        return dict(part)
+
+    count = total['count'] + part['count']
+    delta = part['mean'] - total['mean']
+    return dict(count=count,
+                mean=total['mean'] + delta * part['count'] / count,
+                m2=total['m2'] + part['m2'] + delta * delta * total['count'] * part['count'] / count,
+                min=min(total['min'], part['min']),
+                max=max(total['max'], part['max']),
+                hist=total['hist'] + part['hist'],
+                below=total['below'] + part['below'],
+                above=total['above'] + part['above'])
+
+
+def _file_stats(filename, input_folder, bins, hist_range):
+    # task run by each worker process of tiff_dataset_stats
+    try:
+        with Image.open(os.path.join(input_folder, filename)) as image:
+            return filename, _frame_stats(np.array(image), bins, hist_range), None
+    except Exception as e:
+        return filename, None, f'{type(e).__name__}: {e}'
+
+
+'''
+Key of the stats cache, changes whenever a file is added, removed or modified or the histogram
+settings change
+'''
+def _stats_cache_key(input_folder, filenames, bins, hist_range):
+    sha = hashlib.sha1()
+    sha.update(json.dumps([bins, list(hist_range)]).encode())
+    for filename in filenames:
+        stat = os.stat(os.path.join(input_folder, filename))
+        sha.update(f'{filename}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode())
+    return sha.hexdigest()
+
+
+def _load_stats_cache(cache_path, key):
+    try:
+        with open(cache_path) as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if cache.get('key') != key:
+        return None
+    stats = cache['stats']
+    stats['hist'] = np.array(stats['hist'], dtype=np.int64)
+    stats['bin_edges'] = np.array(stats['bin_edges'])
+    return stats
+
+
+def _save_stats_cache(cache_path, key, stats):
+    cached = dict(stats, hist=stats['hist'].tolist(), bin_edges=stats['bin_edges'].tolist())
+    temp_path = f'{cache_path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, mode='w') as file:
+            json.dump(dict(key=key, stats=cached), file)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        # a read-only dataset folder only loses the cache
+        print(f'Could not write stats cache {cache_path}: {e}')
+
+
+'''
+Compute min, max, mean, standard deviation, a fixed-bin histogram and per-file extrema of every TIFF
+in a folder in one streaming pass, optionally in parallel. The result is cached in a sidecar file so
+repeated queries on an unchanged folder return instantly.
+
+Required Parameters
+    -input_folder = string path to the folder of TIFF images
+
+Optional Parameters
+    -bins = Number of histogram bins, default is 500
+    -hist_range = (low, high) range covered by the histogram, default is (0, 500) (in degrees
+                  Celsius). Pixels outside are counted in 'below' and 'above' instead
+    -workers = Number of processes, default is 1 (sequential). None uses every available core
+    -chunksize = Number of files sent to a worker process at a time, default is None which splits
+                 the folder into roughly 4 chunks per worker
+    -prefetch = Number of frames read ahead on a background thread when running sequentially,
+                default is 4
+    -use_cache = If True, the cache is read and written, default is True
+    -cache_path = Path of the cache file, default is None which uses input_folder/.tiff_stats.json
+
+Returns a dict with 'count', 'min', 'max', 'mean', 'std', 'hist', 'bin_edges', 'below', 'above',
+'files' ({filename: [min, max]}) and 'failed' (list of [filename, error])
+'''
+def tiff_dataset_stats(input_folder, bins=500, hist_range=(0, 500), workers=1, chunksize=None, prefetch=4, use_cache=True, cache_path=None):
+    filenames = list_frames(input_folder, ('*.tiff', '*.tif'), ignore_case=True)
+    if cache_path is None:
+        cache_path = os.path.join(input_folder, STATS_CACHE_NAME)
+    hist_range = (float(hist_range[0]), float(hist_range[1]))
+
+    key = None
+    if use_cache:
+        key = _stats_cache_key(input_folder, filenames, bins, hist_range)
+        stats = _load_stats_cache(cache_path, key)
+        if stats is not None:
+            print(f'Loaded statistics of {len(filenames)} images from {cache_path}')
+            return stats
+
+    print(f'Computing statistics of {len(filenames)} images in {input_folder}')
+    if workers is None:
+        workers = os.cpu_count() or 1
+    executor = None
+    if workers > 1 and len(filenames) > 1:
+        if chunksize is None:
+            chunksize = max(1, len(filenames) // (workers * 4))
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(partial(_file_stats, input_folder=input_folder, bins=bins, hist_range=hist_range), filenames, chunksize=chunksize)
+    else:
+        frames = iter_frames(input_folder, prefetch=prefetch, return_errors=True, filenames=filenames)
+        results = ((filename, None, f'{type(frame).__name__}: {frame}') if isinstance(frame, Exception)
+                   else (filename, _frame_stats(frame, bins, hist_range), None) for filename, frame in frames)
+
+    total = dict(count=0, mean=0.0, m2=0.0, min=None, max=None, hist=np.zeros(bins, dtype=np.int64), below=0, above=0)
+    files = {}
+    failed = []
+    try:
+        idx = 1
+        for filename, part, error in results:
+            if error is not None:
+                print(f'Failed to read {filename}: {error}')
+                failed.append([filename, error])
+            else:
+                total = _merge_stats(total, part)
+                files[filename] = [part['min'], part['max']]
+
+            if idx == 1:
+                print(f'Number of Images Processed : {idx}')
+            if idx % 50 == 0:
+                print(f'Number of Images Processed : {idx}')
+            idx += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    stats = dict(count=total['count'], min=total['min'], max=total['max'], mean=total['mean'] if total['count'] else None,
+                 std=float(np.sqrt(total['m2'] / total['count'])) if total['count'] else None,
+                 hist=total['hist'].astype(np.int64), bin_edges=np.linspace(hist_range[0], hist_range[1], bins + 1),
+                 below=total['below'], above=total['above'], files=files, failed=failed)
+    # a failed read may be temporary, only complete results are cached
+    if use_cache and not failed:
+        _save_stats_cache(cache_path, key, stats)
+    return stats
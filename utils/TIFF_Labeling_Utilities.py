@@ -1,59 +1,56 @@
+import os
+import csv
 import numpy as np
 from PIL import Image
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
+from functools import partial, lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from utils.FrameUtils import list_frames
+from utils.MaskUtils import mask_array
+from utils.OtsuUtils import otsu_multi_threshold_from_histogram
+
+# ways of splitting the fire values into classes, see classBoundaries
+BOUNDARY_METHODS = ('RANGE', 'OTSU')
 
 def rangeLabel(tiffSampleArray, fireBoundaries, fire_rows, fire_cols, fire_values, height, width, labelTolerance=0.3):
-    labels = []
     tolerance = labelTolerance
-    # Go through each fire region value and label
-    for val in fire_values:
-        labeled = False
-        for i in range(len(fireBoundaries) - 1):
-            lowerBound = fireBoundaries[i]
-            upperBound = fireBoundaries[i + 1]
-
-            # For the last boundary, include the upper bound + a tolerance
-            if i == len(fireBoundaries) - 2:
-                if lowerBound <= val <= (upperBound + tolerance):
-                    labels.append(i + 1)
-                    labeled = True
-                    break
-            # For all other boundaries, exclude the upper bound
-            else:
-                if (lowerBound-tolerance) <= val < upperBound:
-                    labels.append(i + 1)
-                    labeled = True
-                    break 
-        
-        if not labeled:
-            #labels.append(0)
-            print(f'Value {val} was not labeled within the boundaries!')
-            
-    # modify the original array with the label
-    for row, col, label  in zip(fire_rows, fire_cols, labels):
-        if label > len(fireBoundaries) - 1 or label < 0:  # Ensure no label exceeds number of classes
-            print(f'Error: Label {label} for pixel ({row}, {col}) exceeds the number of classes!')
-            #label = 0
-        tiffSampleArray[row, col] = label
-        #print(f'LABEL FOR ({row}, {col}) = {label}')
-        
-          
-    # assign all non labeled pixels to be 0 (background)
-    # Create all possible indices
-    all_indices = {(r, c) for r in range(height) for c in range(width)}
+    fire_rows = np.asarray(fire_rows, dtype=np.intp)
+    fire_cols = np.asarray(fire_cols, dtype=np.intp)
+    fire_values = np.asarray(fire_values)
+    # compare in float64 against the exact boundary values, like comparing one numpy scalar at a time
+    values = fire_values.astype(np.float64)
 
-    # Create the set of fire indices
-    fire_indices = set(zip(fire_rows, fire_cols))
+    # Assign every fire region value to a class, class i + 1 covers [lowerBound - tolerance, upperBound)
+    labels = np.zeros(len(values), dtype=np.int64)
+    for i in range(len(fireBoundaries) - 1):
+        lowerBound = fireBoundaries[i]
+        upperBound = fireBoundaries[i + 1]
 
-    # Find the indices that are not in fire_indices
-    non_fire_indices = all_indices - fire_indices
+        # For the last boundary, include the upper bound + a tolerance
+        if i == len(fireBoundaries) - 2:
+            in_class = (values >= np.float64(lowerBound)) & (values <= np.float64(upperBound + tolerance))
+        # For all other boundaries, exclude the upper bound
+        else:
+            in_class = (values >= np.float64(lowerBound - tolerance)) & (values < np.float64(upperBound))
+        # the classes overlap by the tolerance, the first matching class wins
+        in_class &= labels == 0
+        labels[in_class] = i + 1
+
+    labeled = labels > 0
+    for val in fire_values[~labeled]:
+        print(f'Value {val} was not labeled within the boundaries!')
+    # unlabeled values are dropped from the label list, so the labels are paired with the fire
+    # pixels in order like before
+    labels = labels[labeled]
+
+    # modify the original array with the label
+    tiffSampleArray[fire_rows[:len(labels)], fire_cols[:len(labels)]] = labels
+
+    # assign all non labeled pixels to be 0 (background)
+    background = np.zeros(tiffSampleArray.shape[:2], dtype=bool)
+    background[:height, :width] = True
+    background[fire_rows, fire_cols] = False
+    tiffSampleArray[background] = 0
 
-    # Label non-fire indices as 0 (background)
-    for row, col in non_fire_indices:
-        tiffSampleArray[row, col] = 0
-    
-    
     return tiffSampleArray
     
 
@@ -72,8 +69,61 @@ def divideRange(fireValues, num_classes, decimal_places=14, verbose=False):
         print(f'FIRE INTERVAL = {intervalFire}')
     boundaries = [round(minFire + i * intervalFire, decimal_places) for i in range(num_classes + 1)]
     return boundaries
-    
-def labelTiff(tiffSamplePath, tiffBinaryPath, num_classes, height, width, labelTolerance=0.3, verbose=False):
+
+
+'''
+Histogram of fire values over [minFire, maxFire] for otsuBoundaries. Histograms of several frames
+computed over the same range can be summed to get a dataset histogram
+'''
+def fireHistogram(fireValues, minFire, maxFire, bins=256):
+    hist, _ = np.histogram(np.asarray(fireValues, dtype=np.float64), bins=bins, range=(float(minFire), float(maxFire)))
+    return hist
+
+
+'''
+Class boundaries (num_classes + 1 values like divideRange) from a fire value histogram covering
+[minFire, maxFire], placed with the multi-level Otsu (see otsu_multi_threshold_from_histogram)
+instead of at equal intervals. The classes follow the modes of the temperature distribution, so a
+few very hot outlier pixels no longer squeeze every other fire pixel into the lowest classes.
+Each inner boundary is the upper edge of the last bin of a class.
+'''
+def otsuBoundaries(hist, minFire, maxFire, num_classes, decimal_places=14, verbose=False):
+    if num_classes < 2 or maxFire <= minFire:
+        # nothing to split, same boundaries as divideRange
+        return divideRange(np.array([minFire, maxFire]), num_classes, decimal_places=decimal_places, verbose=verbose)
+
+    bin_edges = np.linspace(float(minFire), float(maxFire), len(hist) + 1)
+    thresholds = otsu_multi_threshold_from_histogram(hist, num_classes)
+    if verbose:
+        print()
+        print(f'FIRE REGION DATA')
+        print(f'MIN FIRE = {minFire}')
+        print(f'MAX FIRE = {maxFire}')
+        print(f'OTSU THRESHOLD BINS = {thresholds}')
+    inner = [round(float(bin_edges[threshold + 1]), decimal_places) for threshold in thresholds]
+    return [round(float(minFire), decimal_places)] + inner + [round(float(maxFire), decimal_places)]
+
+
+'''
+Class boundaries of one frame's fire values with the given boundaryMethod: 'RANGE' divides the range
+into equal intervals (divideRange), 'OTSU' uses the multi-level Otsu on a histogram of otsuBins bins
+(otsuBoundaries)
+'''
+def classBoundaries(fireValues, num_classes, boundaryMethod='RANGE', otsuBins=256, verbose=False):
+    if boundaryMethod == 'OTSU':
+        minFire = np.amin(fireValues)
+        maxFire = np.amax(fireValues)
+        hist = fireHistogram(fireValues, minFire, maxFire, bins=otsuBins)
+        return otsuBoundaries(hist, minFire, maxFire, num_classes, verbose=verbose)
+    return divideRange(fireValues, num_classes, verbose=verbose)
+
+
+def _check_boundary_method(boundaryMethod):
+    if boundaryMethod not in BOUNDARY_METHODS:
+        raise ValueError(f'Invalid boundaryMethod: {boundaryMethod}, expected one of {", ".join(BOUNDARY_METHODS)}')
+
+def labelTiff(tiffSamplePath, tiffBinaryPath, num_classes, height, width, labelTolerance=0.3, verbose=False, boundaryMethod='RANGE', otsuBins=256):
+    _check_boundary_method(boundaryMethod)
     tolerance = labelTolerance
     print(f'Labeling {tiffSamplePath}')
     # open image
@@ -81,7 +131,8 @@ def labelTiff(tiffSamplePath, tiffBinaryPath, num_classes, height, width, labelT
     tiffBinary = Image.open(tiffBinaryPath)
     # convert to numpy array 
     tiffSampleArray = np.array(tiffSample)
-    tiffBinaryArray = np.array(tiffBinary)
+    # 1-bit masks are read back as 0/255 like the 8-bit ones
+    tiffBinaryArray = mask_array(tiffBinary)
 
     if verbose:
         print()
@@ -98,17 +149,11 @@ def labelTiff(tiffSamplePath, tiffBinaryPath, num_classes, height, width, labelT
     fire_rows = fire_indices[0]
     fire_cols = fire_indices[1]
     
-    fireValuesList = []
-
-    # Iterate over the indices using zip to pair the rows and columns correctly
-    for row, col in zip(fire_rows, fire_cols):
-        fireValuesList.append(tiffSampleArray[row, col])
-
-    # Convert the list to a NumPy array at the end
-    fireValues = np.array(fireValuesList)
+    # gather the fire values in the same (row-major) order as the indices
+    fireValues = tiffSampleArray[fire_rows, fire_cols]
     
     # determine range boundaries for classes
-    fireBoundaries = divideRange(fireValues, num_classes)
+    fireBoundaries = classBoundaries(fireValues, num_classes, boundaryMethod=boundaryMethod, otsuBins=otsuBins)
     if verbose:
         print(f'FIRE RANGES = {fireBoundaries}')
     
@@ -117,31 +162,130 @@ def labelTiff(tiffSamplePath, tiffBinaryPath, num_classes, height, width, labelT
         print()
     return tiffSampleArray
 
-def apply_colormap_and_save(input_filename, output_filename, num_classes):
-    # Load the labeled PNG image as a NumPy array
-    labeled_image = np.array(Image.open(input_filename))
+'''
+uint8 RGBA palette of the label colormap, one row per class: the inferno colormap sampled at
+num_classes colors with the background (class 0) black. Built once per num_classes and read-only.
+'''
+@lru_cache(maxsize=None)
+def labelPalette(num_classes):
+    import matplotlib.pyplot as plt
 
-    # Define a colormap with a specific number of classes
-    # Create a custom colormap with black for background and other colors for classes
-    cmap = plt.get_cmap('inferno', num_classes)  # 'tab20' is a good categorical colormap with up to 20 colors
+    cmap = plt.get_cmap('inferno', num_classes)
     colors = cmap(np.arange(num_classes))
-    
+
     # Ensure the background (value 0) is black
     colors[0] = [0, 0, 0, 1]  # RGBA: Black
-    
-    # Create a colormap from the colors
-    custom_cmap = mcolors.ListedColormap(colors)
-    
-    # Apply the colormap directly
-    color_mapped_image = custom_cmap(labeled_image)
-    
-    # Convert color-mapped image to 8-bit per channel image
-    color_mapped_image = (color_mapped_image * 255).astype(np.uint8)
+
+    palette = (colors * 255).astype(np.uint8)
+    palette.setflags(write=False)
+    return palette
+
+
+'''
+Map a label array to colors by indexing the palette. Labels past the last palette entry get the last
+color, like evaluating a ListedColormap of num_classes colors.
+
+Returns a uint8 RGBA array, or a palette mode ('P') PIL image if paletteMode is True
+'''
+def colorizeLabels(labeled_image, num_classes, paletteMode=False):
+    palette = labelPalette(num_classes)
+    labeled_image = np.asarray(labeled_image)
+
+    if paletteMode:
+        # the labels are stored as is and the colors only in the PNG palette
+        rgb_palette = np.repeat(palette[-1:, :3], 256, axis=0)
+        rgb_palette[:num_classes] = palette[:, :3]
+        output_image = Image.fromarray(labeled_image.astype(np.uint8), mode='P')
+        output_image.putpalette(rgb_palette.ravel().tolist())
+        return output_image
+
+    return palette[np.clip(labeled_image, 0, num_classes - 1)]
+
+
+def apply_colormap_and_save(input_filename, output_filename, num_classes, paletteMode=False):
+    # Load the labeled PNG image as a NumPy array
+    labeled_image = np.array(Image.open(input_filename))
+
+    # Apply the precomputed palette by indexing
+    color_mapped_image = colorizeLabels(labeled_image, num_classes, paletteMode=paletteMode)
     
     # Convert to PIL Image and save
-    output_image = Image.fromarray(color_mapped_image)
+    output_image = color_mapped_image if paletteMode else Image.fromarray(color_mapped_image)
     output_image.save(output_filename)
     print(f'Colored and saved to {output_filename}')
+
+
+def _colormap_file(filename, input_folder, output_folder, num_classes, paletteMode):
+    # task run for every label image of colormapFolder, returns (filename, error)
+    try:
+        with Image.open(os.path.join(input_folder, filename)) as labeledImage:
+            color_mapped_image = colorizeLabels(np.array(labeledImage), num_classes, paletteMode=paletteMode)
+        output_image = color_mapped_image if paletteMode else Image.fromarray(color_mapped_image)
+        output_image.save(os.path.join(output_folder, filename))
+    except Exception as e:
+        return filename, f'{type(e).__name__}: {e}'
+    return filename, None
+
+
+'''
+Colormap every label PNG in a folder (see apply_colormap_and_save) and save it under the same
+filename in output_folder, in parallel across processes.
+
+Required Parameters
+    -input_folder = string path to the folder of label PNGs (0 - num_classes)
+    -output_folder = string path to the folder of the colored PNGs
+    -num_classes = number of classes used for labeling
+
+Optional Parameters
+    -paletteMode = If True, the PNGs are saved in palette mode (labels plus a color table) instead of
+                   expanded RGBA, default is False
+    -workers = Number of processes, default is None which uses every available core
+    -chunksize = Number of files sent to a worker process at a time, default is None which splits
+                 the folder into roughly 4 chunks per worker
+
+Returns a list of (filename, error) pairs for the images that failed
+'''
+def colormapFolder(input_folder, output_folder, num_classes, paletteMode=False, workers=None, chunksize=None):
+    print(f'Grabbing images from: {input_folder}')
+    print(f'Saving images to: {output_folder}')
+    os.makedirs(output_folder, exist_ok=True)
+    filenames = list_frames(input_folder, '*.png', ignore_case=True)
+    # build the palette once in this process, workers build their own on first use
+    labelPalette(num_classes)
+
+    colormapFile = partial(_colormap_file, input_folder=input_folder, output_folder=output_folder,
+                           num_classes=num_classes, paletteMode=paletteMode)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    executor = None
+    if workers > 1 and len(filenames) > 1:
+        if chunksize is None:
+            chunksize = max(1, len(filenames) // (workers * 4))
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(colormapFile, filenames, chunksize=chunksize)
+    else:
+        results = map(colormapFile, filenames)
+
+    failedFiles = []
+    try:
+        idx = 1
+        for filename, error in results:
+            if error is not None:
+                print(f'Failed to colormap {filename}: {error}')
+                failedFiles.append((filename, error))
+
+            if idx == 1:
+                print(f'Number of Images Processed : {idx}')
+            if idx % 50 == 0:
+                print(f'Number of Images Processed : {idx}')
+            idx += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if failedFiles:
+        print(f'{len(failedFiles)} of {len(filenames)} images failed to colormap')
+    return failedFiles
  
     
 def checkLabels(image_path, num_classes):
@@ -158,4 +302,187 @@ def checkLabels(image_path, num_classes):
     #print(thermal_array)
     
     return thermal_array
-    
\ No newline at end of file
+    
+
+
+def _open_label_pair(filename, tiffFolder, binaryFolder):
+    # the binary mask and the TIFF share the same base filename
+    with Image.open(os.path.join(binaryFolder, filename)) as tiffBinary:
+        tiffBinaryArray = mask_array(tiffBinary)
+    with Image.open(os.path.join(tiffFolder, filename)) as tiffSample:
+        tiffSampleArray = np.array(tiffSample)
+    fire_rows, fire_cols = np.where(tiffBinaryArray == 255)
+    return tiffSampleArray, fire_rows, fire_cols
+
+
+def _fire_range_file(filename, tiffFolder, binaryFolder):
+    # first pass of labelFolder, returns (filename, min fire value, max fire value, error)
+    try:
+        tiffSampleArray, fire_rows, fire_cols = _open_label_pair(filename, tiffFolder, binaryFolder)
+        if len(fire_rows) == 0:
+            return filename, None, None, None
+        fireValues = tiffSampleArray[fire_rows, fire_cols]
+        return filename, np.amin(fireValues), np.amax(fireValues), None
+    except Exception as e:
+        return filename, None, None, f'{type(e).__name__}: {e}'
+
+
+def _fire_hist_file(filename, tiffFolder, binaryFolder, minFire, maxFire, otsuBins):
+    # dataset Otsu pass of labelFolder, returns (filename, fire value histogram, error)
+    try:
+        tiffSampleArray, fire_rows, fire_cols = _open_label_pair(filename, tiffFolder, binaryFolder)
+        return filename, fireHistogram(tiffSampleArray[fire_rows, fire_cols], minFire, maxFire, bins=otsuBins), None
+    except Exception as e:
+        return filename, None, f'{type(e).__name__}: {e}'
+
+
+def _label_file(filename, tiffFolder, binaryFolder, outputFolder, num_classes, fireBoundaries, labelTolerance, boundaryMethod='RANGE', otsuBins=256):
+    # second pass of labelFolder, returns (filename, pixels per class, error)
+    try:
+        tiffSampleArray, fire_rows, fire_cols = _open_label_pair(filename, tiffFolder, binaryFolder)
+        height, width = tiffSampleArray.shape[:2]
+        if len(fire_rows) > 0:
+            fireValues = tiffSampleArray[fire_rows, fire_cols]
+            # per-frame boundaries when no dataset boundaries are given
+            boundaries = fireBoundaries if fireBoundaries is not None else classBoundaries(fireValues, num_classes, boundaryMethod=boundaryMethod, otsuBins=otsuBins)
+            labeledArray = rangeLabel(tiffSampleArray, boundaries, fire_rows, fire_cols, fireValues, height, width, labelTolerance=labelTolerance)
+            labeledImage = labeledArray.astype(np.uint8)
+        else:
+            # no fire in this frame, everything is background
+            labeledImage = np.zeros((height, width), dtype=np.uint8)
+
+        Image.fromarray(labeledImage).save(os.path.join(outputFolder, f'{os.path.splitext(filename)[0]}.png'))
+        classCounts = np.bincount(labeledImage.ravel(), minlength=num_classes + 1)[:num_classes + 1]
+        return filename, classCounts, None
+    except Exception as e:
+        return filename, None, f'{type(e).__name__}: {e}'
+
+
+'''
+Label a whole folder of TIFFs against their thresholded binary masks (e.g. output_folders/Wilamette_BINARY_30)
+and save one label PNG (0 - num_classes) per frame.
+
+With globalBoundaries=True, a first pass over all mask/TIFF pairs finds the dataset-wide min and max
+fire values, and every frame is then labeled with the same class boundaries (see divideRange), so a
+class id means the same temperature range in every frame. With boundaryMethod='OTSU', an extra pass sums
+the fire value histograms of all frames over that range and the boundaries are placed by the
+multi-level Otsu on the dataset histogram (see otsuBoundaries). Every pass runs in parallel across
+processes. A per-class pixel count summary is written to outputFolder/label_summary.csv.
+
+Required Parameters
+    -tiffFolder = string path to the folder of raw TIFFs
+    -binaryFolder = string path to the folder of binary masks (255 for fire), named like the TIFFs
+    -outputFolder = string path to the folder of the label PNGs
+    -num_classes = number of fire classes
+
+Optional Parameters
+    -labelTolerance = boundary tolerance, see rangeLabel, default is 0.3
+    -globalBoundaries = If True, the class boundaries are computed over the whole dataset, if False each
+                        frame uses its own min and max like labelTiff, default is True
+    -workers = Number of processes, default is None which uses every available core
+    -chunksize = Number of files sent to a worker process at a time, default is None which splits
+                 the folder into roughly 4 chunks per worker
+    -verbose = If True, prints the fire range and boundaries, default is False
+    -boundaryMethod = 'RANGE' divides the fire range into equal intervals, 'OTSU' places the boundaries
+                      with the multi-level Otsu on the fire value histogram, default is 'RANGE'
+    -otsuBins = Number of histogram bins used by boundaryMethod='OTSU', default is 256
+
+Returns (fireBoundaries, classCounts, failedFiles) with the dataset boundaries (None if
+globalBoundaries is False), the total pixels per class (index 0 is background) and a list of
+(filename, error) pairs for the frames that failed
+'''
+def labelFolder(tiffFolder, binaryFolder, outputFolder, num_classes, labelTolerance=0.3, globalBoundaries=True, workers=None, chunksize=None, verbose=False, boundaryMethod='RANGE', otsuBins=256):
+    _check_boundary_method(boundaryMethod)
+    print(f'Grabbing images from: {tiffFolder} and {binaryFolder}')
+    print(f'Saving labels to: {outputFolder}')
+    os.makedirs(outputFolder, exist_ok=True)
+    filenames = list_frames(binaryFolder, ('*.tiff', '*.tif'), ignore_case=True)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    executor = None
+    if workers > 1 and len(filenames) > 1:
+        if chunksize is None:
+            chunksize = max(1, len(filenames) // (workers * 4))
+        executor = ProcessPoolExecutor(max_workers=workers)
+
+    def run(task):
+        if executor is None:
+            return map(task, filenames)
+        return executor.map(task, filenames, chunksize=chunksize)
+
+    failedFiles = []
+    fireBoundaries = None
+    summary = []
+    try:
+        if globalBoundaries:
+            # First pass, dataset-wide fire range
+            minFire = maxFire = None
+            for filename, frameMin, frameMax, error in run(partial(_fire_range_file, tiffFolder=tiffFolder, binaryFolder=binaryFolder)):
+                if error is not None:
+                    print(f'Failed to read {filename}: {error}')
+                    failedFiles.append((filename, error))
+                elif frameMin is not None:
+                    minFire = frameMin if minFire is None else min(minFire, frameMin)
+                    maxFire = frameMax if maxFire is None else max(maxFire, frameMax)
+            if minFire is None:
+                print('No fire pixels found in any mask')
+            elif boundaryMethod == 'OTSU':
+                # Dataset histogram of the fire values over the dataset range
+                failed = {filename for filename, error in failedFiles}
+                datasetHist = np.zeros(otsuBins, dtype=np.int64)
+                histFile = partial(_fire_hist_file, tiffFolder=tiffFolder, binaryFolder=binaryFolder,
+                                   minFire=minFire, maxFire=maxFire, otsuBins=otsuBins)
+                for filename, hist, error in run(histFile):
+                    if error is not None:
+                        if filename not in failed:
+                            print(f'Failed to read {filename}: {error}')
+                            failedFiles.append((filename, error))
+                    else:
+                        datasetHist += hist
+                fireBoundaries = otsuBoundaries(datasetHist, minFire, maxFire, num_classes, verbose=verbose)
+                if verbose:
+                    print(f'FIRE RANGES = {fireBoundaries}')
+            else:
+                fireBoundaries = divideRange(np.array([minFire, maxFire]), num_classes, verbose=verbose)
+                if verbose:
+                    print(f'FIRE RANGES = {fireBoundaries}')
+
+        # Second pass, label every frame
+        failed = {filename for filename, error in failedFiles}
+        idx = 1
+        labelFile = partial(_label_file, tiffFolder=tiffFolder, binaryFolder=binaryFolder, outputFolder=outputFolder,
+                            num_classes=num_classes, fireBoundaries=fireBoundaries, labelTolerance=labelTolerance,
+                            boundaryMethod=boundaryMethod, otsuBins=otsuBins)
+        for filename, classCounts, error in run(labelFile):
+            if error is not None:
+                if filename not in failed:
+                    print(f'Failed to label {filename}: {error}')
+                    failedFiles.append((filename, error))
+            else:
+                summary.append([filename] + classCounts.tolist())
+
+            if idx == 1:
+                print(f'Number of Images Processed : {idx}')
+            if idx % 50 == 0:
+                print(f'Number of Images Processed : {idx}')
+            idx += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    classTotals = np.zeros(num_classes + 1, dtype=np.int64)
+    for row in summary:
+        classTotals += row[1:]
+
+    csv_path = os.path.join(outputFolder, 'label_summary.csv')
+    with open(csv_path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Filename'] + [f'Class {i}' for i in range(num_classes + 1)])
+        writer.writerows(summary)
+        writer.writerow(['Total'] + classTotals.tolist())
+    print(f'Data written to {csv_path}.')
+
+    if failedFiles:
+        print(f'{len(failedFiles)} of {len(filenames)} images failed to label')
+    return fireBoundaries, classTotals, failedFiles
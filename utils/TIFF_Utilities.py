@@ -1,13 +1,22 @@
 #Thermal TIFF Utilities
-import torch
-from torchvision import transforms
 from PIL import Image
 import os
 import numpy as np
-import matplotlib.pyplot as plt
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from utils.BinarizeUtils import binarize
+from utils.FrameUtils import list_frames, iter_frames, FrameWriter
+from utils.MetricsUtils import StageTimer, FolderMetrics, save_image, timed_frames
+from utils.ManifestUtils import load_manifest, manifest_filter, manifest_entry, open_manifest, write_manifest_entry, compact_manifest
+from utils.MaskUtils import MASK_FORMATS, MASK_STACK_NAME, MaskStackWriter, check_mask_format, mask_extension, save_mask
+
+# dtype transforms.ToTensor converts the pixels of a PIL mode to, other modes are 8-bit
+_TO_TENSOR_DTYPES = {'I': np.int32, 'I;16': np.int16, 'F': np.float32}
 
 
 def tiff_single_info(input_image_path, print_flag):
+    from torchvision import transforms
+
     # Open the image file
     with Image.open(input_image_path) as image:
         tiff = transforms.ToTensor()(image)
@@ -19,142 +28,305 @@ def tiff_single_info(input_image_path, print_flag):
             print(f'Number of {input_image_path} Unique Classes (after rounding): {nUnique}')
         return unique_list
 
-def tiff_max_min(input_folder):
-    image_filenames = os.listdir(input_folder)
-    image_filenames.sort()
-    
+'''
+Floored maximum and minimum pixel values over every TIFF in a folder, as torch scalars with the
+values of transforms.ToTensor (8-bit images are scaled to [0, 1]). See tiff_dataset_stats in
+StatsUtils for the full statistics (mean, std, histogram, per-file extrema) with a cache.
+'''
+def tiff_max_min(input_folder, prefetch=4):
+    import torch
+    from torchvision import transforms
+
     i = 1
-    MAX = 0
-    MIN = 0
-    for filename in image_filenames:
-        if filename.endswith(('.TIFF', '.tiff')):
-            with Image.open(os.path.join(input_folder, filename)) as image:
-                tiff = transforms.ToTensor()(image)
-                tiff_rounded = tiff.floor()
-                tempMax = torch.max(tiff_rounded)
-                tempMin = torch.min(tiff_rounded)
-
-                if tempMax > MAX:
-                    MAX = tempMax 
-                if tempMin < MIN:
-                    MIN = tempMin
-
-                if i == 1:
-                    print(f'Number of Images Processed : {i}')
-                if i % 50 == 0:
-                    print(f'Number of Images Processed : {i}')
-                i += 1
+    # start from the first frame, a folder of warm frames has a positive minimum
+    MAX = None
+    MIN = None
+    for filename, image in iter_frames(input_folder, ('*.TIFF', '*.tiff'), prefetch=prefetch, as_array=False):
+        # the extremes are found on the raw array, in the dtype ToTensor converts the image to, then
+        # only they go through ToTensor (floor, max and min commute with its scaling)
+        tiff = np.array(image, dtype=_TO_TENSOR_DTYPES.get(image.mode, np.uint8))
+        extremes = np.array([[tiff.max(), tiff.min()]], dtype=tiff.dtype)
+        if image.mode == '1':
+            extremes *= 255
+        tempMax, tempMin = torch.floor(transforms.ToTensor()(extremes))[0, 0]
+
+        if MAX is None or tempMax > MAX:
+            MAX = tempMax 
+        if MIN is None or tempMin < MIN:
+            MIN = tempMin
+
+        if i == 1:
+            print(f'Number of Images Processed : {i}')
+        if i % 50 == 0:
+            print(f'Number of Images Processed : {i}')
+        i += 1
     return MAX, MIN  
 
 
 '''
 Function that will take in an input folder and resize all images in that folder to the specified
-dimensions
+dimensions. Images are read ahead on a background thread, prefetch sets how many (default is 4).
+If incremental is True, a manifest is kept in output_folder and images already resized to the same
+size are skipped on the next run (default is False). progress and metrics_path receive per-file
+stage timings like in tiff_folder_convert (default is None). Resized images are encoded and saved
+by writers background threads (default is 1, 0 saves inline)
 '''
-def tiff_resize_images(input_folder, output_folder, height, width):
-    image_filenames = os.listdir(input_folder)
-    image_filenames.sort()
+def tiff_resize_images(input_folder, output_folder, height, width, prefetch=4, incremental=False, progress=None, metrics_path=None, writers=1):
     print(f'Grabbing images from: {input_folder}')
     print(f'Saving images to: {output_folder}')
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
+    pattern = ('*.jpg', '*.JPG', '*.jpeg', '*.JPEG', '*.TIFF', '*.tiff')
+    image_filenames = list_frames(input_folder, pattern)
+    todo_filenames = image_filenames
+    manifest_file = None
+    # size, mtime and hash of the inputs as they are read, for the manifest
+    file_infos = None
+    if incremental:
+        params = dict(height=height, width=width)
+        manifest = load_manifest(output_folder)
+        todo_filenames, skipped = manifest_filter(manifest, input_folder, image_filenames, 'RESIZE', params)
+        print(f'Skipping {len(skipped)} up-to-date images, converting {len(todo_filenames)}')
+        manifest_file = open_manifest(output_folder)
+        file_infos = {}
+
+    frames = iter_frames(input_folder, prefetch=prefetch, as_array=False, filenames=todo_filenames, timed=True, file_infos=file_infos)
+    writer = FrameWriter(writers=writers)
+    metrics = FolderMetrics('tiff_resize_images', len(todo_filenames), progress=progress, metrics_path=metrics_path)
     idx = 1
-    for filename in image_filenames:
-        if filename.endswith(('.jpg', '.JPG', '.jpeg', '.JPEG')):
-            with Image.open(os.path.join(input_folder, filename)) as image:
-                #resize image according to params
-                image_resized = image.resize((width, height))
-                #save resized image in specified output directory
-                image_resized.save(os.path.join(output_folder, filename))                
-        elif filename.endswith(('.TIFF', '.tiff')):
-            with Image.open(os.path.join(input_folder, filename)) as image:
-                #resize image according to params
+
+    # bookkeeping of the images saved by the writer, a failed save is raised
+    def writes_finished(finished):
+        nonlocal idx
+        for (filename, timer), _, error in finished:
+            if error is not None:
+                raise error
+            metrics.file_done(filename, timer.timings)
+
+            if manifest_file is not None:
+                manifest[filename] = manifest_entry(input_folder, filename, file_infos.pop(filename), 'RESIZE', params, os.path.join(output_folder, filename))
+                write_manifest_entry(manifest_file, manifest[filename])
+
+            if idx == 1:
+                print(f'Number of Images Processed : {idx}')
+            if idx % 50 == 0:
+                print(f'Number of Images Processed : {idx}')
+            idx += 1
+
+    try:
+        for filename, image, timings in timed_frames(frames):
+            timer = StageTimer(timings)
+            #resize image according to params
+            with timer.stage('threshold'):
                 image_resized = image.resize((width, height))
-                #save resized image in specified output directory
-                image_resized.save(os.path.join(output_folder, filename)) 
-                  
-        if idx == 1:
-            print(f'Number of Images Processed : {idx}')
-        if idx % 50 == 0:
-            print(f'Number of Images Processed : {idx}')
-        idx += 1
+            #save resized image in specified output directory
+            writer.submit((filename, timer), save_image, image_resized, os.path.join(output_folder, filename), timer)
+            writes_finished(writer.completed())
+        writes_finished(writer.flush())
+    finally:
+        writer.close()
+        metrics.close()
+        frames.close()
+        if manifest_file is not None:
+            manifest_file.close()
+            compact_manifest(output_folder, {f: manifest[f] for f in image_filenames if f in manifest})
     return None
 
 
+'''
+Function that will take in an input folder and cache a min/max pyramid of every TIFF in it (see
+PyramidUtils), the multi-resolution counterpart of tiff_resize_images. Level 0 keeps the minimum and
+maximum of every block_size x block_size block, every next level halves the resolution down to a
+single cell, and each pyramid is saved as output_folder/<name>.pyramid.npz.
+
+A manifest (manifest.jsonl) with the shape, minimum and maximum of every frame is always kept in
+output_folder, so pyramid_triage and tiff_folder_convert(..., pyramid_folder=output_folder) can
+reject frames without fire from it without opening them. If incremental is True, frames whose
+pyramid is up to date are skipped (default is False). prefetch, progress, metrics_path and writers
+are the same as in tiff_resize_images
+'''
+def tiff_pyramid_images(input_folder, output_folder, block_size=8, prefetch=4, incremental=False, progress=None, metrics_path=None, writers=1):
+    from utils.PyramidUtils import build_pyramid, pyramid_path
 
-def tiff_binary_image_convert(input_image_path, output_image_path, thresh, saveImage):
+    print(f'Grabbing images from: {input_folder}')
+    print(f'Saving pyramids to: {output_folder}')
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    image_filenames = list_frames(input_folder, ('*.TIFF', '*.tiff'))
+    params = dict(block_size=block_size)
+    manifest = load_manifest(output_folder)
+    todo_filenames = image_filenames
+    if incremental:
+        todo_filenames, skipped = manifest_filter(manifest, input_folder, image_filenames, 'PYRAMID', params)
+        print(f'Skipping {len(skipped)} up-to-date images, converting {len(todo_filenames)}')
+    manifest_file = open_manifest(output_folder)
+    # size, mtime and hash of the inputs as they are read, for the manifest
+    file_infos = {}
+
+    frames = iter_frames(input_folder, prefetch=prefetch, filenames=todo_filenames, timed=True, file_infos=file_infos)
+    writer = FrameWriter(writers=writers)
+    metrics = FolderMetrics('tiff_pyramid_images', len(todo_filenames), progress=progress, metrics_path=metrics_path)
+    idx = 1
+
+    # bookkeeping of the pyramids saved by the writer, a failed save is raised
+    def writes_finished(finished):
+        nonlocal idx
+        for (filename, timer, summary), _, error in finished:
+            if error is not None:
+                raise error
+            metrics.file_done(filename, timer.timings)
+
+            manifest[filename] = manifest_entry(input_folder, filename, file_infos.pop(filename), 'PYRAMID', params, pyramid_path(output_folder, filename), result=summary)
+            write_manifest_entry(manifest_file, manifest[filename])
+
+            if idx == 1:
+                print(f'Number of Images Processed : {idx}')
+            if idx % 50 == 0:
+                print(f'Number of Images Processed : {idx}')
+            idx += 1
+
+    def save_pyramid(pyramid, output_path, timer):
+        with timer.stage('write'):
+            pyramid.save(output_path)
+
+    try:
+        for filename, tiff, timings in timed_frames(frames):
+            timer = StageTimer(timings)
+            with timer.stage('threshold'):
+                pyramid = build_pyramid(tiff, block_size=block_size)
+            writer.submit((filename, timer, pyramid.summary()), save_pyramid, pyramid, pyramid_path(output_folder, filename), timer)
+            writes_finished(writer.completed())
+        writes_finished(writer.flush())
+    finally:
+        writer.close()
+        metrics.close()
+        frames.close()
+        manifest_file.close()
+        compact_manifest(output_folder, {f: manifest[f] for f in image_filenames if f in manifest})
+    return None
+
+
+'''
+Binary threshold a single TIFF, saving it as an uncompressed TIFF by default. mask_format selects
+another format (e.g. 'TIFF_1BIT_DEFLATE', see MaskUtils), 'JPG' is lossy and blurs mask edges
+'''
+def tiff_binary_image_convert(input_image_path, output_image_path, thresh, saveImage, mask_format='TIFF'):
+    check_mask_format(mask_format, tuple(MASK_FORMATS))
     # Open the TIFF image
     image = Image.open(input_image_path)
     
     # Convert image to numpy array
     image_array = np.array(image)
     
-    #index through image pixels
-    for i in range(image_array.shape[0]):  # Iterate over rows
-        for j in range(image_array.shape[1]):  # Iterate over columns
-            pixel = image_array[i, j]  
-            # Binary thresholding
-            if pixel > thresh:
-                image_array[i, j] = 255  # Set pixel to white (255)
-            else:
-                image_array[i, j] = 0  # Set pixel to black (0)
-    
-    #tiff_bin_image = Image.fromarray(image_array)
-    tiff_bin_image = Image.fromarray(image_array.astype('uint8'))
+    # Binary thresholding, pixels above thresh are white (255) and the rest black (0)
+    tiff_bin_image = Image.fromarray(binarize(image_array, thresh))
     
     # Save the binary image if specified
     if saveImage:
-        tiff_bin_image.save(output_image_path + '_' + str(thresh) + '.jpg')
+        save_mask(tiff_bin_image, output_image_path + '_' + str(thresh) + mask_extension(mask_format), mask_format)
      
     return tiff_bin_image
 
 
 '''
 Function that will take in an input folder of TIFFs and convert all of the images in that folder to 
-a binary image based on the threshold (in Celsius)
+a binary image based on the threshold (in Celsius). Images are read ahead on a background thread,
+prefetch sets how many (default is 4). If incremental is True, a manifest is kept in output_folder
+and images already converted with the same threshold are skipped on the next run (default is False).
+progress and metrics_path receive per-file stage timings like in tiff_folder_convert (default is None).
+Masks are saved as uncompressed TIFFs by default. mask_format selects another format ('TIFF_LZW',
+'TIFF_DEFLATE', 'TIFF_1BIT', 'TIFF_1BIT_DEFLATE', 'STACK' for a single output_folder/masks.stack,
+see MaskUtils, or 'JPG', which is lossy and blurs mask edges). Masks are encoded and saved by
+writers background threads (default is 1, 0 saves inline)
 '''
-def tiff_binary_folder_convert(input_folder, output_folder, thresh):
-    image_filenames = os.listdir(input_folder)
-    image_filenames.sort()
+def tiff_binary_folder_convert(input_folder, output_folder, thresh, prefetch=4, incremental=False, progress=None, metrics_path=None, mask_format='TIFF', writers=1):
+    check_mask_format(mask_format)
+    if incremental and mask_format == 'STACK':
+        raise ValueError("mask_format='STACK' rewrites the whole stack and cannot be combined with incremental")
     print(f'Grabbing images from: {input_folder}')
     print(f'Saving images to: {output_folder}')
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
+    image_filenames = list_frames(input_folder, ('*.tiff', '*.TIFF'))
+    todo_filenames = image_filenames
+    manifest_file = None
+    # size, mtime and hash of the inputs as they are read, for the manifest
+    file_infos = None
+    if incremental:
+        # the method names the mask format, 'BINARY_JPG' as in the manifests written before mask formats existed
+        method = f'BINARY_{mask_format}'
+        params = dict(thresh=thresh)
+        manifest = load_manifest(output_folder)
+        todo_filenames, skipped = manifest_filter(manifest, input_folder, image_filenames, method, params)
+        print(f'Skipping {len(skipped)} up-to-date images, converting {len(todo_filenames)}')
+        manifest_file = open_manifest(output_folder)
+        file_infos = {}
+
+    stack_writer = None
+    if mask_format == 'STACK':
+        stack_writer = MaskStackWriter(os.path.join(output_folder, MASK_STACK_NAME), metadata=dict(method='BINARY', params=dict(binThresh=thresh)))
+
+    frames = iter_frames(input_folder, prefetch=prefetch, filenames=todo_filenames, timed=True, file_infos=file_infos)
+    writer = FrameWriter(writers=writers)
+    metrics = FolderMetrics('tiff_binary_folder_convert', len(todo_filenames), progress=progress, metrics_path=metrics_path)
     idx = 1
-    for filename in image_filenames:
-        if filename.endswith(('.tiff', '.TIFF')):
-            with Image.open(os.path.join(input_folder, filename)) as image:
-                # Convert image to numpy array
-                image_array = np.array(image)
-    
-                #index through image pixels
-                for i in range(image_array.shape[0]):  # Iterate over rows
-                    for j in range(image_array.shape[1]):  # Iterate over columns
-                        pixel = image_array[i, j]  
-                        # Binary thresholding
-                        if pixel > thresh:
-                            image_array[i, j] = 255  # Set pixel to white (255)
-                        else:
-                            image_array[i, j] = 0  # Set pixel to black (0)
-
-                #tiff_bin_image = Image.fromarray(image_array)
-                tiff_bin_image = Image.fromarray(image_array.astype('uint8'))
-                
+
+    # bookkeeping of the masks once saved, a failed save is raised
+    def writes_finished(finished):
+        nonlocal idx
+        for (filename, output_path, timer), _, error in finished:
+            if error is not None:
+                raise error
+            metrics.file_done(filename, timer.timings)
+
+            if manifest_file is not None:
+                manifest[filename] = manifest_entry(input_folder, filename, file_infos.pop(filename), method, params, output_path)
+                write_manifest_entry(manifest_file, manifest[filename])
+            
+            if idx == 1:
+                print(f'Number of Images Processed : {idx}')
+            if idx % 50 == 0:
+                print(f'Number of Images Processed : {idx}')
+            idx += 1
+
+    try:
+        for filename, image_array, timings in timed_frames(frames):
+            timer = StageTimer(timings)
+            # Binary thresholding, pixels above thresh are white (255) and the rest black (0)
+            with timer.stage('threshold'):
+                bin_array = binarize(image_array, thresh)
+
+            if stack_writer is not None:
+                # the stack is written in order on this thread
+                with timer.stage('write'):
+                    stack_writer.append(filename, bin_array, threshold=thresh)
+                writes_finished([((filename, None, timer), None, None)])
+            else:
                 #remove .TIFF extension and grab just the filename 
                 filename_no_ext = os.path.splitext(filename)[0]
-                
+
                 # Save the binary image 
-                tiff_bin_image.save(os.path.join(output_folder, filename_no_ext) + '.jpg')
-        
-        if idx == 1:
-            print(f'Number of Images Processed : {idx}')
-        if idx % 50 == 0:
-            print(f'Number of Images Processed : {idx}')
-        idx += 1
+                output_path = os.path.join(output_folder, filename_no_ext) + mask_extension(mask_format)
+                writer.submit((filename, output_path, timer), save_mask, bin_array, output_path, mask_format, timer)
+            writes_finished(writer.completed())
+        writes_finished(writer.flush())
+        if stack_writer is not None:
+            print(f'{len(stack_writer.filenames)} masks written to {stack_writer.close()}')
+    finally:
+        writer.close()
+        metrics.close()
+        frames.close()
+        if stack_writer is not None:
+            # discards the partial stack if the loop ended early
+            stack_writer.abort()
+        if manifest_file is not None:
+            manifest_file.close()
+            compact_manifest(output_folder, {f: manifest[f] for f in image_filenames if f in manifest})
     return None
 
 # function to convert TIFF to greyscale, save it if necessary, and display it
 def tiff_convert_to_greyscale(input_image_path, output_image_path, display=True, saveImage=True):    
+    from torchvision import transforms
     
     # Open the image file
     with Image.open(input_image_path) as image:
@@ -169,6 +341,7 @@ def tiff_convert_to_greyscale(input_image_path, output_image_path, display=True,
         tiff_grey_image = transforms.ToPILImage()(tiff_grey)
         
         if display:
+            import matplotlib.pyplot as plt
             plt.imshow(tiff_grey_image)
             plt.axis('off')
             plt.show()
@@ -205,4 +378,200 @@ def analyzeTiff(image_path):
     print(f'ABSOLUTE MAX VALUE: {np.amax(thermal_array)}')
     
     print('')
-    return thermal_array
\ No newline at end of file
+    return thermal_array
+
+
+'''
+Precompute a 256 entry RGB lookup table (uint8, shape (256, 3)) from a matplotlib colormap. Entry i
+holds the color the colormap gives to normalized values in [i/256, (i+1)/256), so indexing it with
+quantized values reproduces cmap(normalized)[..., :3] * 255 exactly for 256 color maps like inferno.
+
+Optional Parameters
+    -cmap = name of the matplotlib colormap, default is 'inferno'
+'''
+def colormap_lut(cmap='inferno'):
+    from matplotlib import colormaps
+
+    colormap = colormaps[cmap]
+    if colormap.N != 256:
+        colormap = colormap.resampled(256)
+    return (colormap(np.arange(256))[:, :3] * 255).astype(np.uint8)
+
+
+'''
+Quantize a 2D array to colormap indices 0-255 and map it to RGB through a lookup table.
+
+Required Parameters
+    -image_array = 2D numpy array (e.g. a calibrated TIFF)
+    -lut = (256, 3) uint8 lookup table (see colormap_lut)
+
+Optional Parameters
+    -norm_range = (low, high) values mapped to the first and last color. Values outside are clipped, so
+                  every frame shares the same scale. Default is None which normalizes each frame by
+                  its own min and max
+
+Returns a uint8 RGB array of shape (height, width, 3)
+'''
+def apply_lut(image_array, lut, norm_range=None):
+    image_array = np.asarray(image_array, dtype=np.float32)
+    if norm_range is None:
+        low, high = np.min(image_array), np.max(image_array)
+    else:
+        low, high = np.float32(norm_range[0]), np.float32(norm_range[1])
+
+    if high > low:
+        # same float32 arithmetic as normalizing and calling the colormap
+        index = (image_array - low) / (high - low)
+        index *= np.float32(256)
+        np.nan_to_num(index, copy=False)
+        np.clip(index, 0, 255, out=index)
+        index = index.astype(np.uint8)
+    else:
+        # constant frame
+        index = np.zeros(image_array.shape, dtype=np.uint8)
+    return lut[index]
+
+
+'''
+Radiometric calibration of a single TIFF: the raw values are clipped to [clip_min, clip_max] and
+saved as a float32 TIFF, then colormapped to a thermal RGB JPEG through a precomputed lookup table.
+
+Required Parameters
+    -input_image_path = string path to the raw TIFF
+
+Optional Parameters
+    -output_tiff_path = string path of the calibrated TIFF, default is None which does not save it
+    -output_jpg_path = string path of the colormapped JPEG, default is None which does not save it
+    -thermal_image_path = string path to the original thermal JPEG, its EXIF metadata is copied into the
+                          new JPEG if the file exists, default is None
+    -clip_min = Lower calibration bound, default is 0 (in degrees Celsius)
+    -clip_max = Upper calibration bound, default is 500 (in degrees Celsius)
+    -norm_range = (low, high) range of the colormap, default is None which normalizes by the frame's own
+                  min and max (see apply_lut)
+    -cmap = matplotlib colormap name, default is 'inferno'
+    -lut = precomputed lookup table, default is None which builds one from cmap
+    -timer = StageTimer (see MetricsUtils) the stage timings are added to, default is None
+
+Returns (calibrated_array, rgb_array)
+'''
+def tiff_calibrate_image(input_image_path, output_tiff_path=None, output_jpg_path=None, thermal_image_path=None, clip_min=0, clip_max=500, norm_range=None, cmap='inferno', lut=None, timer=None):
+    import tifffile
+
+    if lut is None:
+        lut = colormap_lut(cmap)
+    if timer is None:
+        timer = StageTimer()
+
+    with timer.stage('decode'):
+        raw_array = tifffile.imread(input_image_path)
+    # Apply TIFF corrections
+    with timer.stage('threshold'):
+        calibrated_array = np.clip(raw_array, clip_min, clip_max).astype(np.float32)
+    if output_tiff_path is not None:
+        with timer.stage('write'):
+            tifffile.imwrite(output_tiff_path, calibrated_array)
+
+    with timer.stage('threshold'):
+        rgb_array = apply_lut(calibrated_array, lut, norm_range=norm_range)
+    if output_jpg_path is not None:
+        save_kwargs = {}
+        if thermal_image_path is not None and os.path.exists(thermal_image_path):
+            with timer.stage('decode'):
+                with Image.open(thermal_image_path) as thermal_image:
+                    exif = thermal_image.info.get('exif')
+            if exif is not None:
+                save_kwargs['exif'] = exif
+        save_image(Image.fromarray(rgb_array), output_jpg_path, timer, **save_kwargs)
+
+    return calibrated_array, rgb_array
+
+
+def _calibrate_file(filename, input_folder, output_tiff_folder, output_jpg_folder, thermal_folder, **kwargs):
+    # task run for every file of tiff_calibrate_folder, errors are returned instead of raised
+    filename_base = os.path.splitext(filename)[0]
+    timer = StageTimer()
+    try:
+        tiff_calibrate_image(
+            os.path.join(input_folder, filename),
+            output_tiff_path=None if output_tiff_folder is None else os.path.join(output_tiff_folder, f'{filename_base}.TIFF'),
+            output_jpg_path=None if output_jpg_folder is None else os.path.join(output_jpg_folder, f'{filename_base}.JPG'),
+            thermal_image_path=None if thermal_folder is None else os.path.join(thermal_folder, f'{filename_base}.JPG'),
+            timer=timer, **kwargs)
+    except Exception as e:
+        return filename, f'{type(e).__name__}: {e}', timer.timings
+    return filename, None, timer.timings
+
+
+'''
+Calibrate a folder of raw TIFFs (see tiff_calibrate_image), saving the calibrated TIFFs and the
+colormapped thermal JPEGs under the same base filename. The colormap lookup table is built once and
+files are processed in parallel across processes.
+
+Required Parameters
+    -input_folder = string path to the folder of raw TIFFs
+    -output_tiff_folder = string path to the calibrated TIFF folder, None skips the TIFFs
+    -output_jpg_folder = string path to the colormapped JPEG folder, None skips the JPEGs
+
+Optional Parameters
+    -thermal_folder = folder of the original thermal JPEGs, the EXIF of {filename}.JPG is copied into
+                      each new JPEG, default is None
+    -clip_min = Lower calibration bound, default is 0 (in degrees Celsius)
+    -clip_max = Upper calibration bound, default is 500 (in degrees Celsius)
+    -norm_range = (low, high) fixed colormap range so colors are comparable across frames, e.g.
+                  (clip_min, clip_max), default is None which normalizes each frame by its own min
+                  and max like the original notebook
+    -cmap = matplotlib colormap name, default is 'inferno'
+    -workers = Number of processes, default is 1 (sequential). None uses every available core
+    -chunksize = Number of files sent to a worker process at a time, default is None which splits
+                 the folder into roughly 4 chunks per worker
+    -progress = callable receiving progress events with per-file stage timings, default is None
+    -metrics_path = path of a JSON-lines file the events are appended to, default is None
+
+Returns a list of (filename, error) pairs for the files that failed to calibrate
+'''
+def tiff_calibrate_folder(input_folder, output_tiff_folder, output_jpg_folder, thermal_folder=None, clip_min=0, clip_max=500, norm_range=None, cmap='inferno', workers=1, chunksize=None, progress=None, metrics_path=None):
+    print(f'Grabbing images from: {input_folder}')
+    for output_folder in (output_tiff_folder, output_jpg_folder):
+        if output_folder is not None:
+            print(f'Saving images to: {output_folder}')
+            os.makedirs(output_folder, exist_ok=True)
+    image_filenames = list_frames(input_folder, '*.tiff', ignore_case=True)
+
+    calibrate_file = partial(_calibrate_file, input_folder=input_folder, output_tiff_folder=output_tiff_folder,
+                             output_jpg_folder=output_jpg_folder, thermal_folder=thermal_folder, clip_min=clip_min,
+                             clip_max=clip_max, norm_range=norm_range, lut=colormap_lut(cmap))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    executor = None
+    if workers > 1 and len(image_filenames) > 1:
+        if chunksize is None:
+            chunksize = max(1, len(image_filenames) // (workers * 4))
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(calibrate_file, image_filenames, chunksize=chunksize)
+    else:
+        results = map(calibrate_file, image_filenames)
+
+    failed_files = []
+    metrics = FolderMetrics('tiff_calibrate_folder', len(image_filenames), progress=progress, metrics_path=metrics_path)
+    try:
+        idx = 1
+        for filename, error, timings in results:
+            metrics.file_done(filename, timings, error)
+            if error is not None:
+                print(f'Failed to calibrate {filename}: {error}')
+                failed_files.append((filename, error))
+
+            if idx == 1:
+                print(f'Number of Images Processed : {idx}')
+            if idx % 50 == 0:
+                print(f'Number of Images Processed : {idx}')
+            idx += 1
+    finally:
+        metrics.close()
+        if executor is not None:
+            executor.shutdown()
+
+    if failed_files:
+        print(f'{len(failed_files)} of {len(image_filenames)} images failed to calibrate')
+    return failed_files
@@ -1,41 +1,63 @@
-import torch
-from torchvision import transforms
 from PIL import Image
+import io
 import os
 import csv
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.ndimage import gaussian_filter
-from skimage import data, color
-import sys
-from scipy.signal import convolve2d
-from utils.OtsuUtils import otsu_threshold, otsu_threshold_thermal
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from utils.OtsuUtils import otsu_threshold, otsu_threshold_thermal, otsu_grey_array, otsu_histogram, otsu_threshold_from_histogram
+from utils.BinarizeUtils import binarize
+from utils.HysteresisUtils import hysteresis_threshold, gradient_magnitude, hysteresis_mask
+from utils.AdaptiveUtils import ADAPTIVE_METHODS, adaptive_mask, local_mean_std
+from utils.FrameUtils import list_frames, iter_frames, read_hashed, FrameWriter, SequenceCache
+from utils.PyramidUtils import pyramid_triage
+from utils.MetricsUtils import StageTimer, FolderMetrics, timed_frames
+from utils.ManifestUtils import load_manifest, manifest_filter, manifest_entry, open_manifest, write_manifest_entry, compact_manifest
+from utils.MaskUtils import TIFF_MASK_FORMATS, MASK_STACK_NAME, MaskStackWriter, check_mask_format, mask_extension, save_mask, pack_mask
 '''
 Convert TIFF file into appropriate binary ground truth for segmentation based on one of the following methods:
 
 1.) Standard Binary Thresholding
 2.) Hysteresis
 3.) Otsu's Method 
+4.) Local Adaptive Thresholding (Sauvola / Niblack)
 
 Required Parameters
     -input_image_path = string path to input image filename
     -output_image_path = string path to output image filename
-    -imageType = can be 'BINARY', 'HYST', or 'OTSU' to specify which thresholding technique to use
+    -imageType = can be 'BINARY', 'HYST', 'OTSU' or 'ADAPTIVE' to specify which thresholding technique to use
     -saveImage = If True, then the image will be saved, if False, then the image will not be saved
 
 Optional Parameters
+    -mask_format = Storage format of the saved mask, 'TIFF' (8-bit uncompressed), 'TIFF_LZW',
+                   'TIFF_DEFLATE', 'TIFF_1BIT' or 'TIFF_1BIT_DEFLATE' (see MaskUtils), default is 'TIFF'
+
 Standard Binary Parameters:
     -binThresh = Default is 50 (in degrees Celsius) if not specified
     
 Hysteresis Parameters:
     -low_threshold = Default is 50 (in degrees Celsius) if not specified
     -high_threshold = Default is 150 (in degrees Celsius) if not specified
+    -connectivity = 4 or 8, connectivity used to grow edges from strong pixels, default is 8
+    -legacy_hyst = If True, reproduces the original 3x3 neighborhood check instead of connected
+                   component hysteresis, default is False
     
 Otsu Parameters:
     -plotHist = If True, then the pixel intensity histogram will be plotted, if False, then the image the 
                 pixel intensity histogram will not be plotted, default is set to False
+
+Adaptive Parameters:
+    -window_size = odd side in pixels of the window the local mean and standard deviation are
+                   computed over (from integral images, the cost does not depend on it), default is 31
+    -adaptive_method = 'SAUVOLA' or 'NIBLACK' (see AdaptiveUtils), default is 'SAUVOLA'
+    -adaptive_k = weight of the local standard deviation, default is 0.2
+    -adaptive_range = dynamic range R of the standard deviation for 'SAUVOLA', default is None which
+                      uses the largest local standard deviation of each frame
+    -adaptive_floor = value (in degrees Celsius) a pixel must also be above, default is None
+    -thermal_image = If True, the images are thermal JPEGs thresholded on their 8-bit grayscale
 '''
-def tiff_image_convert(input_image_path, output_image_path, imageType, saveImage=True, thermal_image=None, low_threshold=50, high_threshold=150, binThresh=50, plotHist=False):
+def tiff_image_convert(input_image_path, output_image_path, imageType, saveImage=True, thermal_image=None, low_threshold=50, high_threshold=150, binThresh=50, plotHist=False, connectivity=8, legacy_hyst=False, mask_format='TIFF', window_size=31, adaptive_method='SAUVOLA', adaptive_k=0.2, adaptive_range=None, adaptive_floor=None):
+    check_mask_format(mask_format, TIFF_MASK_FORMATS)
     tiff_bin_image = None
     tiff_grey_image = None
     
@@ -46,27 +68,19 @@ def tiff_image_convert(input_image_path, output_image_path, imageType, saveImage
         # Convert image to numpy array
         image_array = np.array(image)
         
-        #index through image pixels
-        for i in range(image_array.shape[0]):  # Iterate over rows
-            for j in range(image_array.shape[1]):  # Iterate over columns
-                pixel = image_array[i, j]  
-                # Binary thresholding
-                if pixel > binThresh:
-                    image_array[i, j] = 255  # Set pixel to white (255)
-                else:
-                    image_array[i, j] = 0  # Set pixel to black (0)
-
-        #tiff_bin_image = Image.fromarray(image_array)
-        tiff_bin_image = Image.fromarray(image_array.astype('uint8'))
+        # Binary thresholding, pixels above binThresh are white (255) and the rest black (0)
+        tiff_bin_image = Image.fromarray(binarize(image_array, binThresh))
     
     
         # Save the binary image if specified
         if saveImage:
-            saveString = output_image_path + '_' + str(binThresh) + '.TIFF'
-            tiff_bin_image.save(saveString)
+            saveString = output_image_path + '_' + str(binThresh) + mask_extension(mask_format)
+            save_mask(tiff_bin_image, saveString, mask_format)
             print(f'Image Saved in {saveString}')
         return tiff_bin_image
     elif imageType == 'HYST':
+        from torchvision import transforms
+
         # Open the image file
         with Image.open(input_image_path) as image:
             # Convert the image to a PyTorch tensor
@@ -81,47 +95,15 @@ def tiff_image_convert(input_image_path, output_image_path, imageType, saveImage
 
             #--------------START HYSTERESIS THRESHOLDING--------------------------
             print(f'Hysteresis Thresholds -> Low: {low_threshold}, High: {high_threshold}')
-             # Smooth the image using Gaussian filter
-            smoothed_image = gaussian_filter(tiff_grey_numpy, sigma=1)
-
-            
-            # Apply gradient calculation (Sobel operator)
-            sobelx = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]])
-            sobely = np.array([[-1, -2, -1], [0, 0, 0], [1, 2, 1]])
-
-
-            gradient_x = convolve2d(smoothed_image, sobelx, mode='same')
-            gradient_y = convolve2d(smoothed_image, sobely, mode='same')
-            
-
-            # Compute gradient magnitude and direction
-            gradient_magnitude = np.sqrt(gradient_x ** 2 + gradient_y ** 2)
-            gradient_direction = np.arctan2(gradient_y, gradient_x)
-
-            # Initialize output image
-            output_image = np.zeros_like(tiff_grey_numpy)
-
-            # Apply hysteresis thresholding
-            strong_edge = (gradient_magnitude > high_threshold)
-            weak_edge = (gradient_magnitude >= low_threshold) & (gradient_magnitude <= high_threshold)
-
-            output_image[strong_edge] = 255
-            for i in range(1, output_image.shape[0]-1):
-                for j in range(1, output_image.shape[1]-1):
-                    if weak_edge[i, j]:
-                        local_gradient = gradient_direction[i-1:i+2, j-1:j+2]
-                        local_magnitude = gradient_magnitude[i-1:i+2, j-1:j+2]
-                        adjacent_pixels = local_magnitude > low_threshold
-                        if np.any(adjacent_pixels):
-                            output_image[i, j] = 255
+            output_image = hysteresis_threshold(tiff_grey_numpy, low_threshold, high_threshold, connectivity=connectivity, legacy=legacy_hyst)
             #--------------END HYSTERESIS THRESHOLDING--------------------------
             
-            tiff_hyst_image = Image.fromarray(output_image.astype('uint8'))
+            tiff_hyst_image = Image.fromarray(output_image)
     
             # Save the output grayscale image
             if saveImage:
-                saveString = output_image_path + '.TIFF'
-                tiff_hyst_image.save(saveString)
+                saveString = output_image_path + mask_extension(mask_format)
+                save_mask(tiff_hyst_image, saveString, mask_format)
                 #plt.imsave(saveString, output_image, cmap='gray')
                 print(f'Image Saved in {saveString}')
         return output_image
@@ -134,200 +116,786 @@ def tiff_image_convert(input_image_path, output_image_path, imageType, saveImage
          
         if saveImage: 
             # Save the binary image
-            saveString = output_image_path + '_' + str(optimal_threshold) + '.TIFF'
-            tiff_otsu_image.save(saveString)
+            saveString = output_image_path + '_' + str(optimal_threshold) + mask_extension(mask_format)
+            save_mask(tiff_otsu_image, saveString, mask_format)
             #plt.imsave(saveString, tiff_otsu_image, cmap='gray')
             print(f'Image Saved in {saveString}')
         return tiff_otsu_image        
+
+    elif imageType == 'ADAPTIVE':
+        with Image.open(input_image_path) as image:
+            adaptive_array = otsu_grey_array(image, thermal_image=True) if thermal_image == True else np.array(image)
+
+        # pixels above their local Sauvola / Niblack threshold are white (255) and the rest black (0)
+        tiff_adaptive_image = Image.fromarray(adaptive_mask(adaptive_array, window_size, adaptive_method, adaptive_k, adaptive_range, adaptive_floor))
+
+        if saveImage:
+            saveString = output_image_path + mask_extension(mask_format)
+            save_mask(tiff_adaptive_image, saveString, mask_format)
+            print(f'Image Saved in {saveString}')
+        return tiff_adaptive_image
         
     #if imageType is invalid return -1
     return -1
 
 
+'''
+Threshold a single frame from a folder and save the result, used by tiff_folder_convert. Errors are
+captured and returned instead of raised so one bad file does not abort the whole batch.
+
+Returns (filename, optimal_threshold, hist, error, timings, packed) where optimal_threshold and the
+Otsu histogram hist are only set for 'OTSU', error is None on success, timings holds the seconds
+spent per stage (see MetricsUtils), starting from the given timings, and packed is the bit-packed
+mask and its shape when mask_format is 'STACK' (the caller appends it to the stack) and None otherwise.
+
+If a FrameWriter is given, the mask is encoded and saved on a writer thread and None is returned,
+the result tuple is then the key of the finished job returned by the writer.
+
+If a SequenceCache is given, a frame matching the last thresholded frame gets its mask, threshold
+and histogram without being thresholded again. precomputed = (mask, optimal_threshold, hist) skips
+the thresholding, used for the empty masks of the frames rejected from their pyramid
+'''
+def _folder_convert_frame(filename, image, output_folder, imageType, thermal_image=None, low_threshold=50, high_threshold=150, binThresh=50, saveImage=True, connectivity=8, legacy_hyst=False, mask_format='TIFF', window_size=31, adaptive_method='SAUVOLA', adaptive_k=0.2, adaptive_range=None, adaptive_floor=None, timings=None, writer=None, sequence=None, precomputed=None):
+    optimal_threshold = None
+    hist = None
+    timer = StageTimer(timings)
+    output_mask = None
+    try:
+        #remove .TIFF extension and grab just the filename 
+        filename_no_ext = os.path.splitext(filename)[0]
+        outputFolderName = None
+        if mask_format != 'STACK':
+            outputFolderName = os.path.join(output_folder, filename_no_ext) + mask_extension(mask_format)
+
+        reused = None
+        if sequence is not None:
+            with timer.stage('signature'):
+                reused = sequence.lookup(image)
+
+        if precomputed is not None:
+            output_mask, optimal_threshold, hist = precomputed
+
+        elif reused is not None:
+            output_mask, optimal_threshold, hist = reused
+
+        elif imageType == 'BINARY':
+            # Convert image to numpy array
+            with timer.stage('grayscale'):
+                image_array = np.array(image)
+
+            # Binary thresholding, pixels above binThresh are white (255) and the rest black (0)
+            with timer.stage('threshold'):
+                output_mask = binarize(image_array, binThresh)
+
+        elif imageType == 'HYST':
+            from torchvision import transforms
+
+            with timer.stage('grayscale'):
+                # Convert the image to a PyTorch tensor
+                tiff = transforms.ToTensor()(image)
+
+                # Convert the RGB tensor to grayscale using torchvision's Grayscale transform
+                transform = transforms.Grayscale()
+                tiff_grey = transform(tiff)
+
+                #convert to numpy array and get rid of 0th channel dimension
+                tiff_grey_numpy = tiff_grey[0].numpy()
+
+            #--------------START HYSTERESIS THRESHOLDING--------------------------
+            with timer.stage('threshold'):
+                output_image = hysteresis_threshold(tiff_grey_numpy, low_threshold, high_threshold, connectivity=connectivity, legacy=legacy_hyst)
+            #--------------END HYSTERESIS THRESHOLDING--------------------------
+            output_mask = output_image
+
+        elif imageType == 'OTSU':
+            with timer.stage('grayscale'):
+                grey_array = otsu_grey_array(image, thermal_image=thermal_image == True)
+            with timer.stage('threshold'):
+                hist = otsu_histogram(grey_array)
+                optimal_threshold = otsu_threshold_from_histogram(hist)
+                if saveImage == True:
+                    output_mask = binarize(grey_array, optimal_threshold)
+
+        elif imageType == 'ADAPTIVE':
+            with timer.stage('grayscale'):
+                adaptive_array = otsu_grey_array(image, thermal_image=True) if thermal_image == True else np.array(image)
+            with timer.stage('threshold'):
+                output_mask = adaptive_mask(adaptive_array, window_size, adaptive_method, adaptive_k, adaptive_range, adaptive_floor)
+
+        if sequence is not None and reused is None:
+            sequence.store((output_mask, optimal_threshold, hist))
+
+        if output_mask is None:
+            return filename, optimal_threshold, hist, None, timer.timings, None
+        if mask_format == 'STACK':
+            with timer.stage('encode'):
+                packed = (pack_mask(output_mask), output_mask.shape)
+            return filename, optimal_threshold, hist, None, timer.timings, packed
+        if writer is not None:
+            # the encode and write stages are added to timer.timings by the writer thread
+            writer.submit((filename, optimal_threshold, hist, None, timer.timings, None), save_mask, output_mask, outputFolderName, mask_format, timer)
+            return None
+        # Save the binary image in the proper output folder
+        save_mask(output_mask, outputFolderName, mask_format, timer)
+    except Exception as e:
+        return filename, None, None, f'{type(e).__name__}: {e}', timer.timings, None
+
+    return filename, optimal_threshold, hist, None, timer.timings, None
+
+
+'''
+Open a file from input_folder and threshold it with _folder_convert_frame, this is the task run by
+each worker process of tiff_folder_convert. Returns (file_info, result) with the result of
+_folder_convert_frame, file_info (see read_hashed) is None unless hashed is True
+'''
+def _folder_convert_file(filename, input_folder, output_folder, imageType, hashed=False, **kwargs):
+    timer = StageTimer()
+    file_info = None
+    try:
+        input_path = os.path.join(input_folder, filename)
+        if hashed:
+            # hashed while read for the manifest, the file is read once
+            with timer.stage('read'):
+                data, file_info = read_hashed(input_path)
+            image = Image.open(io.BytesIO(data))
+        else:
+            image = Image.open(input_path)
+        with image:
+            with timer.stage('decode'):
+                image.load()
+            return file_info, _folder_convert_frame(filename, image, output_folder, imageType, timings=timer.timings, **kwargs)
+    except Exception as e:
+        return file_info, (filename, None, None, f'{type(e).__name__}: {e}', timer.timings, None)
+
+
 '''
 Convert entire TIFF folder into appropriate binary ground truth for segmentation based on one of the following methods:
 
 1.) Standard Binary Thresholding
 2.) Hysteresis
 3.) Otsu's Method 
+4.) Local Adaptive Thresholding (Sauvola / Niblack)
 
 Required Parameters
     -input_folder = string path to input image filename
     -output_folder = string path to output image filename
-    -imageType = can be 'BINARY', 'HYST', or 'OTSU' to specify which thresholding technique to use
+    -imageType = can be 'BINARY', 'HYST', 'OTSU' or 'ADAPTIVE' to specify which thresholding technique to use
 
 Optional Parameters
+    -workers = Number of processes used to convert files in parallel, default is 1 (sequential).
+               None uses every available core
+    -chunksize = Number of files sent to a worker process at a time, default is None which splits
+                 the folder into roughly 4 chunks per worker. Cannot be given with workers=1
+    -prefetch = Number of frames read ahead on a background thread when running sequentially,
+                default is 4. Cannot be changed with workers other than 1
+    -incremental = If True, a manifest (manifest.jsonl) is kept in output_folder and files whose
+                   input, method and parameters did not change since the last run are skipped,
+                   an interrupted run resumes where it stopped, default is False
+    -progress = callable receiving a progress event (dict) when the run starts, after every file
+                with its per-stage timings and at the end with a summary, default is None
+    -metrics_path = path of a JSON-lines file the same events are appended to, default is None
+                    (see MetricsUtils for the event format)
+    -mask_format = Storage format of the masks, 'TIFF' (8-bit uncompressed), 'TIFF_LZW', 'TIFF_DEFLATE',
+                   'TIFF_1BIT', 'TIFF_1BIT_DEFLATE' or 'STACK' which writes every mask and threshold of
+                   the folder bit-packed into output_folder/masks.stack (see MaskUtils), default is 'TIFF'.
+                   'STACK' cannot be combined with incremental
+    -writers = Number of background threads encoding and saving the masks when running sequentially,
+               so compression and disk writes overlap with thresholding the next frames, default is 1.
+               0 saves inline. Each file is reported (progress, manifest) once its mask is saved and
+               the Otsu csv is written by the same threads. Cannot be changed with workers other than 1
+    -sequence = If True, the frames are treated as a sequence: a frame identical to the last thresholded
+                frame reuses its mask (and Otsu threshold and histogram) instead of being thresholded
+                again, which skips the redundant frames of hovering segments (see SequenceCache).
+                Runs sequentially, cannot be combined with workers > 1, default is False
+    -sequence_tolerance = If above 0, near-duplicate frames are reused too: frames whose 32x32 block
+                          means differ from the last thresholded frame by at most this value (in
+                          degrees Celsius for TIFFs), default is 0 (exact duplicates only, the outputs
+                          are the same as without sequence). Cannot be given without sequence
+    -pyramid_folder = Pyramid folder of input_folder written by tiff_pyramid_images, 'BINARY' only.
+                      Frames whose cached maximum is not above binThresh get an empty mask without
+                      being read or decoded (see pyramid_triage), the masks are the same as without
+                      it. Frames without an up-to-date pyramid are thresholded as usual. Runs
+                      sequentially, cannot be combined with workers > 1, default is None
+
 Standard Binary Parameters:
     -binThresh = Default is 50 (in degrees Celsius) if not specified
     
 Hysteresis Parameters:
     -low_threshold = Default is 50 (in degrees Celsius) if not specified
     -high_threshold = Default is 150 (in degrees Celsius) if not specified
+    -connectivity = 4 or 8, connectivity used to grow edges from strong pixels, default is 8
+    -legacy_hyst = If True, reproduces the original 3x3 neighborhood check instead of connected
+                   component hysteresis, default is False
     
 Otsu Parameters:
-    -None
+    -None, besides the per-image thresholds and their mean, the threshold of the summed histogram of
+     all images is printed (see otsu_folder_threshold to get it without binarizing)
+
+Adaptive Parameters:
+    -window_size, adaptive_method, adaptive_k, adaptive_range, adaptive_floor, thermal_image = same as
+     in tiff_image_convert. Changing them with another imageType raises a ValueError
+
+Files that fail to convert do not stop the batch, they are reported at the end and returned as a
+list of (filename, error) pairs
 '''
-def tiff_folder_convert(input_folder, output_folder, imageType, thermal_image=None, low_threshold=50, high_threshold=150, binThresh=50, saveImage=True):
-    tiff_bin_image = None
-    tiff_grey_image = None
-    
-    if imageType == 'BINARY':
-        image_filenames = os.listdir(input_folder)
-        image_filenames.sort()
-        print(f'Grabbing images from: {input_folder}')
-        print(f'Saving images to: {output_folder}')
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-        idx = 1
-        for filename in image_filenames:
-            if filename.endswith(('.tiff', '.TIFF')):
-                with Image.open(os.path.join(input_folder, filename)) as image:
-                    # Convert image to numpy array
-                    image_array = np.array(image)
-
-                    #index through image pixels
-                    for i in range(image_array.shape[0]):  # Iterate over rows
-                        for j in range(image_array.shape[1]):  # Iterate over columns
-                            pixel = image_array[i, j]  
-                            # Binary thresholding
-                            if pixel > binThresh:
-                                image_array[i, j] = 255  # Set pixel to white (255)
-                            else:
-                                image_array[i, j] = 0  # Set pixel to black (0)
-
-                    tiff_bin_image = Image.fromarray(image_array.astype('uint8'))
-                    
-                    #remove .TIFF extension and grab just the filename 
-                    filename_no_ext = os.path.splitext(filename)[0]
-                    outputFolderName = os.path.join(output_folder, filename_no_ext) + '.TIFF'
-                    # Save the binary image in the proper output folder
-                    tiff_bin_image.save(outputFolderName)
-                
-            if idx == 1:
-                print(f'Number of Images Processed : {idx}')
-            if idx % 50 == 0:
-                print(f'Number of Images Processed : {idx}')
-            idx += 1
-    elif imageType == 'HYST':
-        image_filenames = os.listdir(input_folder)
-        image_filenames.sort()
-        print(f'Grabbing images from: {input_folder}')
-        print(f'Saving images to: {output_folder}')
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-        idx = 1
-        for filename in image_filenames:
-            if filename.endswith(('.tiff', '.TIFF')):
-                with Image.open(os.path.join(input_folder, filename)) as image:
-                    # Convert the image to a PyTorch tensor
-                    tiff = transforms.ToTensor()(image)
-
-                    # Convert the RGB tensor to grayscale using torchvision's Grayscale transform
-                    transform = transforms.Grayscale()
-                    tiff_grey = transform(tiff)
-
-                    #convert to numpy array and get rid of 0th channel dimension
-                    tiff_grey_numpy = tiff_grey[0].numpy()
-
-                    #--------------START HYSTERESIS THRESHOLDING--------------------------
-                    #print(f'Hysteresis Thresholds -> Low: {low_threshold}, High: {high_threshold}')
-                     # Smooth the image using Gaussian filter
-                    smoothed_image = gaussian_filter(tiff_grey_numpy, sigma=1)
-
-
-                    # Apply gradient calculation (Sobel operator)
-                    sobelx = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]])
-                    sobely = np.array([[-1, -2, -1], [0, 0, 0], [1, 2, 1]])
-
-
-                    gradient_x = convolve2d(smoothed_image, sobelx, mode='same')
-                    gradient_y = convolve2d(smoothed_image, sobely, mode='same')
-
-
-                    # Compute gradient magnitude and direction
-                    gradient_magnitude = np.sqrt(gradient_x ** 2 + gradient_y ** 2)
-                    gradient_direction = np.arctan2(gradient_y, gradient_x)
-
-                    # Initialize output image
-                    output_image = np.zeros_like(tiff_grey_numpy)
-
-                    # Apply hysteresis thresholding
-                    strong_edge = (gradient_magnitude > high_threshold)
-                    weak_edge = (gradient_magnitude >= low_threshold) & (gradient_magnitude <= high_threshold)
-
-                    output_image[strong_edge] = 255
-                    for i in range(1, output_image.shape[0]-1):
-                        for j in range(1, output_image.shape[1]-1):
-                            if weak_edge[i, j]:
-                                local_gradient = gradient_direction[i-1:i+2, j-1:j+2]
-                                local_magnitude = gradient_magnitude[i-1:i+2, j-1:j+2]
-                                adjacent_pixels = local_magnitude > low_threshold
-                                if np.any(adjacent_pixels):
-                                    output_image[i, j] = 255
-                    #--------------END HYSTERESIS THRESHOLDING--------------------------
-
-                    tiff_hyst_image = Image.fromarray(output_image.astype('uint8'))
-                    
-                    #remove .TIFF extension and grab just the filename 
-                    filename_no_ext = os.path.splitext(filename)[0]
-                    outputFolderName = os.path.join(output_folder, filename_no_ext) + '.TIFF'
-                    # Save the binary image in the proper output folder
-                    tiff_hyst_image.save(outputFolderName)
-                    #plt.imsave(outputFolderName, output_image, cmap='gray')
-                
-            if idx == 1:
-                print(f'Number of Images Processed : {idx}')
-            if idx % 50 == 0:
-                print(f'Number of Images Processed : {idx}')
-            idx += 1
-            
-    elif imageType == 'OTSU':
-        csv_data_save = []
-        optimal_list = []
-        image_filenames = os.listdir(input_folder)
-        image_filenames.sort()
-        print(f'Grabbing images from: {input_folder}')
-        print(f'Saving images to: {output_folder}')
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-        idx = 1
-        for filename in image_filenames:
-            if filename.lower().endswith(('.tiff', '.tif', '.jpg', '.jpeg')):
-                with Image.open(os.path.join(input_folder, filename)) as image:
-                    if thermal_image == True:
-                        tiff_otsu_image, optimal_threshold = otsu_threshold_thermal(os.path.join(input_folder, filename), plotHist=False, printThresh=False)
-                    else:
-                        tiff_otsu_image, optimal_threshold = otsu_threshold(os.path.join(input_folder,filename), plotHist=False, printThresh=False)
-                    
-                    
-                    # save optimal threshold and filename to csv 
-                    csv_data_save.append([filename, optimal_threshold])
-                    
-                    # save optimal threshold list for mean computation at end of function
-                    optimal_list.append(optimal_threshold)
-                    #remove .TIFF extension and grab just the filename 
-                    filename_no_ext = os.path.splitext(filename)[0]
-                    outputFolderName = os.path.join(output_folder, filename_no_ext) + '.TIFF'
-                    if saveImage == True:
-                        # Save the binary image in the proper output folder
-                        tiff_otsu_image.save(outputFolderName)
-                    #plt.imsave(outputFolderName, tiff_otsu_image, cmap='gray')  
-            if idx == 1:
-                print(f'Number of Images Processed : {idx}')
-            if idx % 50 == 0:
-                print(f'Number of Images Processed : {idx}')
-            idx += 1
+def tiff_folder_convert(input_folder, output_folder, imageType, thermal_image=None, low_threshold=50, high_threshold=150, binThresh=50, saveImage=True, connectivity=8, legacy_hyst=False, workers=1, chunksize=None, prefetch=4, incremental=False, progress=None, metrics_path=None, mask_format='TIFF', writers=1, window_size=31, adaptive_method='SAUVOLA', adaptive_k=0.2, adaptive_range=None, adaptive_floor=None, sequence=False, sequence_tolerance=0.0, pyramid_folder=None):
+    check_mask_format(mask_format, TIFF_MASK_FORMATS + ('STACK',))
+    if workers == 1 and chunksize is not None:
+        raise ValueError('chunksize splits the files between worker processes and cannot be combined with workers=1')
+    if workers != 1 and prefetch != 4:
+        raise ValueError('prefetch reads frames ahead when running sequentially and cannot be combined with workers other than 1')
+    if workers != 1 and writers != 1:
+        raise ValueError('writers save the masks when running sequentially, worker processes save their own, and cannot be combined with workers other than 1')
+    if incremental and mask_format == 'STACK':
+        raise ValueError("mask_format='STACK' rewrites the whole stack and cannot be combined with incremental")
+    if sequence and workers != 1:
+        raise ValueError('sequence compares every frame with the previous ones and cannot be combined with workers > 1')
+    if not sequence and sequence_tolerance != 0:
+        raise ValueError('sequence_tolerance only applies with sequence=True')
+    if pyramid_folder is not None:
+        if imageType != 'BINARY':
+            raise ValueError(f"pyramid_folder supports 'BINARY', not {imageType}")
+        if workers != 1:
+            raise ValueError('pyramid_folder rejects frames before reading them and cannot be combined with workers > 1')
+    if imageType == 'ADAPTIVE':
+        _check_adaptive(window_size, adaptive_method)
+    elif (window_size, adaptive_method, adaptive_k, adaptive_range, adaptive_floor) != (31, 'SAUVOLA', 0.2, None, None):
+        raise ValueError(f"window_size and adaptive_* only apply to 'ADAPTIVE', not {imageType}")
+    if imageType in ('BINARY', 'HYST') or (imageType == 'ADAPTIVE' and thermal_image != True):
+        pattern = ('*.tiff', '*.TIFF')
+        ignore_case = False
+    elif imageType in ('OTSU', 'ADAPTIVE'):
+        pattern = ('*.tiff', '*.tif', '*.jpg', '*.jpeg')
+        ignore_case = True
+    else:
+        print(f'Invalid imageType: {imageType}')
+        return None
+    image_filenames = list_frames(input_folder, pattern, ignore_case=ignore_case)
+
+    print(f'Grabbing images from: {input_folder}')
+    print(f'Saving images to: {output_folder}')
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    params = dict(thermal_image=thermal_image, low_threshold=low_threshold, high_threshold=high_threshold,
+                  binThresh=binThresh, saveImage=saveImage, connectivity=connectivity, legacy_hyst=legacy_hyst, mask_format=mask_format,
+                  window_size=window_size, adaptive_method=adaptive_method, adaptive_k=adaptive_k, adaptive_range=adaptive_range,
+                  adaptive_floor=adaptive_floor)
+    adaptive_params = dict(window_size=window_size, adaptive_method=adaptive_method, adaptive_k=adaptive_k,
+                           adaptive_range=adaptive_range, adaptive_floor=adaptive_floor, thermal_image=thermal_image)
+
+    # results of every file for the Otsu csv, filled from the manifest for skipped files
+    otsu_results = {}
+    todo_filenames = image_filenames
+    manifest_file = None
+    # size, mtime and hash of the inputs as they are read, for the manifest
+    file_infos = None
+    if incremental:
+        # only the parameters the output of this method depends on
+        manifest_params = {
+            'BINARY': dict(binThresh=binThresh),
+            'HYST': dict(low_threshold=low_threshold, high_threshold=high_threshold, connectivity=connectivity, legacy_hyst=legacy_hyst),
+            'OTSU': dict(thermal_image=thermal_image, saveImage=saveImage),
+            'ADAPTIVE': adaptive_params,
+        }[imageType]
+        if mask_format != 'TIFF':
+            # left out for 'TIFF' so manifests written before mask formats existed stay valid
+            manifest_params['mask_format'] = mask_format
+        if sequence and sequence_tolerance > 0:
+            # reused near-duplicate results differ from recomputed ones, exact duplicates do not
+            manifest_params['sequence_tolerance'] = sequence_tolerance
+        manifest = load_manifest(output_folder)
+        todo_filenames, skipped = manifest_filter(manifest, input_folder, image_filenames, imageType, manifest_params)
+        print(f'Skipping {len(skipped)} up-to-date images, converting {len(todo_filenames)}')
+        if imageType == 'OTSU':
+            for filename in skipped:
+                otsu_results[filename] = (manifest[filename]['result']['optimal_threshold'], np.array(manifest[filename]['result']['hist']))
+        manifest_file = open_manifest(output_folder)
+        file_infos = {}
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # masks are saved by the worker processes in parallel, by the writer threads sequentially
+    writer = FrameWriter(writers=writers)
+    if workers > 1 and len(todo_filenames) > 1:
+        if chunksize is None:
+            chunksize = max(1, len(todo_filenames) // (workers * 4))
+        convert_file = partial(_folder_convert_file, input_folder=input_folder, output_folder=output_folder, imageType=imageType,
+                               hashed=file_infos is not None, **params)
+        executor = ProcessPoolExecutor(max_workers=workers)
+        # map keeps the input (sorted) order so the csv rows are deterministic
+        worker_results = executor.map(convert_file, todo_filenames, chunksize=chunksize)
+
+        def convert_files():
+            for file_info, result in worker_results:
+                if file_infos is not None:
+                    file_infos[result[0]] = file_info
+                yield result
+        results = convert_files()
+    else:
+        executor = None
+        # frames without fire in their pyramid are never read, {filename: shape}
+        no_fire = {}
+        if pyramid_folder is not None:
+            pyramid_manifest = load_manifest(pyramid_folder)
+            _, no_fire_filenames, _ = pyramid_triage(input_folder, pyramid_folder, binThresh, filenames=todo_filenames)
+            no_fire = {filename: tuple(pyramid_manifest[filename]['result']['shape']) for filename in no_fire_filenames}
+            if file_infos is not None:
+                # these frames are never read, their pyramid entry was checked up to date with the input
+                for filename in no_fire:
+                    file_infos[filename] = {key: pyramid_manifest[filename][key] for key in ('size', 'mtime', 'hash')}
+            print(f'Rejected {len(no_fire)} of {len(todo_filenames)} images without fire from their pyramid')
+        # frames are decoded on a background thread while the current one is thresholded
+        frames = iter_frames(input_folder, prefetch=prefetch, as_array=False, return_errors=True, timed=True,
+                             filenames=[filename for filename in todo_filenames if filename not in no_fire], file_infos=file_infos)
+        sequence_cache = SequenceCache(tolerance=sequence_tolerance) if sequence else None
+
+        def convert_frames():
+            timed = timed_frames(frames)
+            for filename in todo_filenames:
+                if filename in no_fire:
+                    # the empty mask is still saved, in the sorted order of the frames
+                    empty_mask = np.zeros(no_fire[filename], dtype=np.uint8)
+                    yield _folder_convert_frame(filename, None, output_folder, imageType, timings={}, writer=writer, precomputed=(empty_mask, None, None), **params)
+                    continue
+                filename, image, timings = next(timed)
+                if isinstance(image, Exception):
+                    yield filename, None, None, f'{type(image).__name__}: {image}', timings, None
+                else:
+                    yield _folder_convert_frame(filename, image, output_folder, imageType, timings=timings, writer=writer, sequence=sequence_cache, **params)
+        results = convert_frames()
+
+    stack_writer = None
+    if mask_format == 'STACK' and (imageType != 'OTSU' or saveImage == True):
+        stack_params = {'BINARY': dict(binThresh=binThresh), 'OTSU': dict(thermal_image=thermal_image),
+                        'HYST': dict(low_threshold=low_threshold, high_threshold=high_threshold, connectivity=connectivity, legacy_hyst=legacy_hyst),
+                        'ADAPTIVE': adaptive_params}[imageType]
+        stack_writer = MaskStackWriter(os.path.join(output_folder, MASK_STACK_NAME), metadata=dict(method=imageType, params=stack_params))
+
+    failed_files = []
+    metrics = FolderMetrics('tiff_folder_convert', len(todo_filenames), progress=progress, metrics_path=metrics_path)
+    idx = 1
+
+    # bookkeeping of a file once its mask is saved (or failed)
+    def file_finished(filename, optimal_threshold, hist, error, timings, packed):
+        nonlocal idx
+        if error is None and stack_writer is not None:
+            # hysteresis and adaptive have no single threshold per frame, their parameters are in the stack metadata
+            stack_threshold = {'BINARY': binThresh, 'OTSU': optimal_threshold, 'HYST': None, 'ADAPTIVE': None}[imageType]
+            packed_mask, mask_shape = packed
+            timer = StageTimer(timings)
+            try:
+                with timer.stage('write'):
+                    stack_writer.append(filename, packed_mask, threshold=stack_threshold, shape=mask_shape)
+            except ValueError as e:
+                # a frame of a different size cannot go into the stack
+                error = f'{type(e).__name__}: {e}'
+            timings = timer.timings
+        metrics.file_done(filename, timings, error)
+        if error is not None:
+            print(f'Failed to convert {filename}: {error}')
+            failed_files.append((filename, error))
+        else:
+            if imageType == 'OTSU':
+                otsu_results[filename] = (optimal_threshold, hist)
+            if manifest_file is not None:
+                output_path = None
+                if imageType != 'OTSU' or saveImage == True:
+                    output_path = os.path.join(output_folder, os.path.splitext(filename)[0]) + mask_extension(mask_format)
+                result = None
+                if imageType == 'OTSU':
+                    result = dict(optimal_threshold=int(optimal_threshold), hist=hist.tolist())
+                entry = manifest_entry(input_folder, filename, file_infos.pop(filename), imageType, manifest_params, output_path, result=result)
+                write_manifest_entry(manifest_file, entry)
+                manifest[filename] = entry
+
+        if idx == 1:
+            print(f'Number of Images Processed : {idx}')
+        if idx % 50 == 0:
+            print(f'Number of Images Processed : {idx}')
+        idx += 1
+
+    def writes_finished(finished):
+        for result, _, write_error in finished:
+            if write_error is not None:
+                result = result[:3] + (f'{type(write_error).__name__}: {write_error}',) + result[4:]
+            file_finished(*result)
+
+    try:
+        try:
+            for result in results:
+                # None when the mask is still being saved by the writer
+                if result is not None:
+                    file_finished(*result)
+                writes_finished(writer.completed())
+            if stack_writer is not None:
+                print(f'{len(stack_writer.filenames)} masks written to {stack_writer.close()}')
+        finally:
+            # waits for the masks still being written, also when the loop ended early, so the
+            # metrics and the manifest cover every saved file
+            writes_finished(writer.flush())
+            metrics.close()
+            if stack_writer is not None:
+                # discards the partial stack if the loop ended early
+                stack_writer.abort()
+            if executor is not None:
+                executor.shutdown()
+            else:
+                # stops the background reader if the loop ended early
+                frames.close()
+            if manifest_file is not None:
+                manifest_file.close()
+                compact_manifest(output_folder, {f: manifest[f] for f in image_filenames if f in manifest})
+
+        if imageType == 'OTSU':
+            # Write data to CSV on the writer
+            csv_path = os.path.join(output_folder, 'optimal_thresholds.csv')
+            writer.submit(csv_path, _write_otsu_csv, csv_path, _otsu_csv_rows(image_filenames, otsu_results))
+    finally:
+        write_results = writer.close()
+    # only the csv is left on the writer, a failed write is raised
+    for csv_path, _, write_error in write_results:
+        if write_error is not None:
+            raise write_error
+        print(f'Data written to {csv_path}.')
+
+    if sequence:
+        print(f'Reused the results of {sequence_cache.reused} of {len(todo_filenames)} images')
+    if failed_files:
+        print(f'{len(failed_files)} of {len(todo_filenames)} images failed to convert')
+    return failed_files
+
+
+# parameters of a tiff_multi_convert spec and their defaults, the same as in tiff_folder_convert
+_SPEC_DEFAULTS = {
+    'BINARY': dict(binThresh=50),
+    'HYST': dict(low_threshold=50, high_threshold=150, connectivity=8, legacy_hyst=False),
+    'OTSU': dict(thermal_image=None, saveImage=True),
+    'ADAPTIVE': dict(window_size=31, adaptive_method='SAUVOLA', adaptive_k=0.2, adaptive_range=None, adaptive_floor=None, thermal_image=None),
+}
+
+
+def _check_adaptive(window_size, adaptive_method):
+    # checked once per run instead of failing every frame
+    if adaptive_method not in ADAPTIVE_METHODS:
+        raise ValueError(f'Invalid adaptive_method: {adaptive_method}, expected one of {", ".join(ADAPTIVE_METHODS)}')
+    if window_size < 1 or window_size % 2 == 0:
+        raise ValueError(f'window_size must be a positive odd number, got {window_size}')
+
+
+def _normalize_spec(spec):
+    # validated copy of a spec with every parameter of its method filled in
+    spec = dict(spec)
+    imageType = spec.pop('imageType', None)
+    if imageType not in _SPEC_DEFAULTS:
+        raise ValueError(f'Invalid imageType in spec {spec}: {imageType}')
+    if 'output_folder' not in spec:
+        raise ValueError(f'Spec {spec} has no output_folder')
+    normalized = dict(imageType=imageType, output_folder=spec.pop('output_folder'), mask_format=spec.pop('mask_format', 'TIFF'))
+    check_mask_format(normalized['mask_format'], TIFF_MASK_FORMATS + ('STACK',))
+    for name, default in _SPEC_DEFAULTS[imageType].items():
+        normalized[name] = spec.pop(name, default)
+    if spec:
+        raise ValueError(f'Unknown parameters for {imageType}: {", ".join(spec)}')
+    if imageType == 'ADAPTIVE':
+        _check_adaptive(normalized['window_size'], normalized['adaptive_method'])
+    return normalized
+
+
+'''
+Threshold one frame with every spec of tiff_multi_convert. The representations the methods work on
+are computed at most once per frame and shared: the raw array (BINARY and ADAPTIVE), the grayscale
+array (HYST and OTSU), the thermal grayscale array (OTSU and ADAPTIVE with thermal_image), the
+gradient magnitude (every HYST pair) and the local mean and standard deviation (every ADAPTIVE spec
+with the same window_size).
+
+Returns (filename, spec_results, timings) where spec_results holds (optimal_threshold, hist, error,
+packed) per spec, like the results of _folder_convert_frame. If a FrameWriter is given, the masks
+are saved by one writer job and None is returned, the result tuple is then the key of the job.
+'''
+def _multi_convert_frame(filename, image, specs, timings=None, writer=None):
+    timer = StageTimer(timings)
+    shared = {}
+
+    def representation(name, compute):
+        if name not in shared:
+            with timer.stage('grayscale'):
+                shared[name] = compute()
+        return shared[name]
+
+    spec_results = []
+    saves = []
+    filename_no_ext = os.path.splitext(filename)[0]
+    for spec_idx, spec in enumerate(specs):
+        optimal_threshold = None
+        hist = None
+        packed = None
+        try:
+            output_mask = None
+            if spec['imageType'] == 'BINARY':
+                image_array = representation('array', lambda: np.array(image))
+                with timer.stage('threshold'):
+                    output_mask = binarize(image_array, spec['binThresh'])
+
+            elif spec['imageType'] == 'HYST':
+                grey_array = representation('grey', lambda: otsu_grey_array(image))
+                magnitude = representation('magnitude', lambda: gradient_magnitude(grey_array))
+                with timer.stage('threshold'):
+                    output_mask = hysteresis_mask(magnitude, spec['low_threshold'], spec['high_threshold'], connectivity=spec['connectivity'], legacy=spec['legacy_hyst'])
+
+            elif spec['imageType'] == 'OTSU':
+                if spec['thermal_image'] == True:
+                    grey_name, hist_name = 'thermal_grey', 'thermal_hist'
+                    grey_array = representation(grey_name, lambda: otsu_grey_array(image, thermal_image=True))
+                else:
+                    grey_name, hist_name = 'grey', 'hist'
+                    grey_array = representation(grey_name, lambda: otsu_grey_array(image))
+                with timer.stage('threshold'):
+                    # the histogram only depends on the grayscale array, Otsu specs share it
+                    if hist_name not in shared:
+                        shared[hist_name] = otsu_histogram(grey_array)
+                    hist = shared[hist_name]
+                    optimal_threshold = otsu_threshold_from_histogram(hist)
+                    if spec['saveImage'] == True:
+                        output_mask = binarize(grey_array, optimal_threshold)
+
+            elif spec['imageType'] == 'ADAPTIVE':
+                if spec['thermal_image'] == True:
+                    array_name = 'thermal_grey'
+                    adaptive_array = representation(array_name, lambda: otsu_grey_array(image, thermal_image=True))
+                else:
+                    array_name = 'array'
+                    adaptive_array = representation(array_name, lambda: np.array(image))
+                with timer.stage('threshold'):
+                    stats_name = (array_name, 'local_stats', spec['window_size'])
+                    if stats_name not in shared:
+                        shared[stats_name] = local_mean_std(adaptive_array, spec['window_size'])
+                    output_mask = adaptive_mask(adaptive_array, spec['window_size'], spec['adaptive_method'], spec['adaptive_k'],
+                                                spec['adaptive_range'], spec['adaptive_floor'], local_stats=shared[stats_name])
+
+            if output_mask is not None:
+                if spec['mask_format'] == 'STACK':
+                    with timer.stage('encode'):
+                        packed = (pack_mask(output_mask), output_mask.shape)
+                else:
+                    output_path = os.path.join(spec['output_folder'], filename_no_ext) + mask_extension(spec['mask_format'])
+                    saves.append((spec_idx, output_mask, output_path, spec['mask_format']))
+            spec_results.append((optimal_threshold, hist, None, packed))
+        except Exception as e:
+            spec_results.append((None, None, f'{type(e).__name__}: {e}', None))
+
+    if writer is not None and saves:
+        writer.submit((filename, spec_results, timer.timings), _save_spec_masks, saves, spec_results, timer)
+        return None
+    _save_spec_masks(saves, spec_results, timer)
+    return filename, spec_results, timer.timings
+
+
+def _save_spec_masks(saves, spec_results, timer):
+    # saves the masks of one frame, a failed save is recorded as the error of its spec
+    for spec_idx, output_mask, output_path, mask_format in saves:
+        try:
+            save_mask(output_mask, output_path, mask_format, timer)
+        except Exception as e:
+            spec_results[spec_idx] = spec_results[spec_idx][:2] + (f'{type(e).__name__}: {e}',) + spec_results[spec_idx][3:]
+
+
+def _multi_convert_file(filename, input_folder, specs):
+    # task run by each worker process of tiff_multi_convert
+    timer = StageTimer()
+    try:
+        with Image.open(os.path.join(input_folder, filename)) as image:
+            with timer.stage('decode'):
+                image.load()
+            return _multi_convert_frame(filename, image, specs, timings=timer.timings)
+    except Exception as e:
+        return filename, [(None, None, f'{type(e).__name__}: {e}', None)] * len(specs), timer.timings
+
+
+'''
+Fused version of tiff_folder_convert: produces the ground truth of several methods in one pass over
+a folder. Every frame is read and decoded once, the representations the methods work on (raw array,
+grayscale array, gradient magnitude, Otsu histogram, local statistics) are computed once per frame and shared by every
+spec that needs them, and each spec writes to its own output folder exactly what tiff_folder_convert
+would have written with the same parameters (masks, masks.stack, optimal_thresholds.csv).
+
+    tiff_multi_convert('./data/Images_Wilamette/TIFF', [
+        dict(imageType='BINARY', output_folder='./output_folders/Wilamette_BINARY_30', binThresh=30),
+        dict(imageType='BINARY', output_folder='./output_folders/Wilamette_BINARY_50', binThresh=50),
+        dict(imageType='HYST', output_folder='./output_folders/Wilamette_HYST', low_threshold=30, high_threshold=90),
+        dict(imageType='OTSU', output_folder='./output_folders/Wilamette_OTSU'),
+    ])
+
+Required Parameters
+    -input_folder = string path to the folder of TIFF images
+    -specs = list of dicts, one per output, each with 'imageType' ('BINARY', 'HYST', 'OTSU' or
+             'ADAPTIVE'), 'output_folder', optionally 'mask_format' and the parameters of the method,
+             named and defaulted like in tiff_folder_convert (binThresh / low_threshold, high_threshold,
+             connectivity, legacy_hyst / thermal_image, saveImage / window_size, adaptive_method,
+             adaptive_k, adaptive_range, adaptive_floor, thermal_image)
+
+Optional Parameters
+    -workers, chunksize, prefetch, writers, progress, metrics_path = same as in tiff_folder_convert.
+     With writers, all masks of a frame are saved by one writer job
+
+Returns a list with the failed (filename, error) pairs of every spec, in the order of specs
+'''
+def tiff_multi_convert(input_folder, specs, workers=1, chunksize=None, prefetch=4, writers=1, progress=None, metrics_path=None):
+    specs = [_normalize_spec(spec) for spec in specs]
+    output_folders = [spec['output_folder'] for spec in specs]
+    if len(set(output_folders)) != len(output_folders):
+        raise ValueError('Every spec needs its own output_folder')
+
+    if all(spec['imageType'] == 'OTSU' for spec in specs):
+        image_filenames = list_frames(input_folder, ('*.tiff', '*.tif', '*.jpg', '*.jpeg'), ignore_case=True)
+    else:
+        image_filenames = list_frames(input_folder, ('*.tiff', '*.TIFF'))
+
+    print(f'Grabbing images from: {input_folder}')
+    for spec in specs:
+        print(f'Saving {spec["imageType"]} images to: {spec["output_folder"]}')
+        if not os.path.exists(spec['output_folder']):
+            os.makedirs(spec['output_folder'])
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    writer = FrameWriter(writers=writers)
+    if workers > 1 and len(image_filenames) > 1:
+        if chunksize is None:
+            chunksize = max(1, len(image_filenames) // (workers * 4))
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(partial(_multi_convert_file, input_folder=input_folder, specs=specs), image_filenames, chunksize=chunksize)
+    else:
+        executor = None
+        frames = iter_frames(input_folder, prefetch=prefetch, as_array=False, return_errors=True, filenames=image_filenames, timed=True)
+
+        def convert_frames():
+            for filename, image, timings in timed_frames(frames):
+                if isinstance(image, Exception):
+                    yield filename, [(None, None, f'{type(image).__name__}: {image}', None)] * len(specs), timings
+                else:
+                    yield _multi_convert_frame(filename, image, specs, timings=timings, writer=writer)
+        results = convert_frames()
+
+    stack_writers = {}
+    for spec_idx, spec in enumerate(specs):
+        if spec['mask_format'] == 'STACK' and (spec['imageType'] != 'OTSU' or spec['saveImage'] == True):
+            stack_params = {name: spec[name] for name in _SPEC_DEFAULTS[spec['imageType']] if name != 'saveImage'}
+            stack_writers[spec_idx] = MaskStackWriter(os.path.join(spec['output_folder'], MASK_STACK_NAME), metadata=dict(method=spec['imageType'], params=stack_params))
+
+    failed_files = [[] for _ in specs]
+    otsu_results = [{} for _ in specs]
+    metrics = FolderMetrics('tiff_multi_convert', len(image_filenames), progress=progress, metrics_path=metrics_path)
+    idx = 1
+
+    # bookkeeping of a frame once all its masks are saved
+    def file_finished(filename, spec_results, timings):
+        nonlocal idx
+        timer = StageTimer(timings)
+        errors = []
+        for spec_idx, (optimal_threshold, hist, error, packed) in enumerate(spec_results):
+            spec = specs[spec_idx]
+            if error is None and spec_idx in stack_writers:
+                # hysteresis and adaptive have no single threshold per frame, their parameters are in the stack metadata
+                stack_threshold = spec['binThresh'] if spec['imageType'] == 'BINARY' else optimal_threshold
+                try:
+                    with timer.stage('write'):
+                        stack_writers[spec_idx].append(filename, packed[0], threshold=stack_threshold, shape=packed[1])
+                except ValueError as e:
+                    error = f'{type(e).__name__}: {e}'
+            if error is not None:
+                print(f'Failed to convert {filename} to {spec["output_folder"]}: {error}')
+                failed_files[spec_idx].append((filename, error))
+                errors.append(error)
+            elif spec['imageType'] == 'OTSU':
+                otsu_results[spec_idx][filename] = (optimal_threshold, hist)
+        metrics.file_done(filename, timer.timings, '; '.join(errors) if errors else None)
+
+        if idx == 1:
+            print(f'Number of Images Processed : {idx}')
+        if idx % 50 == 0:
+            print(f'Number of Images Processed : {idx}')
+        idx += 1
+
+    def writes_finished(finished):
+        for result, _, write_error in finished:
+            # _save_spec_masks records its errors in the result, anything else fails the whole frame
+            if write_error is not None:
+                result = (result[0], [(None, None, f'{type(write_error).__name__}: {write_error}', None)] * len(specs), result[2])
+            file_finished(*result)
+
+    try:
+        try:
+            for result in results:
+                # None when the masks are still being saved by the writer
+                if result is not None:
+                    file_finished(*result)
+                writes_finished(writer.completed())
+            # frames still being saved can hold masks for the stacks
+            writes_finished(writer.flush())
+            for stack_writer in stack_writers.values():
+                print(f'{len(stack_writer.filenames)} masks written to {stack_writer.close()}')
+        finally:
+            writes_finished(writer.flush())
+            metrics.close()
+            # discards partial stacks if the loop ended early
+            for stack_writer in stack_writers.values():
+                stack_writer.abort()
+            if executor is not None:
+                executor.shutdown()
+            else:
+                # stops the background reader if the loop ended early
+                frames.close()
+
+        for spec_idx, spec in enumerate(specs):
+            if spec['imageType'] == 'OTSU':
+                csv_path = os.path.join(spec['output_folder'], 'optimal_thresholds.csv')
+                writer.submit(csv_path, _write_otsu_csv, csv_path, _otsu_csv_rows(image_filenames, otsu_results[spec_idx]))
+    finally:
+        write_results = writer.close()
+    # only the csv files are left on the writer, a failed write is raised
+    for csv_path, _, write_error in write_results:
+        if write_error is not None:
+            raise write_error
+        print(f'Data written to {csv_path}.')
+
+    for spec, failed in zip(specs, failed_files):
+        if failed:
+            print(f'{len(failed)} of {len(image_filenames)} images failed to convert to {spec["output_folder"]}')
+    return failed_files
+
+
+'''
+Rows of the Otsu csv in filename order, printing the mean of the per-image thresholds and the
+threshold of the summed histogram. otsu_results maps filename -> (optimal_threshold, hist)
+'''
+def _otsu_csv_rows(image_filenames, otsu_results):
+    csv_data_save = []
+    optimal_list = []
+    dataset_hist = np.zeros(256, dtype=np.int64)
+    for filename in image_filenames:
+        if filename in otsu_results:
+            optimal_threshold, hist = otsu_results[filename]
+            # save optimal threshold and filename to csv 
+            csv_data_save.append([filename, optimal_threshold])
+            # save optimal threshold list for mean computation at end of function
+            optimal_list.append(optimal_threshold)
+            # sum the histograms for the dataset-level threshold
+            dataset_hist += hist
+
+    if optimal_list:
         mean_optimal = sum(optimal_list) / len(optimal_list)
         print(f'Mean Optimal Threshold = {mean_optimal}')
-        
-        # Write data to CSV
-        with open(f'./{output_folder}/optimal_thresholds.csv', mode='w', newline='') as file:
-            writer = csv.writer(file)
-            # Write the header
-            writer.writerow(['Filename', 'Optimal Threshold'])
-            # Write all the rows
-            writer.writerows(csv_data_save)
+        print(f'Dataset Optimal Threshold = {otsu_threshold_from_histogram(dataset_hist)}')
+    return csv_data_save
 
-        print(f'Data written to ./{output_folder}/optimal_thresholds.csv.')
-    return None
 
+def _write_otsu_csv(csv_path, csv_data_save):
+    with open(csv_path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        # Write the header
+        writer.writerow(['Filename', 'Optimal Threshold'])
+        # Write all the rows
+        writer.writerows(csv_data_save)
@@ -0,0 +1,233 @@
+import os
+import tempfile
+import numpy as np
+from utils.BinarizeUtils import binarize
+from utils.OtsuUtils import otsu_histogram, otsu_threshold_from_histogram
+from utils.HysteresisUtils import gradient_magnitude
+from utils.PyramidUtils import load_pyramid, coarse_to_fine_mask
+
+'''
+Open a single band TIFF as an array-like object without loading it into memory.
+
+Uncompressed TIFFs are memory-mapped with tifffile. Compressed or tiled TIFFs cannot be
+memory-mapped, they are read tile by tile through a zarr store when zarr is installed.
+
+Required Parameters
+    -input_image_path = string path to the TIFF file
+'''
+def open_tiff_array(input_image_path):
+    import tifffile
+
+    try:
+        image_array = tifffile.memmap(input_image_path, mode='r')
+    except ValueError:
+        try:
+            import zarr
+        except ImportError:
+            raise ValueError(f'{input_image_path} is compressed or tiled and cannot be memory-mapped, '
+                             'install zarr to read it tile by tile') from None
+        image_array = zarr.open(tifffile.imread(input_image_path, aszarr=True), mode='r')
+
+    if len(image_array.shape) != 2:
+        raise ValueError(f'{input_image_path} must be a single band image, got shape {image_array.shape}')
+    return image_array
+
+
+'''
+Yield (y0, y1, x0, x1) bounds of the tiles covering a height x width image in row-major order
+'''
+def tile_grid(height, width, tile_size):
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            yield y0, min(y0 + tile_size, height), x0, min(x0 + tile_size, width)
+
+
+'''
+Convert a large TIFF (e.g. a stitched orthomosaic) into a binary ground truth tile by tile, so
+peak memory is bounded by the tile size instead of the image size.
+
+The input is memory-mapped (see open_tiff_array) and the output is written as a tiled, compressed
+uint8 TIFF with values 0/255, or as a 1-bit TIFF with bilevel=True.
+
+1.) Standard Binary Thresholding : one pass over the tiles. With the min/max pyramid of the
+                                   input (see PyramidUtils), only the cells on the mask boundary
+                                   are read, the rest is decided from the pyramid
+2.) Hysteresis : Gaussian/Sobel are computed on tiles with a halo overlap so the gradient is
+                 exact at the seams. Connected regions are labeled per tile into a temporary
+                 memory-mapped label file and merged across seams, so the result matches
+                 hysteresis on the whole image
+3.) Otsu's Method : a histogram pass over the tiles to find the threshold, then an apply pass.
+                    The threshold is computed on the raw TIFF values (degrees Celsius)
+
+Required Parameters
+    -input_image_path = string path to input TIFF
+    -output_image_path = string path to output TIFF
+    -imageType = can be 'BINARY', 'HYST', or 'OTSU'
+
+Optional Parameters
+    -tile_size = Tile height and width in pixels, must be a multiple of 16, default is 1024
+    -binThresh = Threshold for 'BINARY', default is 50 (in degrees Celsius)
+    -low_threshold = Low threshold for 'HYST', default is 50
+    -high_threshold = High threshold for 'HYST', default is 150
+    -sigma = Gaussian sigma for 'HYST', default is 1
+    -connectivity = 4 or 8 connectivity for 'HYST', default is 8
+    -compression = Compression of the output TIFF (e.g. 'zlib', 'lzw' or None), default is 'zlib'
+    -bilevel = If True, the output is a 1-bit TIFF (8 pixels per byte before compression, read back
+               as 0/255 by MaskUtils.load_mask), default is False
+    -printThresh = If True, prints the Otsu threshold, default is True
+    -pyramid = MinMaxPyramid of the input or path of one saved with MinMaxPyramid.save, for 'BINARY',
+               default is None which reads every tile. Its block_size must divide tile_size
+
+Returns the threshold used for 'BINARY' and 'OTSU', None for 'HYST' and -1 for an invalid imageType
+'''
+def tiff_tiled_convert(input_image_path, output_image_path, imageType, tile_size=1024, binThresh=50, low_threshold=50, high_threshold=150, sigma=1, connectivity=8, compression='zlib', printThresh=True, bilevel=False, pyramid=None):
+    import tifffile
+
+    if tile_size % 16 != 0:
+        raise ValueError(f'tile_size must be a multiple of 16, got {tile_size}')
+    if imageType not in ('BINARY', 'HYST', 'OTSU'):
+        return -1
+
+    image_array = open_tiff_array(input_image_path)
+    height, width = image_array.shape
+    tiles = list(tile_grid(height, width, tile_size))
+    print(f'Processing {input_image_path} ({height}x{width}) in {len(tiles)} tiles of {tile_size}x{tile_size}')
+
+    threshold = None
+    label_dir = None
+    labels = None
+    if imageType == 'BINARY' and pyramid is not None:
+        threshold = binThresh
+        if isinstance(pyramid, str):
+            pyramid = load_pyramid(pyramid)
+        if tile_size % pyramid.block_size != 0:
+            raise ValueError(f'The pyramid block_size {pyramid.block_size} must divide tile_size {tile_size}')
+        # the cells decided at once, the largest pyramid cells up to 64 pixels that tile the tiles
+        cell_size = pyramid.block_size
+        while cell_size < 64 and tile_size % (cell_size * 2) == 0:
+            cell_size *= 2
+        output_tiles = (coarse_to_fine_mask(image_array, threshold, pyramid, cell_size, window=tile) for tile in tiles)
+
+    elif imageType == 'BINARY':
+        threshold = binThresh
+        output_tiles = (binarize(np.asarray(image_array[y0:y1, x0:x1]), threshold) for y0, y1, x0, x1 in tiles)
+
+    elif imageType == 'OTSU':
+        # Histogram pass
+        hist = np.zeros(256, dtype=np.int64)
+        for y0, y1, x0, x1 in tiles:
+            hist += otsu_histogram(np.asarray(image_array[y0:y1, x0:x1]))
+        threshold = otsu_threshold_from_histogram(hist)
+        if printThresh:
+            print(f'Optimal Threshold Found = {threshold}')
+        # Apply pass
+        output_tiles = (binarize(np.asarray(image_array[y0:y1, x0:x1]), threshold) for y0, y1, x0, x1 in tiles)
+
+    elif imageType == 'HYST':
+        label_dir = tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_image_path)))
+        labels, keep_label = _tiled_hysteresis_labels(image_array, tiles, label_dir.name, low_threshold, high_threshold, sigma, connectivity)
+        output_tiles = (keep_label[labels[y0:y1, x0:x1]].astype(np.uint8) * np.uint8(255) for y0, y1, x0, x1 in tiles)
+
+    dtype = np.uint8
+    if bilevel:
+        dtype = bool
+        output_tiles = (tile > 0 for tile in output_tiles)
+    try:
+        tifffile.imwrite(output_image_path, output_tiles, shape=(height, width), dtype=dtype,
+                         tile=(tile_size, tile_size), compression=compression, photometric='minisblack')
+    finally:
+        # release the label memmap before its temporary folder is removed
+        output_tiles = labels = None
+        if label_dir is not None:
+            label_dir.cleanup()
+    print(f'Image Saved in {output_image_path}')
+    return threshold
+
+
+'''
+First pass of tiled hysteresis. Labels the weak and strong pixels of every tile into a memory-mapped
+label file with globally unique ids, records which labels hold a strong pixel and which labels touch
+across tile seams, then merges the touching labels.
+
+Returns (labels, keep_label) where labels is the memory-mapped label image and keep_label[label] is
+True for labels connected to a strong pixel
+'''
+def _tiled_hysteresis_labels(image_array, tiles, label_dir, low_threshold, high_threshold, sigma, connectivity):
+    from scipy.ndimage import label
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    if connectivity == 8:
+        structure = np.ones((3, 3), dtype=bool)
+        offsets = (-1, 0, 1)
+    elif connectivity == 4:
+        structure = np.array([[0, 1, 0], [1, 1, 1], [0, 1, 0]], dtype=bool)
+        offsets = (0,)
+    else:
+        raise ValueError(f'connectivity must be 4 or 8, got {connectivity}')
+
+    height, width = image_array.shape
+    # Gaussian radius (scipy truncates at 4 sigma) plus one pixel for the Sobel operator
+    halo = int(4 * sigma + 0.5) + 1
+
+    labels = np.memmap(os.path.join(label_dir, 'labels.dat'), dtype=np.int32, mode='w+', shape=(height, width))
+    has_strong = [np.zeros(1, dtype=bool)]
+    seam_a = []
+    seam_b = []
+    num_labels = 0
+
+    for y0, y1, x0, x1 in tiles:
+        wy0, wy1 = max(0, y0 - halo), min(height, y1 + halo)
+        wx0, wx1 = max(0, x0 - halo), min(width, x1 + halo)
+        magnitude = gradient_magnitude(np.asarray(image_array[wy0:wy1, wx0:wx1]), sigma=sigma)
+        magnitude = magnitude[y0 - wy0:y1 - wy0, x0 - wx0:x1 - wx0]
+
+        strong_edge = magnitude > high_threshold
+        tile_labels, num_tile_labels = label(magnitude >= low_threshold, structure=structure)
+        if num_labels + num_tile_labels > np.iinfo(np.int32).max:
+            raise ValueError('Too many hysteresis regions for tiled mode, use a larger low_threshold')
+        tile_labels[tile_labels > 0] += num_labels
+        has_strong.append(np.bincount(tile_labels[strong_edge] - num_labels, minlength=num_tile_labels + 1)[1:] > 0)
+        num_labels += num_tile_labels
+        labels[y0:y1, x0:x1] = tile_labels
+
+        # Seams with the tiles already labeled (left and above, including the diagonals). The
+        # neighbors not labeled yet are still 0 and get paired when their own tile is processed
+        rows = np.arange(y0, y1)
+        cols = np.arange(x0, x1)
+        if x0 > 0:
+            ny0, ny1 = max(0, y0 - 1), min(height, y1 + 1)
+            neighbor = np.asarray(labels[ny0:ny1, x0 - 1])
+            for offset in offsets:
+                idx = rows + offset - ny0
+                valid = (idx >= 0) & (idx < len(neighbor))
+                seam_a.append(tile_labels[valid, 0])
+                seam_b.append(neighbor[idx[valid]])
+        if y0 > 0:
+            nx0, nx1 = max(0, x0 - 1), min(width, x1 + 1)
+            neighbor = np.asarray(labels[y0 - 1, nx0:nx1])
+            for offset in offsets:
+                idx = cols + offset - nx0
+                valid = (idx >= 0) & (idx < len(neighbor))
+                seam_a.append(tile_labels[0, valid])
+                seam_b.append(neighbor[idx[valid]])
+    labels.flush()
+
+    has_strong = np.concatenate(has_strong)
+    if seam_a:
+        seam_a = np.concatenate(seam_a)
+        seam_b = np.concatenate(seam_b)
+        touching = (seam_a > 0) & (seam_b > 0)
+        seam_a = seam_a[touching]
+        seam_b = seam_b[touching]
+    else:
+        seam_a = seam_b = np.zeros(0, dtype=np.int32)
+
+    # Merge labels touching across seams into regions, a region is kept if any of its labels is strong
+    graph = coo_matrix((np.ones(len(seam_a), dtype=bool), (seam_a, seam_b)), shape=(num_labels + 1, num_labels + 1))
+    num_regions, region = connected_components(graph, directed=False)
+    strong_regions = np.zeros(num_regions, dtype=bool)
+    strong_regions[region[has_strong]] = True
+    keep_label = strong_regions[region]
+    keep_label[0] = False
+    return labels, keep_label